@@ -0,0 +1,135 @@
+#Tommaso Mingrone [SM3201286]
+
+import copy
+
+from expr import (
+    Expression, Operation, BinaryOp, UnaryOp, Valloc, Setq, Setv,
+    Prog2, Prog3, Prog4, ProgN, If, While, For, DefSub, Print, CachedValue,
+)
+
+
+# Attributi che possono contenere i figli di ciascuna classe di nodo, nell'ordine in cui sono dichiarati.
+# Operation e ProgN tengono i figli in una lista (args ed exprs)
+CHILD_FIELDS = {
+    Valloc: ("size_expr",),
+    Setq: ("expr",),
+    Setv: ("expr", "index"),
+    Prog2: ("expr1", "expr2"),
+    Prog3: ("expr1", "expr2", "expr3"),
+    Prog4: ("expr1", "expr2", "expr3", "expr4"),
+    If: ("if_no", "if_yes", "cond"),
+    While: ("expr", "cond"),
+    For: ("expr", "end", "start"),
+    DefSub: ("expr",),
+    Print: ("expr",),
+    CachedValue: ("expr",),
+}
+
+
+def child_fields(node):
+    # Restituisce gli attributi figli di un nodo, risalendo la MRO della sua classe
+    for klass in type(node).__mro__:
+        fields = CHILD_FIELDS.get(klass)
+        if fields is not None:
+            return fields
+    return ()
+
+
+def children(node):
+    """
+    Restituisce i figli di un nodo che sono a loro volta espressioni.
+    I nomi di variabile (stringhe) e i valori costanti non sono considerati figli.
+
+    Args:
+        node (Expression): Il nodo da esaminare.
+    Return:
+        list: I nodi figli, nell'ordine degli attributi.
+    """
+    if isinstance(node, Operation):
+        values = node.args
+    elif isinstance(node, ProgN):
+        values = node.exprs
+    else:
+        values = [getattr(node, field) for field in child_fields(node)]
+    return [value for value in values if isinstance(value, Expression)]
+
+
+def iter_nodes(root):
+    # Visita in profondità (senza ricorsione) di tutti i nodi distinti raggiungibili dalla radice
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        stack.extend(reversed(children(node)))
+
+
+def iter_postorder(root):
+    # Visita in post-ordine (senza ricorsione) dei nodi distinti: ogni nodo segue tutti i suoi figli
+    seen = set()
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            yield node
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(children(node)) if id(child) not in seen)
+
+
+def count_nodes(root):
+    # Numero di nodi distinti dell'albero (o del DAG) con radice root
+    return sum(1 for _ in iter_nodes(root))
+
+
+def rebuild(node, fn):
+    """
+    Crea una copia superficiale del nodo in cui ogni figlio è sostituito da fn(figlio).
+    Se nessun figlio cambia, restituisce il nodo originale.
+
+    Args:
+        node (Expression): Il nodo da ricostruire.
+        fn (callable): La funzione applicata a ciascun figlio che è un'espressione.
+    Return:
+        Expression: Il nodo originale o la sua copia aggiornata.
+    """
+    def apply(value):
+        return fn(value) if isinstance(value, Expression) else value
+
+    if isinstance(node, Operation):
+        args = [apply(arg) for arg in node.args]
+        if all(new is old for new, old in zip(args, node.args)):
+            return node
+        new_node = copy.copy(node)
+        new_node.args = args
+        # BinaryOp e UnaryOp conservano gli operandi anche in x e y
+        if isinstance(node, BinaryOp):
+            new_node.x, new_node.y = args
+        elif isinstance(node, UnaryOp):
+            new_node.x = args[0]
+        return new_node
+
+    if isinstance(node, ProgN):
+        exprs = [apply(expr) for expr in node.exprs]
+        if all(new is old for new, old in zip(exprs, node.exprs)):
+            return node
+        return ProgN(exprs)
+
+    updates = {}
+    for field in child_fields(node):
+        old = getattr(node, field)
+        new = apply(old)
+        if new is not old:
+            updates[field] = new
+    if not updates:
+        return node
+    new_node = copy.copy(node)
+    for field, value in updates.items():
+        setattr(new_node, field, value)
+    return new_node
@@ -0,0 +1,188 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from expr import InvalidArgumentError
+from mandelbrot import np, _require_numpy, columns_for, compute_rows, gray_table, pgm_header, tiles
+
+
+# Byte di lavoro per punto durante il calcolo di una fascia (coordinate, z, maschere, iterazioni),
+# misurati come crescita del picco di RSS al variare della dimensione delle fasce
+BYTES_PER_POINT = 112
+
+# Memoria di lavoro predefinita per ogni fascia (in byte)
+DEFAULT_BAND_BYTES = 16 * 1024 * 1024
+
+
+def band_rows_for(ncols, band_bytes=DEFAULT_BAND_BYTES):
+    # Righe per fascia tali che il calcolo di una fascia resti entro band_bytes
+    return max(1, band_bytes // (max(ncols, 1) * BYTES_PER_POINT))
+
+
+def create_pgm(filename, width, height):
+    """
+    Crea il file P5 con la sua dimensione finale, come savePGM con ftruncate: scrive
+    l'intestazione e lascia i pixel (a zero) da riempire attraverso la mappatura.
+
+    Args:
+        filename (str): Il file da creare (se esiste viene sovrascritto).
+        width (int): La larghezza dell'immagine.
+        height (int): L'altezza dell'immagine.
+    Return:
+        int: La posizione del primo pixel nel file.
+    """
+    header = pgm_header(width, height)
+    with open(filename, "wb") as f:
+        f.write(header)
+        f.truncate(len(header) + width * height)
+    return len(header)
+
+
+def read_header(filename):
+    """
+    Legge l'intestazione di un file P5 (anche con commenti) senza caricare i pixel.
+
+    Args:
+        filename (str): Il file PGM.
+    Return:
+        tuple: Larghezza, altezza e posizione del primo pixel nel file.
+    """
+    fields = []
+    with open(filename, "rb") as f:
+        while len(fields) < 4:
+            token = b""
+            char = f.read(1)
+            while char.isspace():
+                char = f.read(1)
+            while char == b"#":  # Commento fino a fine riga
+                f.readline()
+                char = f.read(1)
+                while char.isspace():
+                    char = f.read(1)
+            while char and not char.isspace():
+                token += char
+                char = f.read(1)
+            if not token:
+                raise InvalidArgumentError(f"Intestazione PGM incompleta in '{filename}'")
+            fields.append(token)
+        offset = f.tell()  # Dopo il singolo spazio che segue maxval
+    if fields[0] != b"P5":
+        raise InvalidArgumentError(f"'{filename}' non è un file PGM binario (P5)")
+    width, height, maxval = (int(field) for field in fields[1:])
+    if maxval > 255:
+        raise InvalidArgumentError("Sono supportati solo PGM con un byte per pixel")
+    return width, height, offset
+
+
+def pixel_map(filename, mode="r"):
+    # I pixel del file come matrice (altezza, larghezza) mappata in memoria, senza leggerli
+    width, height, offset = read_header(filename)
+    return np.memmap(filename, dtype=np.uint8, mode=mode, offset=offset, shape=(height, width))
+
+
+def _render_band(job):
+    # Eseguito dai processi del pool: scrive le righe della fascia direttamente nel file
+    filename, offset, nrows, ncols, max_iter, start, stop = job
+    pixels = np.memmap(filename, dtype=np.uint8, mode="r+", offset=offset, shape=(nrows, ncols))
+    pixels[start:stop] = gray_table(max_iter)[compute_rows(nrows, ncols, max_iter, start, stop)]
+    pixels.flush()  # Le pagine scritte tornano su disco prima della fascia successiva
+    del pixels
+    return start, stop
+
+
+def render_to_file(filename, nrows, max_iter, processes=None, band_rows=None, ncols=None,
+                   band_bytes=DEFAULT_BAND_BYTES):
+    """
+    Calcola l'immagine di main.c direttamente nel file PGM, una fascia di righe alla
+    volta. Nessun processo tiene in memoria l'intera immagine o la matrice delle
+    iterazioni: la memoria usata dipende dalla dimensione delle fasce, non dall'immagine.
+
+    Args:
+        filename (str): Il file PGM da scrivere.
+        nrows (int): La risoluzione verticale.
+        max_iter (int): Il numero massimo di iterazioni.
+        processes (int): Il numero di processi (default: i core); con 0 il calcolo avviene nel processo corrente.
+        band_rows (int): Le righe per fascia (default: in base a band_bytes).
+        ncols (int): La risoluzione orizzontale (default: 1.5 * nrows, come in main.c).
+        band_bytes (int): La memoria di lavoro per fascia, usata se band_rows non è indicato.
+    Return:
+        int: Il numero di fasce calcolate.
+    """
+    _require_numpy()
+    if max_iter <= 0 or nrows <= 0:
+        raise InvalidArgumentError("Valori non validi per iterazioni o risoluzione")
+    ncols = columns_for(nrows) if ncols is None else ncols
+    band_rows = band_rows_for(ncols, band_bytes) if band_rows is None else band_rows
+    if band_rows < 1:
+        raise InvalidArgumentError("Una fascia deve contenere almeno una riga")
+    offset = create_pgm(filename, ncols, nrows)
+    jobs = [(filename, offset, nrows, ncols, max_iter, start, stop) for start, stop in tiles(nrows, band_rows)]
+
+    workers = processes if processes is not None else (os.cpu_count() or 1)
+    if workers == 0 or len(jobs) == 1:
+        for job in jobs:
+            _render_band(job)
+    else:
+        with multiprocessing.Pool(min(workers, len(jobs))) as pool:
+            for _ in pool.imap_unordered(_render_band, jobs):
+                pass
+    return len(jobs)
+
+
+def read_bands(filename, band_rows=None, band_bytes=DEFAULT_BAND_BYTES):
+    """
+    Legge un file PGM una fascia di righe alla volta, per elaborarlo senza caricarlo tutto.
+
+    Args:
+        filename (str): Il file PGM.
+        band_rows (int): Le righe per fascia (default: quante ne stanno in band_bytes).
+        band_bytes (int): I byte per fascia, usati se band_rows non è indicato.
+    Return:
+        generator: Per ogni fascia, la prima riga e i pixel (uint8) con forma (righe, larghezza).
+    """
+    _require_numpy()
+    width, height, offset = read_header(filename)
+    band_rows = max(1, band_bytes // max(width, 1)) if band_rows is None else band_rows
+    if band_rows < 1:
+        raise InvalidArgumentError("Una fascia deve contenere almeno una riga")
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        for start, stop in tiles(height, band_rows):
+            data = f.read((stop - start) * width)
+            if len(data) < (stop - start) * width:
+                raise InvalidArgumentError(f"File PGM troncato: '{filename}'")
+            yield start, np.frombuffer(data, dtype=np.uint8).reshape(stop - start, width)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Genera l'immagine di Mandelbrot scrivendo le fasce di righe direttamente nel file PGM")
+    parser.add_argument("filename", help="Il file PGM da scrivere")
+    parser.add_argument("max_iter", type=int, help="Il numero massimo di iterazioni")
+    parser.add_argument("nrows", type=int, help="La risoluzione verticale (quella orizzontale è 1.5 volte)")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="Numero di processi (default: i core)")
+    parser.add_argument("--band-rows", type=int, default=None, help="Righe per fascia (default: in base a --band-bytes)")
+    parser.add_argument("--band-bytes", type=int, default=DEFAULT_BAND_BYTES, help="Memoria di lavoro per fascia")
+    parser.add_argument("--time", action="store_true", help="Riporta su stderr il tempo di calcolo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.max_iter <= 0 or args.nrows <= 0:
+        print("Errore: Valori non validi per iterazioni o risoluzione.", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    bands = render_to_file(args.filename, args.nrows, args.max_iter, args.processes, args.band_rows,
+                           band_bytes=args.band_bytes)
+    if args.time:
+        print(f"banded: {bands} fasce in {time.perf_counter() - start:.3f} s", file=sys.stderr)
+    print(f"L' immagine '{args.filename}' è stata creata con successo.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#Tommaso Mingrone [SM3201286]
+
+from collections.abc import Mapping
+
+from expr import (
+    Expression, Variable, Constant, Division, Modulus, Reciprocal,
+    MissingVariableException, InvalidExpressionException, InvalidArgumentError,
+)
+from vectorize import VECTOR_OPERATIONS, Fallback, np
+
+
+# Operazioni che sollevano ZeroDivisionError quando il divisore (l'argomento indicato) è zero
+DIVISOR_ARGUMENT = {Division: 0, Modulus: 0, Reciprocal: 0}
+
+
+def _column(values):
+    # Converte una colonna in un array con gli stessi valori che vedrebbe il tree walker
+    array = np.asarray(values)
+    kind = array.dtype.kind
+    if kind == "b":
+        return array
+    if kind == "i":
+        return array.astype(np.int64)
+    if kind == "u":
+        if array.size and int(array.max()) >= 2 ** 63:
+            return array.astype(object)
+        return array.astype(np.int64)
+    if kind == "f":
+        return array.astype(np.float64)
+    return array.astype(object)
+
+
+def _from_objects(array):
+    # Riporta il risultato di un calcolo esatto a un tipo NumPy nativo, quando i valori lo permettono
+    converted = np.array(array.tolist())
+    return converted if converted.dtype.kind in "bif" else array
+
+
+class _RowError:
+    # Segnaposto per le righe che hanno sollevato ZeroDivisionError durante il calcolo esatto
+    pass
+
+
+ROW_ERROR = _RowError()
+
+
+class BatchEvaluator:
+    # Valuta un albero di operazioni aritmetiche su colonne di valori, un nodo alla volta
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.errors = np.zeros(rows, dtype=bool)   # Righe che hanno sollevato ZeroDivisionError
+
+    def evaluate(self, arg):
+        if type(arg) is Constant:
+            return _column(arg.value)
+        if type(arg) is Variable:
+            return self.variable(arg.name)
+        if isinstance(arg, str):
+            return self.variable(arg)
+        if type(arg) in VECTOR_OPERATIONS:
+            return self.operation(arg, [self.evaluate(child) for child in arg.args])
+        if isinstance(arg, Expression):
+            raise InvalidExpressionException(f"Nodo non supportato nella valutazione a blocchi: {arg}")
+        return _column(arg)
+
+    def variable(self, name):
+        if name not in self.columns:
+            raise MissingVariableException(f"Valore mancante per la variabile '{name}'")
+        return self.columns[name]
+
+    def operation(self, node, values):
+        position = DIVISOR_ARGUMENT.get(type(node))
+        if position is not None:
+            # Le righe con divisore zero vengono segnate come errori e calcolate con divisore 1
+            zero = values[position] == 0
+            if np.any(zero):
+                self.errors |= zero
+                values[position] = np.where(zero, 1, values[position]).astype(values[position].dtype)
+
+        if any(value.dtype == object for value in values):
+            return self.exact(node, values)
+        try:
+            with np.errstate(all="ignore"):
+                return VECTOR_OPERATIONS[type(node)](*values)
+        except Fallback:
+            return self.exact(node, values)
+
+    # Calcolo riga per riga con il metodo op del nodo, quando NumPy non darebbe lo stesso risultato di Python
+    def exact(self, node, values):
+        if np.any(self.errors):
+            # Le righe già in errore non vengono calcolate: i loro valori non sono significativi
+            values = [np.where(self.errors, 1, value) if value.ndim else value for value in values]
+
+        def apply(*args):
+            try:
+                return node.op(*args)
+            except ZeroDivisionError:
+                return ROW_ERROR
+
+        result = np.frompyfunc(apply, len(values), 1)(*[value.astype(object) for value in values])
+        result = np.asarray(result, dtype=object)
+        failed = np.asarray(np.frompyfunc(lambda value: value is ROW_ERROR, 1, 1)(result), dtype=bool)
+        if np.any(failed):
+            self.errors |= failed
+            result[failed] = 0
+        return _from_objects(result)
+
+
+def evaluate_batch(expr, columns, names=None):
+    """
+    Valuta un'espressione aritmetica su molte righe in una sola visita dell'albero:
+    ogni nodo viene calcolato elemento per elemento su intere colonne, con la stessa
+    semantica di evaluate (operandi invertiti di BinaryOp compresi). Le operazioni
+    che NumPy non calcolerebbe come Python (interi oltre 2**53, potenze non finite)
+    vengono ripetute riga per riga con il metodo op del nodo.
+
+    Args:
+        expr (Expression): L'albero, composto solo da operazioni aritmetiche e di confronto.
+        columns: Un dizionario nome -> colonna (array NumPy, lista o scalare)
+            oppure una sequenza di colonne, associate ai nomi in names.
+        names (list): I nomi delle colonne passate come sequenza
+            (default: le variabili dell'espressione in ordine alfabetico).
+    Return:
+        tuple: L'array dei risultati e l'array booleano delle righe che hanno sollevato
+        DivisionByZeroException (o ZeroDivisionError); in quelle righe il risultato è
+        NaN per i risultati float e non è significativo negli altri casi.
+    """
+    if np is None:
+        raise InvalidArgumentError("La valutazione a blocchi richiede NumPy")
+
+    if not isinstance(columns, Mapping):
+        columns = list(columns)
+        if names is None:
+            names = sorted(variable_names(expr))
+        if len(names) != len(columns):
+            raise InvalidArgumentError(f"Attese {len(names)} colonne ({', '.join(names)}), ricevute {len(columns)}")
+        columns = dict(zip(names, columns))
+
+    columns = {name: _column(values) for name, values in columns.items()}
+    try:
+        shape = np.broadcast_shapes(*(column.shape for column in columns.values()))
+    except ValueError:
+        raise InvalidArgumentError("Le colonne devono avere la stessa lunghezza") from None
+    if len(shape) > 1:
+        raise InvalidArgumentError("Le colonne devono essere monodimensionali")
+
+    evaluator = BatchEvaluator(columns, shape[0] if shape else 1)
+    result = np.broadcast_to(evaluator.evaluate(expr), evaluator.errors.shape).copy()
+    errors = evaluator.errors
+    if result.dtype.kind == "f" and np.any(errors):
+        result[errors] = np.nan
+    return result, errors
+
+
+def variable_names(expr):
+    # Nomi delle variabili lette da un'espressione aritmetica
+    names = set()
+    stack = [expr]
+    while stack:
+        arg = stack.pop()
+        if type(arg) is Variable:
+            names.add(arg.name)
+        elif isinstance(arg, str):
+            names.add(arg)
+        elif type(arg) in VECTOR_OPERATIONS:
+            stack.extend(arg.args)
+    return names
@@ -0,0 +1,303 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import datetime
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from expr import Expression, Variable, Constant, d
+from engines import run
+from ast_tools import rebuild
+from optimizer import optimize
+from vectorize import vectorize
+from calls import cache_calls
+from output import NullSink, use_sink
+from compact import hash_cons
+from licm import hoist
+
+
+# Versioni parametrizzate dei programmi di esempio in fondo a expr.py. Ogni funzione
+# riceve la dimensione n e restituisce il testo del programma
+def counter(n):
+    # Ciclo while che incrementa x fino a n
+    return f"x print x 1 + x setq x {n} > while x alloc prog3"
+
+
+def squares(n):
+    # Array dei quadrati 0..n-1
+    return f"v print i i * i v setv {n} 0 i for {n} v valloc prog3"
+
+
+def subroutine(n):
+    # n chiamate della subroutine che incrementa x di 4
+    return f"x print f call {n} 0 k for x alloc x 4 + x setq f defsub prog4"
+
+
+def divisors(n):
+    # Divisori di n (l'esempio originale usa 783)
+    return f"nop i print i x % 0 = if {n + 1} 2 i for {n} x setq x alloc prog3"
+
+
+def primes(n):
+    # Numeri primi minori di n, con il test di divisibilità su tutti i numeri minori di x
+    return (f"nop x print prime if nop 0 0 != prime setq i x % 0 = if 1 x - 2 i for "
+            f"0 0 = prime setq prime alloc prog4 {n} 2 x for")
+
+
+def primes_sqrt(n):
+    # Quanti sono i primi minori di n, con la divisione per tentativi fino alla radice di x
+    test = "i 1 + i setq nop 0 0 != prime setq i x % 0 = if prog2 prime x i i * <= * while"
+    body = f"nop c 1 + c setq prime if {test} 2 i setq 0 0 = prime setq prog4"
+    return f"c print {body} {n} 2 x for 0 c setq prog3"
+
+
+def table(n):
+    # Tabella n x n dei prodotti i * j
+    return f"v print i j * 1 i - {n} * 1 j - + v setv {n + 1} 1 j for {n + 1} 1 i for {n * n} v valloc prog3"
+
+
+def collatz(n):
+    # Passi totali delle successioni di Collatz che partono da 1..n-1
+    step = "c 1 + c setq 1 3 x * + x setq 2 x / x setq 2 x % 0 = if prog2"
+    return f"c print {step} 1 x != while 0 s + x setq prog2 {n} 1 s for 0 c setq prog3"
+
+
+BENCHMARKS = {
+    "counter": counter,
+    "squares": squares,
+    "subroutine": subroutine,
+    "divisors": divisors,
+    "primes": primes,
+    "primes_sqrt": primes_sqrt,
+    "table": table,
+    "collatz": collatz,
+}
+
+# Dimensioni dei programmi per ciascuna scala
+SCALES = {
+    "small": {"counter": 10**4, "squares": 10**4, "subroutine": 10**4, "divisors": 10**4,
+              "primes": 500, "primes_sqrt": 10**4, "table": 30, "collatz": 300},
+    "medium": {"counter": 10**5, "squares": 10**5, "subroutine": 10**5, "divisors": 10**5,
+               "primes": 1500, "primes_sqrt": 3 * 10**4, "table": 100, "collatz": 3000},
+    "large": {"counter": 10**6, "squares": 10**6, "subroutine": 10**6, "divisors": 10**6,
+              "primes": 3000, "primes_sqrt": 10**5, "table": 300, "collatz": 30000},
+}
+
+
+# Varianti misurate: motore di esecuzione e trasformazioni dell'albero applicate prima
+VARIANTS = {
+    "tree": ("tree", ()),
+    "closure": ("closure", ()),
+    "vm": ("vm", ()),
+    "slots": ("slots", ()),
+    "iterative": ("iterative", ()),
+    "sliced": ("sliced", ()),
+    "tree+optimize": ("tree", (optimize,)),
+    "tree+vectorize": ("tree", (vectorize,)),
+    "tree+calls": ("tree", (cache_calls,)),
+    "tree+hash_cons": ("tree", (hash_cons,)),
+    "tree+hoist": ("tree", (hoist,)),
+    "closure+hoist": ("closure", (hoist,)),
+}
+
+
+class CountingProbe(Expression):
+    # Conta le valutazioni del nodo che sostituisce
+
+    def __init__(self, node, counter):
+        self.node = node
+        self.counter = counter
+
+    def evaluate(self, env):
+        self.counter[0] += 1
+        return self.node.evaluate(env)
+
+
+def count_operations(expr):
+    # Numero di nodi valutati dal tree walker (foglie Variable e Constant escluse)
+    counter = [0]
+    probes = {}
+
+    def wrap(node):
+        if type(node) in (Variable, Constant):
+            return node
+        if id(node) not in probes:
+            probes[id(node)] = CountingProbe(rebuild(node, wrap), counter)
+        return probes[id(node)]
+
+    with use_sink(NullSink()):
+        wrap(expr).evaluate({})
+    return counter[0]
+
+
+def measure(text, variant, repeat=3, memory=True):
+    """
+    Misura un programma con una variante: tempo di parsing, tempo di esecuzione
+    (il minimo su repeat esecuzioni) e picco di memoria allocata durante l'esecuzione.
+
+    Args:
+        text (str): Il testo del programma.
+        variant (str): Il nome della variante in VARIANTS.
+        repeat (int): Quante volte eseguire il programma.
+        memory (bool): Se misurare il picco di memoria (con un'esecuzione aggiuntiva sotto tracemalloc).
+    Return:
+        dict: I tempi in secondi e il picco di memoria in byte.
+    """
+    engine, transforms = VARIANTS[variant]
+
+    start = time.perf_counter()
+    e = Expression.from_program(text, d)
+    parse_seconds = time.perf_counter() - start
+    for transform in transforms:
+        e, _ = transform(e)
+
+    times = []
+    # L'output di print viene scartato: si misura la valutazione, non l'I/O
+    with use_sink(NullSink()):
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            run(e, {}, engine)
+            times.append(time.perf_counter() - start)
+
+        peak = None
+        if memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                run(e, {}, engine)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    return {
+        "parse_seconds": parse_seconds,
+        "eval_seconds": min(times),
+        "eval_mean_seconds": sum(times) / len(times),
+        "peak_bytes": peak,
+    }
+
+
+def run_suite(benchmarks=None, variants=None, scale="small", repeat=3, memory=True, ops=True, log=None):
+    """
+    Esegue la suite di benchmark.
+
+    Args:
+        benchmarks (list): I nomi dei programmi (default: tutti quelli di BENCHMARKS).
+        variants (list): I nomi delle varianti (default: tutte quelle di VARIANTS).
+        scale (str): "small", "medium" o "large".
+        repeat (int): Le esecuzioni per ciascuna misura.
+        memory (bool): Se misurare il picco di memoria.
+        ops (bool): Se contare i nodi valutati, per riportare le operazioni al secondo.
+        log (file): Dove scrivere l'avanzamento (opzionale).
+    Return:
+        dict: Descrizione dell'ambiente e risultati, serializzabili in JSON.
+    """
+    benchmarks = benchmarks or list(BENCHMARKS)
+    variants = variants or list(VARIANTS)
+    results = []
+    for name in benchmarks:
+        size = SCALES[scale][name]
+        text = BENCHMARKS[name](size)
+        operations = count_operations(Expression.from_program(text, d)) if ops else None
+        for variant in variants:
+            result = {"benchmark": name, "variant": variant, "size": size, "tokens": len(text.split()),
+                      **measure(text, variant, repeat, memory), "operations": operations}
+            result["ops_per_second"] = operations / result["eval_seconds"] if operations else None
+            results.append(result)
+            if log is not None:
+                print(format_result(result), file=log, flush=True)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "scale": scale,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def format_result(result):
+    peak = f"{result['peak_bytes'] / 2**20:8.2f} MiB" if result["peak_bytes"] is not None else "       -    "
+    ops = f"{result['ops_per_second']:>12,.0f} op/s" if result["ops_per_second"] else ""
+    return (f"{result['benchmark']:<12} {result['variant']:<15} n={result['size']:<8} "
+            f"parse {result['parse_seconds'] * 1000:8.2f} ms  eval {result['eval_seconds'] * 1000:10.2f} ms  "
+            f"{peak}  {ops}")
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Confronta due esecuzioni della suite e segnala le regressioni del tempo di esecuzione.
+
+    Args:
+        baseline (dict): I risultati di riferimento (come restituiti da run_suite).
+        current (dict): I nuovi risultati.
+        threshold (float): L'aumento relativo oltre il quale una misura è una regressione.
+    Return:
+        list: Le tuple (benchmark, variante, tempo di riferimento, tempo attuale, rapporto)
+        delle misure peggiorate oltre la soglia.
+    """
+    reference = {(r["benchmark"], r["variant"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = reference.get((result["benchmark"], result["variant"], result["size"]))
+        if old is None or not old["eval_seconds"]:
+            continue
+        ratio = result["eval_seconds"] / old["eval_seconds"]
+        if ratio > 1 + threshold:
+            regressions.append((result["benchmark"], result["variant"], old["eval_seconds"],
+                                result["eval_seconds"], ratio))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sui programmi di esempio, in versione scalata")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Dimensione dei programmi")
+    parser.add_argument("--only", help="Programmi da eseguire, separati da virgole")
+    parser.add_argument("--variants", help="Varianti da misurare, separate da virgole (default: tutte)")
+    parser.add_argument("--repeat", type=int, default=3, help="Esecuzioni per misura (si riporta il minimo)")
+    parser.add_argument("--no-memory", action="store_true", help="Non misura il picco di memoria")
+    parser.add_argument("--no-ops", action="store_true", help="Non conta i nodi valutati")
+    parser.add_argument("--out", help="File JSON in cui salvare i risultati")
+    parser.add_argument("--baseline", help="File JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Soglia di regressione (default: 0.10)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    benchmarks = args.only.split(",") if args.only else None
+    variants = args.variants.split(",") if args.variants else None
+    for name in benchmarks or ():
+        if name not in BENCHMARKS:
+            raise SystemExit(f"Benchmark sconosciuto: '{name}' (disponibili: {', '.join(BENCHMARKS)})")
+    for name in variants or ():
+        if name not in VARIANTS:
+            raise SystemExit(f"Variante sconosciuta: '{name}' (disponibili: {', '.join(VARIANTS)})")
+
+    report = run_suite(benchmarks, variants, args.scale, args.repeat,
+                       not args.no_memory, not args.no_ops, log=sys.stdout)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for name, variant, old, new, ratio in regressions:
+            print(f"REGRESSIONE {name} {variant}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms (x{ratio:.2f})")
+        if regressions:
+            return 1
+        print("Nessuna regressione")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
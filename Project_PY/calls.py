@@ -0,0 +1,296 @@
+#Tommaso Mingrone [SM3201286]
+
+from collections import OrderedDict
+
+from expr import (
+    Expression, Variable, Constant, Operation, Alloc, Setq, Prog2, Prog3, Prog4, ProgN,
+    If, While, Nop, DefSub, Call, For, Valloc, Setv,
+    InvalidArgumentError, FunctionNotFoundException,
+)
+from ast_tools import rebuild, iter_nodes
+from optimizer import PURE_OPERATIONS
+
+
+# Dimensione predefinita della tabella di memoizzazione di ciascuna subroutine
+DEFAULT_MEMO_SIZE = 1024
+
+# Valore registrato nella chiave per una variabile assente dall'ambiente
+MISSING = object()
+
+# Nodi ammessi nel corpo di una subroutine pura, oltre alle operazioni di PURE_OPERATIONS
+PURE_NODES = (Variable, Constant, Setq, Alloc, Prog2, Prog3, Prog4, ProgN, If, While, Nop)
+
+
+def written_names(body):
+    # Nomi scritti nell'ambiente dai nodi del corpo, escluse le defsub
+    names = set()
+    for node in iter_nodes(body):
+        if isinstance(node, (Alloc, Setq)):
+            names.add(node.var_name)
+        elif isinstance(node, (Valloc, Setv)):
+            names.add(str(node.var_name))
+        elif isinstance(node, For):
+            names.add(str(node.i_var))
+    return names
+
+
+def read_names(body):
+    # Nomi letti dai nodi del corpo: variabili e operandi che sono nomi di variabile
+    names = set()
+    for node in iter_nodes(body):
+        if type(node) is Variable:
+            names.add(node.name)
+        elif isinstance(node, Operation):
+            names.update(arg for arg in node.args if isinstance(arg, str))
+        elif type(node) is If and isinstance(node.cond, str):
+            names.add(node.cond)
+    return names
+
+
+def is_pure(body, inputs, output):
+    """
+    Verifica che il corpo di una subroutine dipenda solo dalle variabili dichiarate
+    e che scriva al più la variabile risultato: niente print, array, cicli for,
+    chiamate o definizioni di altre subroutine.
+
+    Args:
+        body (Expression): Il corpo della subroutine.
+        inputs (iterable): I nomi delle variabili che il corpo può leggere.
+        output (str): L'unica variabile che il corpo può scrivere.
+    Return:
+        bool: True se il risultato e l'ambiente finale sono determinati dagli ingressi.
+    """
+    if not isinstance(body, Expression):
+        return False
+    for node in iter_nodes(body):
+        if type(node) not in PURE_NODES and type(node) not in PURE_OPERATIONS:
+            return False
+    return read_names(body) <= set(inputs) | {output} and written_names(body) <= {output}
+
+
+class Memo:
+    # Tabella LRU dei risultati di una subroutine pura, indicizzata dai valori degli ingressi
+
+    def __init__(self, inputs, output, maxsize=DEFAULT_MEMO_SIZE):
+        if maxsize < 1:
+            raise InvalidArgumentError("La dimensione della tabella di memoizzazione deve essere almeno 1")
+        # Anche il valore precedente del risultato fa parte della chiave: il corpo può non scriverlo
+        self.names = tuple(sorted(set(inputs) | {output}))
+        self.inputs = frozenset(inputs)
+        self.output = output
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # Chiave -> (valore restituito, valore finale del risultato)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, env):
+        # Valori (con il loro tipo, per distinguere 1, 1.0 e True) delle variabili lette dal corpo
+        key = []
+        for name in self.names:
+            if name in env:
+                value = env[name]
+                key.append((type(value), value))
+            elif name in self.inputs:
+                return None  # L'ingresso mancante deve sollevare l'eccezione del tree walker
+            else:
+                key.append(MISSING)
+        key = tuple(key)
+        try:
+            hash(key)
+        except TypeError:
+            return None      # Valori non hashable (array): nessuna memoizzazione
+        return key
+
+    def call(self, body, env):
+        key = self.key(env)
+        if key is None:
+            return body.evaluate(env)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            result, value = entry
+            if value is not MISSING:
+                env[self.output] = value
+            return result
+
+        self.misses += 1
+        result = body.evaluate(env)
+        self.entries[key] = (result, env[self.output] if self.output in env else MISSING)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def clear(self):
+        self.entries.clear()
+
+
+class SubroutineCell:
+    # Corpo risolto di una subroutine, condiviso dalle defsub e dalle call con lo stesso nome
+
+    def __init__(self, name, declaration=None, maxsize=DEFAULT_MEMO_SIZE):
+        self.name = name
+        self.declaration = declaration  # (ingressi, risultato) se la memoizzazione è richiesta
+        self.maxsize = maxsize
+        self.env = None       # Ambiente in cui il corpo è stato risolto
+        self.body = None
+        self.memo = None      # Memo del corpo corrente, se è puro
+        self.dynamic = False  # Il nome viene scritto anche da nodi diversi da defsub: niente cache
+        self.lookups = 0      # Ricerche del corpo nell'ambiente
+
+    def bind(self, env, body, pure=None):
+        # Registra il corpo definito da una defsub; la tabella di memoizzazione vale solo per quel corpo
+        self.env = env
+        if body is self.body:
+            return
+        self.body = body
+        self.memo = None
+        if self.declaration is not None:
+            inputs, output = self.declaration
+            if pure is None:
+                pure = is_pure(body, inputs, output)
+            if pure:
+                self.memo = Memo(inputs, output, self.maxsize)
+
+    def lookup(self, env):
+        # Prima chiamata in un nuovo ambiente (o nome non cacheable): il corpo si cerca per nome
+        self.lookups += 1
+        if self.name not in env:
+            raise FunctionNotFoundException(f"La subroutine '{self.name}' non è definita")
+        body = env[self.name]
+        if isinstance(body, Expression) and self.name in written_names(body):
+            self.dynamic = True
+        if self.dynamic:
+            return body
+        self.bind(env, body)
+        return body
+
+
+class CachingDefSub(DefSub):
+    # DefSub che aggiorna anche la cella condivisa con le call: è l'unico punto di invalidazione
+
+    def __init__(self, args, cell, pure=None):
+        super().__init__(args)
+        self.cell = cell
+        self.pure = pure  # Purezza del corpo già verificata durante la trasformazione
+
+    def evaluate(self, env):
+        env[str(self.function_name)] = self.expr
+        self.cell.bind(env, self.expr, self.pure)
+        return None
+
+
+class CachingCall(Call):
+    # Call con cache del corpo: la ricerca per nome avviene solo alla prima chiamata in un ambiente
+
+    def __init__(self, args, cell):
+        super().__init__(args)
+        self.cell = cell
+
+    def evaluate(self, env):
+        cell = self.cell
+        if cell.env is env and not cell.dynamic:
+            body = cell.body
+        else:
+            body = cell.lookup(env)
+            if cell.dynamic:
+                return body.evaluate(env)
+        memo = cell.memo
+        if memo is not None:
+            return memo.call(body, env)
+        return body.evaluate(env)
+
+
+class CallCache:
+    """
+    Celle delle subroutine di un albero trasformato da cache_calls, con le
+    statistiche delle ricerche per nome e della memoizzazione.
+    """
+
+    def __init__(self, memoize=None, maxsize=DEFAULT_MEMO_SIZE):
+        self.memoize = dict(memoize or {})
+        self.maxsize = maxsize
+        self.cells = {}
+
+    def cell(self, name):
+        if name not in self.cells:
+            self.cells[name] = SubroutineCell(name, self.memoize.get(name), self.maxsize)
+        return self.cells[name]
+
+    # Dimentica i corpi risolti e i risultati memorizzati (ad esempio se l'ambiente è stato modificato dall'esterno)
+    def reset(self):
+        for cell in self.cells.values():
+            cell.env = cell.body = cell.memo = None
+
+    def __str__(self):
+        parts = []
+        for name, cell in sorted(self.cells.items()):
+            text = f"{name}: ricerche={cell.lookups}"
+            if cell.dynamic:
+                text += " (senza cache)"
+            if cell.memo is not None:
+                memo = cell.memo
+                text += (f", memo={len(memo.entries)}/{memo.maxsize} hits={memo.hits} "
+                         f"misses={memo.misses} evictions={memo.evictions}")
+            parts.append(text)
+        return "CallCache(" + "; ".join(parts) + ")"
+
+
+class CallCacher:
+    # Sostituisce defsub e call con le versioni che condividono la cella della subroutine
+
+    def __init__(self, cache, rebound):
+        self.cache = cache
+        self.rebound = rebound  # Nomi scritti da nodi diversi da defsub: le loro call non usano la cache
+
+    def visit(self, node):
+        if type(node) is DefSub:
+            name = str(node.function_name)
+            body = self.visit(node.expr) if isinstance(node.expr, Expression) else node.expr
+            cell = self.cache.cell(name)
+            pure = None
+            if cell.declaration is not None:
+                inputs, output = cell.declaration
+                if not is_pure(body, inputs, output):
+                    raise InvalidArgumentError(f"La subroutine '{name}' non è pura rispetto a {inputs} -> {output}")
+                pure = True
+            return CachingDefSub([body, node.function_name], cell, pure)
+        if type(node) is Call:
+            name = str(node.function_name)
+            if name in self.rebound:
+                return node
+            return CachingCall([node.function_name], self.cache.cell(name))
+        return rebuild(node, self.visit)
+
+
+def cache_calls(expr, memoize=None, maxsize=DEFAULT_MEMO_SIZE):
+    """
+    Fa sì che ogni call risolva il corpo della subroutine una sola volta per ambiente:
+    le defsub e le call con lo stesso nome condividono una cella, aggiornata solo
+    quando una defsub (ri)definisce il nome. Le subroutine indicate in memoize
+    vengono verificate come pure e i loro risultati conservati in una tabella LRU
+    indicizzata dai valori degli ingressi.
+
+    Args:
+        expr (Expression): La radice dell'albero (non viene modificata).
+        memoize (dict): Nome della subroutine -> (nomi degli ingressi, nome del risultato).
+        maxsize (int): Il numero massimo di risultati memorizzati per subroutine.
+    Return:
+        tuple: Il nuovo albero e il CallCache con le celle delle subroutine.
+    """
+    cache = CallCache(memoize, maxsize)
+    return CallCacher(cache, written_names(expr)).visit(expr), cache
+
+
+def parse_memoize(specs):
+    # Converte le dichiarazioni "nome:ingresso,ingresso:risultato" della riga di comando
+    memoize = {}
+    for spec in specs or ():
+        parts = spec.split(":")
+        if len(parts) != 3 or not parts[0] or not parts[2]:
+            raise InvalidArgumentError(f"Dichiarazione di memoizzazione non valida: '{spec}'")
+        name, inputs, output = parts
+        memoize[name] = (tuple(i for i in inputs.split(",") if i), output)
+    return memoize
@@ -0,0 +1,151 @@
+#Tommaso Mingrone [SM3201286]
+
+import sys
+
+from expr import Expression, Variable, Constant
+from ast_tools import rebuild, iter_nodes, iter_postorder
+from optimizer import PURE_OPERATIONS
+
+
+# Oggetti condivisi dall'interprete, non attribuiti all'albero
+SINGLETONS = (type(None), bool)
+
+
+# Attributi per classe di nodo, calcolati alla prima occorrenza
+_slot_names = {}
+
+
+def slot_names(cls):
+    # Attributi dichiarati con __slots__ dalla classe e dalle sue basi
+    if cls not in _slot_names:
+        names = []
+        for klass in cls.__mro__:
+            slots = vars(klass).get("__slots__", ())
+            names.extend([slots] if isinstance(slots, str) else slots)
+        _slot_names[cls] = [name for name in names if name not in ("__dict__", "__weakref__")]
+    return _slot_names[cls]
+
+
+def tree_bytes(root):
+    """
+    Stima la memoria occupata da un albero: i nodi distinti, i loro __dict__ (se presenti),
+    le liste di argomenti e i valori (nomi e costanti), contando una sola volta ogni
+    oggetto condiviso.
+
+    Args:
+        root (Expression): La radice dell'albero (o del DAG).
+    Return:
+        tuple: Il numero di nodi distinti e i byte occupati.
+    """
+    seen = set()
+    total = 0
+    nodes = 0
+
+    def add(obj):
+        nonlocal total
+        if id(obj) not in seen and not isinstance(obj, SINGLETONS):
+            seen.add(id(obj))
+            total += sys.getsizeof(obj)
+
+    for node in iter_nodes(root):
+        nodes += 1
+        add(node)
+        values = [getattr(node, name) for name in slot_names(type(node)) if hasattr(node, name)]
+        if hasattr(node, "__dict__"):
+            add(node.__dict__)
+            values.extend(vars(node).values())
+        for value in values:
+            if isinstance(value, (list, tuple)):
+                add(value)
+                values.extend(item for item in value if not isinstance(item, (Expression, list, tuple)))
+            elif not isinstance(value, Expression):
+                add(value)
+    return nodes, total
+
+
+class CompactionReport:
+    # Nodi e byte dell'albero prima e dopo l'hash-consing
+
+    def __init__(self):
+        self.nodes_before = 0
+        self.nodes_after = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.shared = 0    # Sottoalberi sostituiti da un nodo identico già esistente
+
+    def __str__(self):
+        saved = self.bytes_before - self.bytes_after
+        return (f"nodi: {self.nodes_before} -> {self.nodes_after}, "
+                f"byte: {self.bytes_before:,} -> {self.bytes_after:,} (risparmiati {saved:,}); "
+                f"sottoalberi condivisi: {self.shared}")
+
+
+def value_key(value):
+    # Chiave di un valore costante: distingue 1, 1.0 e True, e 0.0 da -0.0
+    if type(value) is float:
+        return float, value.hex()
+    return type(value), value
+
+
+class HashConser:
+    # Ricostruisce l'albero dal basso verso l'alto, fondendo i sottoalberi puri strutturalmente identici
+
+    def __init__(self):
+        self.table = {}     # Chiave strutturale -> nodo canonico
+        self.pure = set()   # id dei nodi canonici puri
+        self.shared = 0
+
+    def key(self, node):
+        # Chiave strutturale di un nodo puro i cui figli sono già canonici; None se il nodo non è puro
+        if type(node) is Variable:
+            return Variable, node.name
+        if type(node) is Constant:
+            return (Constant,) + value_key(node.value)
+        if type(node) not in PURE_OPERATIONS:
+            return None
+        parts = [type(node)]
+        for arg in node.args:
+            if isinstance(arg, Expression):
+                if id(arg) not in self.pure:
+                    return None
+                parts.append(id(arg))
+            else:
+                parts.append(value_key(arg))
+        return tuple(parts)
+
+    def run(self, root):
+        canonical = {}  # id del nodo originale -> nodo del nuovo albero
+        for node in iter_postorder(root):
+            new = rebuild(node, lambda child: canonical[id(child)])
+            try:
+                key = self.key(new)
+                if key is not None:
+                    found = self.table.setdefault(key, new)
+                    if found is not new:
+                        self.shared += 1
+                    new = found
+                    self.pure.add(id(new))
+            except TypeError:
+                pass  # Valore non hashable: il nodo resta distinto
+            canonical[id(node)] = new
+        return canonical[id(root)]
+
+
+def hash_cons(expr):
+    """
+    Fa condividere un solo nodo ai sottoalberi puri identici (variabili, costanti e
+    operazioni aritmetiche su di essi): l'albero diventa un DAG con la stessa semantica,
+    perché i nodi non vengono modificati durante la valutazione.
+
+    Args:
+        expr (Expression): La radice dell'albero (non viene modificata).
+    Return:
+        tuple: Il nuovo albero e un CompactionReport con nodi e byte prima e dopo.
+    """
+    report = CompactionReport()
+    report.nodes_before, report.bytes_before = tree_bytes(expr)
+    conser = HashConser()
+    result = conser.run(expr)
+    report.nodes_after, report.bytes_after = tree_bytes(result)
+    report.shared = conser.shared
+    return result, report
@@ -0,0 +1,528 @@
+#Tommaso Mingrone [SM3201286]
+
+import operator
+
+import expr as expr_module
+from expr import (
+    Expression, Variable, Constant, Operation, Alloc, Valloc, Setq, Setv,
+    Prog2, Prog3, Prog4, ProgN, If, While, For, DefSub, Call, Print, Nop,
+    Addition, Subtraction, Division, Multiplication, Power, Modulus,
+    Reciprocal, AbsoluteValue, Major, Minor, MajorEq, MinorEq, Equal, NotEqual,
+    MissingVariableException, InvalidArithmeticOperationException,
+    ArrayIndexOutOfBoundsException, VariableNotFoundException,
+    FunctionNotFoundException, DivisionByZeroException, emit,
+    CachedValue, StoreValue, ResetCells, REUSABLE,
+)
+
+
+# Tipi di operando usati dal compilatore per specializzare le closure
+EXPR, VAR, CONST = 0, 1, 2
+
+# Sentinella per distinguere una chiave assente da un valore None nell'ambiente
+_UNBOUND = object()
+
+
+def _missing(env, *names):
+    # Solleva l'eccezione per la prima variabile mancante, nello stesso ordine del tree walker
+    for name in names:
+        if name not in env:
+            raise MissingVariableException(f"Valore mancante per la variabile '{name}'")
+
+
+def _divide(y, x):
+    # Divisione con lo stesso controllo di Division.op
+    if x == 0:
+        raise DivisionByZeroException("La divisione per zero non è consentita")
+    return y / x
+
+
+def _reciprocal(y):
+    # Reciproco con lo stesso controllo di Reciprocal.op
+    if y == 0:
+        raise DivisionByZeroException("La divisione per zero non è consentita")
+    return 1 / y
+
+
+# Operazioni binarie: la funzione riceve (y, x), come nei metodi op delle classi (y op x)
+BINARY_FUNCTIONS = {
+    Addition: operator.add,
+    Subtraction: operator.sub,
+    Division: _divide,
+    Multiplication: operator.mul,
+    Power: operator.pow,
+    Modulus: operator.mod,
+    Major: operator.gt,
+    Minor: operator.lt,
+    MajorEq: operator.ge,
+    MinorEq: operator.le,
+    Equal: operator.eq,
+    NotEqual: operator.ne,
+}
+
+# Operazioni unarie
+UNARY_FUNCTIONS = {
+    Reciprocal: _reciprocal,
+    AbsoluteValue: abs,
+}
+
+
+class CompiledExpression:
+    # Forma compilata di un albero Expression: ogni nodo diventa una closure Python specializzata
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.subroutines = {}  # Corpo di una subroutine (nodo) -> closure compilata
+        self.code = self.compile_node(expr)
+
+    # Esegue la forma compilata nell'ambiente dato, con la stessa semantica di Expression.evaluate
+    def evaluate(self, env):
+        return self.code(env)
+
+    # Rappresentazione stringa dell'espressione compilata
+    def __str__(self):
+        return str(self.expr)
+
+    def compile_node(self, node):
+        """
+        Trasforma un nodo dell'albero nella closure corrispondente.
+        Il compilatore è scelto in base alla classe del nodo (risalendo la MRO);
+        i nodi sconosciuti vengono eseguiti con il loro metodo evaluate.
+
+        Args:
+            node (Expression): Il nodo da compilare.
+        Return:
+            callable: Una funzione che riceve l'ambiente e restituisce il valore del nodo.
+        """
+        for klass in type(node).__mro__:
+            compiler = COMPILERS.get(klass)
+            if compiler is not None:
+                return compiler(self, node)
+        return node.evaluate
+
+    # Operando "flessibile" (argomenti di Operation, indice di Setv, condizione di If, Print)
+    def operand(self, arg):
+        # Le foglie Constant e Variable vengono lette direttamente, senza chiamare una closure
+        if type(arg) is Constant:
+            return CONST, arg.value
+        if type(arg) is Variable:
+            return VAR, arg.name
+        if isinstance(arg, Expression):
+            return EXPR, self.compile_node(arg)
+        if isinstance(arg, str):
+            return VAR, arg
+        return CONST, arg
+
+    # Operando valutato con evaluate senza controlli (Prog*, While, Valloc, Setv): come nel tree walker
+    def strict(self, arg):
+        if isinstance(arg, Expression):
+            return self.compile_node(arg)
+
+        def run(env):
+            return arg.evaluate(env)
+        return run
+
+    # Operando valutato se è un'espressione, altrimenti restituito così com'è (Setq, If, For)
+    def value(self, arg):
+        if isinstance(arg, Expression):
+            return self.compile_node(arg)
+
+        def run(env):
+            return arg
+        return run
+
+    # Closure che legge un operando flessibile
+    def reader(self, arg):
+        kind, x = self.operand(arg)
+        if kind == EXPR:
+            return x
+        if kind == CONST:
+            def run(env):
+                return x
+            return run
+
+        def run(env):
+            try:
+                return env[x]
+            except KeyError:
+                pass
+            _missing(env, x)
+        return run
+
+    # Restituisce la closure compilata di una subroutine, compilandola alla prima chiamata
+    def subroutine(self, body):
+        if isinstance(body, Expression):
+            code = self.compile_node(body)
+            self.subroutines[body] = code
+            return code
+        return body.evaluate
+
+
+def compile_variable(compiler, node):
+    name = node.name
+
+    def run(env):
+        try:
+            return env[name]
+        except KeyError:
+            pass
+        _missing(env, name)
+    return run
+
+
+def compile_constant(compiler, node):
+    value = node.value
+
+    def run(env):
+        return value
+    return run
+
+
+def compile_binary(compiler, node, fn):
+    # Specializza la closure sul tipo dei due operandi; x è sempre valutato prima di y
+    kx, x = compiler.operand(node.args[0])
+    ky, y = compiler.operand(node.args[1])
+
+    if kx == EXPR and ky == EXPR:
+        def run(env):
+            xv = x(env)
+            return fn(y(env), xv)
+    elif kx == EXPR and ky == VAR:
+        def run(env):
+            xv = x(env)
+            try:
+                yv = env[y]
+            except KeyError:
+                _missing(env, y)
+            return fn(yv, xv)
+    elif kx == EXPR:
+        def run(env):
+            return fn(y, x(env))
+    elif kx == VAR and ky == EXPR:
+        def run(env):
+            try:
+                xv = env[x]
+            except KeyError:
+                _missing(env, x)
+            return fn(y(env), xv)
+    elif kx == VAR and ky == VAR:
+        def run(env):
+            try:
+                xv = env[x]
+                yv = env[y]
+            except KeyError:
+                _missing(env, x, y)
+            return fn(yv, xv)
+    elif kx == VAR:
+        def run(env):
+            try:
+                xv = env[x]
+            except KeyError:
+                _missing(env, x)
+            return fn(y, xv)
+    elif ky == EXPR:
+        def run(env):
+            return fn(y(env), x)
+    elif ky == VAR:
+        def run(env):
+            try:
+                yv = env[y]
+            except KeyError:
+                _missing(env, y)
+            return fn(yv, x)
+    else:
+        def run(env):
+            return fn(y, x)
+    return run
+
+
+def compile_unary(compiler, node, fn):
+    kx, x = compiler.operand(node.args[0])
+
+    if kx == EXPR:
+        def run(env):
+            return fn(x(env))
+    elif kx == VAR:
+        def run(env):
+            try:
+                xv = env[x]
+            except KeyError:
+                _missing(env, x)
+            return fn(xv)
+    else:
+        def run(env):
+            return fn(x)
+    return run
+
+
+def compile_operation(compiler, node):
+    fn = BINARY_FUNCTIONS.get(type(node))
+    if fn is not None:
+        return compile_binary(compiler, node, fn)
+    fn = UNARY_FUNCTIONS.get(type(node))
+    if fn is not None:
+        return compile_unary(compiler, node, fn)
+
+    # Operazione definita dall'utente: valuta gli argomenti in ordine e chiama op
+    readers = [compiler.reader(arg) for arg in node.args]
+    op = node.op
+
+    def run(env):
+        return op(*[read(env) for read in readers])
+    return run
+
+
+def compile_alloc(compiler, node):
+    name = node.var_name
+
+    def run(env):
+        env[name] = 0
+        return None
+    return run
+
+
+def compile_valloc(compiler, node):
+    size_expr = compiler.strict(node.size_expr)
+    name = str(node.var_name)
+    allocate = node.allocate
+
+    def run(env):
+        size = size_expr(env)
+        if not isinstance(size, int) or size < 0:
+            raise InvalidArithmeticOperationException("La dimensione dell'array deve essere un intero non negativo")
+        env[name] = allocate(size)
+        return None
+    return run
+
+
+def compile_setq(compiler, node):
+    expr = compiler.value(node.expr)
+    name = node.var_name
+
+    def run(env):
+        new_value = expr(env)
+        env[name] = new_value
+        return new_value
+    return run
+
+
+def compile_setv(compiler, node):
+    expr = compiler.strict(node.expr)
+    index_expr = compiler.reader(node.index)
+    name = str(node.var_name)
+
+    def run(env):
+        value_to_set = expr(env)
+        index = index_expr(env)
+        if not isinstance(index, int) or index < 0:
+            raise InvalidArithmeticOperationException("L'indice deve essere un intero non negativo")
+        array = env.get(name)
+        if not isinstance(array, expr_module.array_types):
+            raise VariableNotFoundException("La variabile specificata non esiste o non è un array")
+        try:
+            array[index] = value_to_set
+        except IndexError:
+            raise ArrayIndexOutOfBoundsException("Indice fuori dai limiti dell'array") from None
+        return value_to_set
+    return run
+
+
+def compile_prog2(compiler, node):
+    expr1 = compiler.strict(node.expr1)
+    expr2 = compiler.strict(node.expr2)
+
+    def run(env):
+        expr2(env)
+        return expr1(env)
+    return run
+
+
+def compile_prog3(compiler, node):
+    expr1 = compiler.strict(node.expr1)
+    expr2 = compiler.strict(node.expr2)
+    expr3 = compiler.strict(node.expr3)
+
+    def run(env):
+        expr3(env)
+        expr2(env)
+        return expr1(env)
+    return run
+
+
+def compile_prog4(compiler, node):
+    expr1 = compiler.strict(node.expr1)
+    expr2 = compiler.strict(node.expr2)
+    expr3 = compiler.strict(node.expr3)
+    expr4 = compiler.strict(node.expr4)
+
+    def run(env):
+        expr4(env)
+        expr3(env)
+        expr2(env)
+        return expr1(env)
+    return run
+
+
+def compile_progn(compiler, node):
+    first = compiler.strict(node.exprs[0])
+    rest = [compiler.strict(expr) for expr in reversed(node.exprs[1:])]
+
+    def run(env):
+        for expr in rest:
+            expr(env)
+        return first(env)
+    return run
+
+
+def compile_if(compiler, node):
+    cond = compiler.reader(node.cond)
+    if_yes = compiler.value(node.if_yes)
+    if_no = compiler.value(node.if_no)
+
+    def run(env):
+        if cond(env):
+            return if_yes(env)
+        return if_no(env)
+    return run
+
+
+def compile_while(compiler, node):
+    cond = compiler.strict(node.cond)
+    expr = compiler.strict(node.expr)
+
+    def run(env):
+        while cond(env):
+            expr(env)
+        return None
+    return run
+
+
+def compile_for(compiler, node):
+    start = compiler.value(node.start)
+    end = compiler.value(node.end)
+    expr = compiler.strict(node.expr)
+    name = str(node.i_var)
+
+    def run(env):
+        start_val = start(env)
+        end_val = end(env)
+        for i in range(start_val, end_val):
+            env[name] = i
+            expr(env)
+        return None
+    return run
+
+
+def compile_defsub(compiler, node):
+    body = node.expr
+    name = str(node.function_name)
+    # Il corpo è compilato una sola volta; nell'ambiente resta il nodo originale
+    if isinstance(body, Expression):
+        compiler.subroutines[body] = compiler.compile_node(body)
+
+    def run(env):
+        env[name] = body
+        return None
+    return run
+
+
+def compile_call(compiler, node):
+    name = str(node.function_name)
+    subroutines = compiler.subroutines
+
+    def run(env):
+        body = env.get(name, _UNBOUND)
+        if body is _UNBOUND:
+            raise FunctionNotFoundException(f"La subroutine '{name}' non è definita")
+        try:
+            code = subroutines[body]
+        except (KeyError, TypeError):
+            code = compiler.subroutine(body)
+        return code(env)
+    return run
+
+
+def compile_print(compiler, node):
+    expr = compiler.reader(node.expr)
+
+    def run(env):
+        result = expr(env)
+        emit(result)
+        return result
+    return run
+
+
+def compile_nop(compiler, node):
+    def run(env):
+        return None
+    return run
+
+
+def compile_cached(compiler, node):
+    # Compila il sottoalbero interno invece di valutarlo con evaluate
+    expr = compiler.strict(node.expr)
+    cell = node.cell
+    store = isinstance(node, StoreValue)
+
+    def run(env):
+        if cell.env is env and not store:
+            return cell.value
+        value = expr(env)
+        if type(value) in REUSABLE:
+            cell.value = value
+            cell.env = env
+        elif store:
+            cell.env = None
+        return value
+    return run
+
+
+def compile_reset(compiler, node):
+    cells = node.cells
+
+    def run(env):
+        for cell in cells:
+            cell.env = None
+        return None
+    return run
+
+
+# Dizionario dei compilatori per ciascuna classe di nodo
+COMPILERS = {
+    Variable: compile_variable,
+    Constant: compile_constant,
+    Operation: compile_operation,
+    Alloc: compile_alloc,
+    Valloc: compile_valloc,
+    Setq: compile_setq,
+    Setv: compile_setv,
+    Prog2: compile_prog2,
+    Prog3: compile_prog3,
+    Prog4: compile_prog4,
+    ProgN: compile_progn,
+    If: compile_if,
+    While: compile_while,
+    For: compile_for,
+    DefSub: compile_defsub,
+    Call: compile_call,
+    Print: compile_print,
+    Nop: compile_nop,
+    CachedValue: compile_cached,
+    ResetCells: compile_reset,
+}
+
+
+def compile(expr):
+    """
+    Compila un albero costruito da Expression.from_program in closure Python annidate.
+
+    Args:
+        expr (Expression): La radice dell'albero da compilare.
+    Return:
+        CompiledExpression: La forma compilata, eseguibile con il metodo evaluate(env).
+    """
+    return CompiledExpression(expr)
+
+
+def run_compiled(expr, env):
+    # Compila l'albero ed esegue la forma compilata nell'ambiente dato
+    return compile(expr).evaluate(env)
@@ -0,0 +1,45 @@
+#Tommaso Mingrone [SM3201286]
+
+from expr import InvalidArgumentError
+from compiler import run_compiled
+from vm import run_vm
+from frames import run_resolved
+from iterative import run_iterative
+from scheduler import run_sliced
+from output import use_sink
+
+
+def run_tree(expr, env):
+    # Valutazione ricorsiva con i metodi evaluate dei nodi
+    return expr.evaluate(env)
+
+
+# Dizionario dei motori di esecuzione disponibili
+ENGINES = {
+    "tree": run_tree,
+    "closure": run_compiled,
+    "vm": run_vm,
+    "slots": run_resolved,
+    "iterative": run_iterative,
+    "sliced": run_sliced,
+}
+
+
+def run(expr, env, engine="tree", output=None):
+    """
+    Esegue un albero Expression con il motore scelto.
+
+    Args:
+        expr (Expression): L'albero costruito da Expression.from_program.
+        env (dict): L'ambiente di esecuzione, aggiornato come dal tree walker.
+        engine (str): Il nome del motore ("tree", "closure", "vm", "slots", "iterative" o "sliced").
+        output (Sink): Il sink su cui scrive print (opzionale; vedi output.py), svuotato al termine.
+    Return:
+        Il valore dell'espressione radice.
+    """
+    if engine not in ENGINES:
+        raise InvalidArgumentError(f"Motore di esecuzione sconosciuto: '{engine}'")
+    if output is None:
+        return ENGINES[engine](expr, env)
+    with use_sink(output):
+        return ENGINES[engine](expr, env)
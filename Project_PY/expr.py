@@ -1,5 +1,8 @@
 #Tommaso Mingrone [SM3201286]
 
+import contextvars
+
+
 class EmptyStackException(Exception):
     # Eccezione personalizzata per gestire errori di stack vuoto
     pass
@@ -50,6 +53,31 @@ class EvaluateMethodNotImplemented(Exception):
     pass
 
 
+# Tipi accettati come array da Setv; i moduli che introducono array compatti registrano i propri
+array_types = (list,)
+
+
+def register_array_type(cls):
+    # Aggiunge una classe ai tipi di array su cui Setv può scrivere
+    global array_types
+    if cls not in array_types:
+        array_types = array_types + (cls,)
+
+
+# Destinazione dell'output di Print durante la valutazione (vedi output.use_sink);
+# con None il valore viene stampato con print sullo standard output corrente
+output_sink = contextvars.ContextVar("output_sink", default=None)
+
+
+def emit(value):
+    # Scrive il valore stampato da Print (e dalle sue versioni negli altri motori) sul sink corrente
+    sink = output_sink.get()
+    if sink is None:
+        print(value)
+    else:
+        sink.write(value)
+
+
 class Stack:
     # Classe per implementare uno stack con operazioni di base
 
@@ -63,11 +91,9 @@ class Stack:
 
     # Metodo per rimuovere e restituire l'elemento in cima allo stack
     def pop(self):
-        if self.data == []:
+        if not self.data:
             raise EmptyStackException
-        res = self.data[-1]
-        self.data = self.data[:-1]
-        return res
+        return self.data.pop()  # Rimozione in O(1), senza copiare la lista
     
     # Metodo per verificare la lunghezza dello stack
     def size(self):
@@ -79,7 +105,9 @@ class Stack:
 
 
 class Expression:
-    # Classe base per le espressioni
+    # Classe base per le espressioni. Le sottoclassi dichiarano __slots__: i nodi non hanno un
+    # __dict__ e occupano meno memoria (le sottoclassi senza __slots__, negli altri moduli, lo riacquistano)
+    __slots__ = ()
 
     def __init__(self):
         # Previene l'istanziazione diretta di questa classe
@@ -100,15 +128,38 @@ class Expression:
         Return:
             Expression: Un oggetto Expression che rappresenta l'albero dell'espressione costruito.
         """
+        return cls.from_tokens(text.split(), dispatch)
+
+    @classmethod
+    def from_tokens(cls, tokens, dispatch):
+        """
+        Costruisce l'albero dell'espressione da una sequenza di token già separati.
+        La sequenza viene consumata una sola volta, quindi può essere un iteratore
+        che legge i token in modo incrementale (vedi stream_parser).
+
+        Args:
+            tokens (iterable): I token del programma in notazione polacca inversa.
+            dispatch (dict): Il dizionario che mappa i simboli alle classi di operazioni.
+        Return:
+            Expression: La radice dell'albero dell'espressione.
+        """
 
         stack = Stack()  # Inizializza uno stack vuoto per processare l'espressione
+        # Foglie già create, per token: ogni numero e ogni nome corrisponde a un solo nodo condiviso
+        leaves = {}
 
-        for token in text.split():
+        for token in tokens:
             # Itera su ogni token nella stringa di input
 
-            if token.isdigit():
+            leaf = leaves.get(token)
+            if leaf is not None:
+                # Numero o variabile già incontrati: riusa lo stesso nodo (le foglie non vengono mai modificate)
+                stack.push(leaf)
+
+            elif token.isdigit():
                 # Se il token è un numero, crea un oggetto Constant e aggiungilo allo stack
-                stack.push(Constant(int(token)))
+                leaf = leaves[token] = Constant(int(token))
+                stack.push(leaf)
 
             elif token in dispatch:
                 # Se il token è un operatore (presente in dispatch), procedi alla creazione dell'operazione
@@ -130,7 +181,8 @@ class Expression:
 
             else:
                 # Se il token è una variabile, crea un oggetto Variable e aggiungilo allo stack
-                stack.push(Variable(token))
+                leaf = leaves[token] = Variable(token)
+                stack.push(leaf)
 
         if stack.size() != 1:
             # Alla fine dell'elaborazione, dovrebbe rimanere un solo elemento nello stack (l'albero dell'espressione completo)
@@ -143,9 +195,15 @@ class Expression:
     def evaluate(self, env):
         raise EvaluateMethodNotImplemented("Il metodo evaluate deve essere implementato dalle sottoclassi di Expression")
 
+    # Valuta l'espressione su colonne di valori (una riga per ambiente): vedi batch.evaluate_batch
+    def evaluate_batch(self, columns, names=None):
+        from batch import evaluate_batch  # Import locale: batch dipende da questo modulo e da NumPy
+        return evaluate_batch(self, columns, names)
+
 
 class Variable(Expression):
 # Classe per rappresentare le variabili
+    __slots__ = ("name",)
     
     def __init__(self, name):
         self.name = name
@@ -163,6 +221,7 @@ class Variable(Expression):
 
 class Constant(Expression):
     # Classe per rappresentare le costanti
+    __slots__ = ("value",)
 
     def __init__(self, value):
         self.value = value
@@ -178,6 +237,7 @@ class Constant(Expression):
 
 class Operation(Expression):
     # Classe base per le operazioni
+    __slots__ = ("args",)
 
     def __init__(self, args):
 
@@ -205,6 +265,7 @@ class Operation(Expression):
 
 class Alloc(Expression):
 # La classe Alloc inizializza una variabile con valore 0 nell'ambiente di esecuzione
+    __slots__ = ("var_name",)
     
     arity = 1
 
@@ -221,6 +282,7 @@ class Alloc(Expression):
 
 class Valloc(Expression):
 # Valloc alloca un array di dimensione specificata e lo inizializza a zero nell'ambiente
+    __slots__ = ("size_expr", "var_name")
     
     arity = 2
 
@@ -236,16 +298,21 @@ class Valloc(Expression):
             raise InvalidArithmeticOperationException("La dimensione dell'array deve essere un intero non negativo")
         
         var_name = str(self.var_name)
-        env[var_name] = [0] * size  #Inizializza l'array a 0
+        env[var_name] = self.allocate(size)  #Inizializza l'array a 0
 
         return None
 
+    # Crea l'array inizializzato a 0; le sottoclassi possono usare una rappresentazione compatta
+    def allocate(self, size):
+        return [0] * size
+
     def __str__(self):
         return f"valloc({self.size_expr}, {self.var_name})"
 
     
 class Setq(Expression):
     # Setq assegna un nuovo valore a una variabile esistente nell'ambiente
+    __slots__ = ("expr", "var_name")
 
     arity = 2
 
@@ -264,6 +331,7 @@ class Setq(Expression):
 
 class Setv(Expression):
     # Setv assegna un valore a un elemento specifico di un array nell'ambiente
+    __slots__ = ("expr", "index", "var_name")
 
     arity = 3
 
@@ -290,14 +358,16 @@ class Setv(Expression):
             raise InvalidArithmeticOperationException("L'indice deve essere un intero non negativo")
 
         var_name = str(self.var_name)
-        if var_name not in env or not isinstance(env[var_name], list):
+        array = env[var_name] if var_name in env else None
+        if not isinstance(array, array_types):
             raise VariableNotFoundException("La variabile specificata non esiste o non è un array")
 
-        if index >= len(env[var_name]):
-            raise ArrayIndexOutOfBoundsException("Indice fuori dai limiti dell'array")
-
-        # Imposta il valore all'indice specificato di var_name in env
-        env[var_name][index] = value_to_set
+        # Imposta il valore all'indice specificato di var_name in env: il controllo
+        # sul limite superiore è quello dell'array stesso (IndexError)
+        try:
+            array[index] = value_to_set
+        except IndexError:
+            raise ArrayIndexOutOfBoundsException("Indice fuori dai limiti dell'array") from None
         return value_to_set
 
     def __str__(self):
@@ -307,6 +377,7 @@ class Setv(Expression):
     
 class Prog2(Expression):
  # Prog2 esegue due espressioni e restituisce il risultato della prima
+    __slots__ = ("expr1", "expr2")
     
     arity = 2
     
@@ -329,6 +400,7 @@ class Prog2(Expression):
 
 class Prog3(Expression):
 # Prog3 esegue tre espressioni e restituisce il risultato della prima
+    __slots__ = ("expr1", "expr2", "expr3")
 
     arity = 3
     
@@ -354,6 +426,7 @@ class Prog3(Expression):
     
 class Prog4(Expression):
 # Prog4 esegue quattro espressioni e restituisce il risultato della prima
+    __slots__ = ("expr1", "expr2", "expr3", "expr4")
 
     arity = 4
     
@@ -378,10 +451,31 @@ class Prog4(Expression):
     
     def __str__(self):
         return f"prog4 ({self.expr1}, {self.expr2}, {self.expr3}, {self.expr4})"
+
+
+class ProgN(Expression):
+# ProgN esegue una sequenza di espressioni da destra a sinistra e restituisce il risultato della prima.
+# Generalizza Prog2, Prog3 e Prog4 e viene prodotta dall'ottimizzatore quando appiattisce i prog annidati
+    __slots__ = ("exprs",)
+
+    def __init__(self, args):
+        self.exprs = list(args)
+
+    def evaluate(self, env):
+        exprs = self.exprs
+        # Valuta le espressioni dall'ultima alla seconda
+        for i in range(len(exprs) - 1, 0, -1):
+            exprs[i].evaluate(env)
+        # Valuta la prima espressione e ne ritorna il risultato
+        return exprs[0].evaluate(env)
+
+    def __str__(self):
+        return f"progn ({', '.join(str(expr) for expr in self.exprs)})"
     
 
 class If(Expression):
     # If valuta una condizione e esegue una delle due espressioni a seconda del risultato della condizione
+    __slots__ = ("if_no", "if_yes", "cond")
 
     arity = 3
 
@@ -416,6 +510,7 @@ class If(Expression):
     
 class While(Expression):
     # While esegue un'espressione ripetutamente finché una condizione specificata è vera
+    __slots__ = ("expr", "cond")
 
     arity = 2
 
@@ -435,6 +530,7 @@ class While(Expression):
 
 class For(Expression):
     # For esegue un'espressione per un numero specificato di volte, controllato da un indice
+    __slots__ = ("expr", "end", "start", "i_var")
 
     arity = 4
 
@@ -462,6 +558,7 @@ class For(Expression):
 
 class DefSub(Expression):
 # DefSub definisce una subroutine (funzione) e la associa a un nome nell'ambiente
+    __slots__ = ("expr", "function_name")
 
     arity = 2
 
@@ -480,6 +577,7 @@ class DefSub(Expression):
 
 class Call(Expression):
 # Call esegue una subroutine definita precedentemente nell'ambiente
+    __slots__ = ("function_name",)
 
     arity = 1
 
@@ -488,8 +586,9 @@ class Call(Expression):
 
     def evaluate(self, env):
         # Recupera la subroutine dal nome della funzione nell'ambiente
-        if str(self.function_name) in env:
-            function_expr = env[str(self.function_name)]
+        name = str(self.function_name)
+        if name in env:
+            function_expr = env[name]
             return function_expr.evaluate(env)
         else:
             raise FunctionNotFoundException(f"La subroutine '{self.function_name}' non è definita")
@@ -499,7 +598,8 @@ class Call(Expression):
 
 
 class Print(Expression):
-# Print stampa il risultato di un'espressione nell'ambiente
+# Print stampa il risultato di un'espressione nell'ambiente, sul sink di output corrente
+    __slots__ = ("expr",)
 
     arity = 1
 
@@ -517,7 +617,7 @@ class Print(Expression):
         else:
             result = self.expr  # Gestisce i valori costanti
 
-        print(result)
+        emit(result)
         return result
 
     def __str__(self):
@@ -526,6 +626,7 @@ class Print(Expression):
 
 class Nop(Expression):
 # Nop rappresenta un'operazione che non esegue alcuna azione (No Operation)
+    __slots__ = ()
     
     arity = 0
 
@@ -539,9 +640,87 @@ class Nop(Expression):
     def __str__(self):
         return "nop"
 
-    
+
+# Nodi introdotti da licm.hoist, che riusano il valore di un sottoalbero puro.
+# Solo i valori immutabili si possono riusare: un array (ad esempio prodotto da "v v +")
+# deve restare un oggetto nuovo a ogni valutazione
+REUSABLE = (int, float, bool, complex)
+
+
+class ValueCell:
+    # Valore di un sottoalbero puro e ambiente in cui è stato calcolato (None: da ricalcolare)
+
+    __slots__ = ("env", "value")
+
+    def __init__(self):
+        self.env = None
+        self.value = None
+
+
+class CachedValue(Expression):
+    """
+    Sottoalbero puro il cui valore viene riusato finché la cella appartiene all'ambiente
+    corrente. Il valore si calcola alla prima valutazione, nella posizione originale:
+    eccezioni e ordine dell'output restano quelli dell'albero di partenza.
+    """
+    __slots__ = ("expr", "cell")
+
+    def __init__(self, expr, cell):
+        self.expr = expr
+        self.cell = cell
+
+    def evaluate(self, env):
+        cell = self.cell
+        if cell.env is env:
+            return cell.value
+        value = self.expr.evaluate(env)
+        if type(value) in REUSABLE:
+            cell.value = value
+            cell.env = env
+        return value
+
+    def __str__(self):
+        return f"cached({self.expr})"
+
+
+class StoreValue(CachedValue):
+    # Prima occorrenza di una sottoespressione comune: calcola sempre il valore e lo lascia nella cella
+    __slots__ = ()
+
+    def evaluate(self, env):
+        value = self.expr.evaluate(env)
+        cell = self.cell
+        if type(value) in REUSABLE:
+            cell.value = value
+            cell.env = env
+        else:
+            cell.env = None
+        return value
+
+    def __str__(self):
+        return f"store({self.expr})"
+
+
+class ResetCells(Expression):
+    # Eseguito all'ingresso di un ciclo: invalida i valori invarianti calcolati nell'esecuzione precedente
+    __slots__ = ("cells",)
+
+    def __init__(self, cells):
+        self.cells = cells
+
+    def evaluate(self, env):
+        for cell in self.cells:
+            cell.env = None
+        return None
+
+    def __str__(self):
+        return f"reset({len(self.cells)})"
+
+
 class BinaryOp(Operation):
     # Classe base per operazioni binarie (due operandi)
+    __slots__ = ("x", "y")
+
     arity = 2
 
     def __init__(self, args):
@@ -552,6 +731,8 @@ class BinaryOp(Operation):
 
 class UnaryOp(Operation):
     # Classe base per operazioni unarie (un solo operando)
+    __slots__ = ("x",)
+
     arity = 1
 
     def __init__(self, args):
@@ -561,6 +742,8 @@ class UnaryOp(Operation):
 
 class Addition(BinaryOp):
     # Implementa l'addizione
+    __slots__ = ()
+
     def op(self, x, y):
         return y + x
     
@@ -570,6 +753,8 @@ class Addition(BinaryOp):
 
 class Subtraction(BinaryOp):
     # Implementa la sottrazione
+    __slots__ = ()
+
     def op(self, x, y):
         return y - x
     
@@ -579,6 +764,8 @@ class Subtraction(BinaryOp):
 
 class Division(BinaryOp):
     # Implementa la divisione
+    __slots__ = ()
+
     def op(self, x, y):
         if x == 0:
             raise DivisionByZeroException("La divisione per zero non è consentita")
@@ -590,6 +777,8 @@ class Division(BinaryOp):
 
 class Multiplication(BinaryOp):
     # Implementa la moltiplicazione
+    __slots__ = ()
+
     def op(self, x, y):
         return y * x
     
@@ -599,6 +788,8 @@ class Multiplication(BinaryOp):
 
 class Power(BinaryOp):
     # Implementa l'elevazione a potenza
+    __slots__ = ()
+
     def op(self, x, y):
         return y ** x
     
@@ -608,6 +799,8 @@ class Power(BinaryOp):
 
 class Modulus(BinaryOp):
     # Implementa l'operazione di modulo
+    __slots__ = ()
+
     def op(self, x, y):
         return y % x
     
@@ -617,6 +810,8 @@ class Modulus(BinaryOp):
 
 class Reciprocal(UnaryOp):
     # Implementa il calcolo del reciproco di un numero
+    __slots__ = ()
+
     def op(self, y):
         if y == 0:
             raise DivisionByZeroException("La divisione per zero non è consentita")
@@ -628,6 +823,8 @@ class Reciprocal(UnaryOp):
 
 class AbsoluteValue(UnaryOp):
     # Calcola il valore assoluto di un numero
+    __slots__ = ()
+
     def op(self, y):
         return abs(y)
 
@@ -637,6 +834,8 @@ class AbsoluteValue(UnaryOp):
 
 class Major(BinaryOp):
     # Confronta due valori per determinare se il primo è maggiore del secondo
+    __slots__ = ()
+
     def op(self, x, y):
         return y > x
 
@@ -646,6 +845,8 @@ class Major(BinaryOp):
 
 class Minor(BinaryOp):
     # Confronta due valori per determinare se il primo è minore del secondo
+    __slots__ = ()
+
     def op(self, x, y):
         return y < x
 
@@ -655,6 +856,8 @@ class Minor(BinaryOp):
 
 class MajorEq(BinaryOp):
     # Confronta due valori per determinare se il primo è maggiore o uguale al secondo
+    __slots__ = ()
+
     def op(self, x, y):
         return y >= x
 
@@ -664,6 +867,8 @@ class MajorEq(BinaryOp):
 
 class MinorEq(BinaryOp):
     # Confronta due valori per determinare se il primo è minore o uguale al secondo
+    __slots__ = ()
+
     def op(self, x, y):
         return y <= x
 
@@ -673,6 +878,8 @@ class MinorEq(BinaryOp):
 
 class Equal(BinaryOp):
     # Confronta due valori per determinare se sono uguali
+    __slots__ = ()
+
     def op(self, x, y):
         return y == x
 
@@ -682,6 +889,8 @@ class Equal(BinaryOp):
 
 class NotEqual(BinaryOp):
     # Confronta due valori per determinare se sono diversi
+    __slots__ = ()
+
     def op(self, x, y):
         return y != x
 
@@ -721,11 +930,12 @@ d = {
     "nop": Nop
     }
 
-example = "nop x print prime if nop 0 0 != prime setq i x % 0 = if 1 x - 2 i for 0 0 = prime setq prime alloc prog4 100 2 x for"
-e = Expression.from_program(example, d)
-print(e)
-res = e.evaluate({})
-print(res)
+if __name__ == "__main__":
+    example = "nop x print prime if nop 0 0 != prime setq i x % 0 = if 1 x - 2 i for 0 0 = prime setq prime alloc prog4 100 2 x for"
+    e = Expression.from_program(example, d)
+    print(e)
+    res = e.evaluate({})
+    print(res)
 
 """
 Esempi di codice project_python.pdf + teams:
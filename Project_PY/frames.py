@@ -0,0 +1,345 @@
+#Tommaso Mingrone [SM3201286]
+
+from collections.abc import Mapping
+
+import expr as expr_module
+from expr import (
+    Expression, Variable, Constant, Operation, Alloc, Valloc, Setq, Setv,
+    If, For, DefSub, Call, Print,
+    MissingVariableException, InvalidArithmeticOperationException,
+    ArrayIndexOutOfBoundsException, VariableNotFoundException, FunctionNotFoundException,
+)
+from ast_tools import rebuild
+
+
+# Sentinella per gli slot non ancora assegnati
+UNBOUND = object()
+
+# Tipi di operando di una operazione risolta
+SLOT, EXPR, CONST = 0, 1, 2
+
+
+class SymbolTable:
+    # Associa a ogni nome di variabile o subroutine uno slot intero del frame
+
+    def __init__(self):
+        self.names = []        # Slot -> nome
+        self.slots = {}        # Nome -> slot
+        self.originals = {}    # Corpo di subroutine risolto -> corpo originale
+        self.resolved = {}     # Corpo di subroutine originale -> corpo risolto
+
+    def slot(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+        return self.slots[name]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class SlotRef(Expression):
+    # Lettura di una variabile tramite il suo slot nel frame
+
+    def __init__(self, name, slot):
+        self.name = name
+        self.slot = slot
+
+    def evaluate(self, frame):
+        value = frame[self.slot]
+        if value is UNBOUND:
+            raise MissingVariableException(f"Valore mancante per la variabile '{self.name}'")
+        return value
+
+    def __str__(self):
+        return str(self.name)
+
+
+class SlotOperation:
+    # Mixin per le operazioni risolte: gli operandi sono slot, espressioni o costanti già classificati
+
+    def evaluate(self, frame):
+        values = []
+        for kind, payload, name in self.operands:
+            if kind == SLOT:
+                value = frame[payload]
+                if value is UNBOUND:
+                    raise MissingVariableException(f"Valore mancante per la variabile '{name}'")
+                values.append(value)
+            elif kind == EXPR:
+                values.append(payload.evaluate(frame))
+            else:
+                values.append(payload)
+        return self.op(*values)
+
+
+# Classi delle operazioni risolte, create alla prima occorrenza di ciascuna classe di operazione
+_slot_operation_classes = {}
+
+
+def slot_operation_class(cls):
+    if cls not in _slot_operation_classes:
+        _slot_operation_classes[cls] = type("Slot" + cls.__name__, (SlotOperation, cls), {})
+    return _slot_operation_classes[cls]
+
+
+class SlotAlloc(Alloc):
+    # Alloc su frame: azzera lo slot della variabile
+
+    def __init__(self, args, slot):
+        super().__init__(args)
+        self.slot = slot
+
+    def evaluate(self, frame):
+        frame[self.slot] = 0
+        return None
+
+
+class SlotValloc(Valloc):
+    # Valloc su frame: crea l'array nello slot della variabile, con l'allocatore del nodo originale
+
+    def __init__(self, args, slot, allocate):
+        super().__init__(args)
+        self.slot = slot
+        self.allocate = allocate
+
+    def evaluate(self, frame):
+        size = self.size_expr.evaluate(frame)
+        if not isinstance(size, int) or size < 0:
+            raise InvalidArithmeticOperationException("La dimensione dell'array deve essere un intero non negativo")
+        frame[self.slot] = self.allocate(size)
+        return None
+
+
+class SlotSetq(Setq):
+    # Setq su frame: assegna il valore allo slot della variabile
+
+    def __init__(self, args, slot):
+        super().__init__(args)
+        self.slot = slot
+
+    def evaluate(self, frame):
+        new_value = self.expr.evaluate(frame) if isinstance(self.expr, Expression) else self.expr
+        frame[self.slot] = new_value
+        return new_value
+
+
+class SlotSetv(Setv):
+    # Setv su frame: l'indice è già un'espressione (eventualmente SlotRef) o una costante
+
+    def __init__(self, args, slot):
+        super().__init__(args)
+        self.slot = slot
+
+    def evaluate(self, frame):
+        value_to_set = self.expr.evaluate(frame)
+        index = self.index.evaluate(frame) if isinstance(self.index, Expression) else self.index
+
+        if not isinstance(index, int) or index < 0:
+            raise InvalidArithmeticOperationException("L'indice deve essere un intero non negativo")
+
+        array = frame[self.slot]
+        if not isinstance(array, expr_module.array_types):
+            raise VariableNotFoundException("La variabile specificata non esiste o non è un array")
+
+        try:
+            array[index] = value_to_set
+        except IndexError:
+            raise ArrayIndexOutOfBoundsException("Indice fuori dai limiti dell'array") from None
+        return value_to_set
+
+
+class SlotFor(For):
+    # For su frame: la variabile di controllo vive in uno slot
+
+    def __init__(self, args, slot):
+        super().__init__(args)
+        self.slot = slot
+
+    def evaluate(self, frame):
+        start_val = self.start.evaluate(frame) if isinstance(self.start, Expression) else self.start
+        end_val = self.end.evaluate(frame) if isinstance(self.end, Expression) else self.end
+        slot = self.slot
+        expr = self.expr
+
+        for i in range(start_val, end_val):
+            frame[slot] = i
+            expr.evaluate(frame)
+        return None
+
+
+class SlotDefSub(DefSub):
+    # DefSub su frame: il corpo risolto viene salvato nello slot della subroutine
+
+    def __init__(self, args, slot):
+        super().__init__(args)
+        self.slot = slot
+
+    def evaluate(self, frame):
+        frame[self.slot] = self.expr
+        return None
+
+
+class SlotCall(Call):
+    # Call su frame: il corpo della subroutine si trova nello slot, senza ricerche per nome
+
+    def __init__(self, args, slot):
+        super().__init__(args)
+        self.slot = slot
+
+    def evaluate(self, frame):
+        function_expr = frame[self.slot]
+        if function_expr is UNBOUND:
+            raise FunctionNotFoundException(f"La subroutine '{self.function_name}' non è definita")
+        return function_expr.evaluate(frame)
+
+
+class Resolver:
+    # Sostituisce i nomi di variabile con slot interi e i nodi che accedono all'ambiente con le versioni su frame
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+
+    # Operando flessibile: i nomi di variabile diventano SlotRef
+    def operand(self, arg):
+        if isinstance(arg, Expression):
+            return self.visit(arg)
+        if isinstance(arg, str):
+            return SlotRef(arg, self.symbols.slot(arg))
+        return arg
+
+    # Operando valutato o restituito così com'è: solo le espressioni vengono risolte
+    def value(self, arg):
+        return self.visit(arg) if isinstance(arg, Expression) else arg
+
+    def visit(self, node):
+        symbols = self.symbols
+
+        if isinstance(node, SlotRef):
+            return node
+        if type(node) is Variable:
+            return SlotRef(node.name, symbols.slot(node.name))
+
+        if isinstance(node, Operation):
+            args = [self.operand(arg) for arg in node.args]
+            resolved = slot_operation_class(type(node))(args)
+            resolved.operands = tuple(
+                (SLOT, arg.slot, arg.name) if type(arg) is SlotRef
+                else (CONST, arg.value, None) if type(arg) is Constant
+                else (EXPR, arg, None) if isinstance(arg, Expression)
+                else (CONST, arg, None)
+                for arg in args
+            )
+            return resolved
+
+        if type(node) is If:
+            return If([self.value(node.if_no), self.value(node.if_yes), self.operand(node.cond)])
+        if type(node) is Print:
+            return Print([self.operand(node.expr)])
+        if type(node) is Alloc:
+            return SlotAlloc([node.var_name], symbols.slot(node.var_name))
+        if isinstance(node, Valloc):
+            return SlotValloc([self.value(node.size_expr), node.var_name], symbols.slot(str(node.var_name)),
+                              node.allocate)
+        if type(node) is Setq:
+            return SlotSetq([self.value(node.expr), node.var_name], symbols.slot(node.var_name))
+        if type(node) is Setv:
+            return SlotSetv([self.value(node.expr), self.operand(node.index), node.var_name],
+                            symbols.slot(str(node.var_name)))
+        if type(node) is For:
+            return SlotFor([self.value(node.expr), self.value(node.end), self.value(node.start), node.i_var],
+                           symbols.slot(str(node.i_var)))
+        if type(node) is DefSub:
+            return SlotDefSub([self.subroutine(node.expr), node.function_name],
+                              symbols.slot(str(node.function_name)))
+        if type(node) is Call:
+            return SlotCall([node.function_name], symbols.slot(str(node.function_name)))
+
+        return rebuild(node, self.visit)
+
+    # Risolve il corpo di una subroutine una sola volta, ricordando l'originale per l'esportazione
+    def subroutine(self, body):
+        if not isinstance(body, Expression):
+            return body
+        symbols = self.symbols
+        if body not in symbols.resolved:
+            resolved = self.visit(body)
+            symbols.resolved[body] = resolved
+            symbols.originals[resolved] = body
+        return symbols.resolved[body]
+
+
+def resolve(expr, symbols=None):
+    """
+    Assegna a ogni nome di variabile e di subroutine uno slot intero e produce
+    un albero equivalente che legge e scrive un frame (lista) invece di un dizionario.
+
+    Args:
+        expr (Expression): La radice dell'albero (non viene modificata).
+        symbols (SymbolTable): Una tabella esistente da estendere (opzionale).
+    Return:
+        tuple: L'albero risolto e la SymbolTable usata.
+    """
+    symbols = symbols if symbols is not None else SymbolTable()
+    return Resolver(symbols).visit(expr), symbols
+
+
+def make_frame(symbols, env):
+    # Crea il frame a partire da un ambiente dizionario; le subroutine presenti vengono risolte
+    resolver = Resolver(symbols)
+    frame = []
+    while len(frame) < len(symbols):
+        name = symbols.names[len(frame)]
+        value = env[name] if name in env else UNBOUND
+        if isinstance(value, Expression):
+            value = resolver.subroutine(value)
+        frame.append(value)
+    return frame
+
+
+class FrameView(Mapping):
+    # Vista nome -> valore del frame, con i corpi delle subroutine riportati agli alberi originali
+
+    def __init__(self, frame, symbols):
+        self.frame = frame
+        self.symbols = symbols
+
+    def __getitem__(self, name):
+        slot = self.symbols.slots.get(name)
+        if slot is None or slot >= len(self.frame) or self.frame[slot] is UNBOUND:
+            raise KeyError(name)
+        value = self.frame[slot]
+        if isinstance(value, Expression):
+            return self.symbols.originals.get(value, value)
+        return value
+
+    def __iter__(self):
+        for slot, name in enumerate(self.symbols.names):
+            if slot < len(self.frame) and self.frame[slot] is not UNBOUND:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    # Copia del frame come dizionario nome -> valore
+    def to_dict(self):
+        return dict(self.items())
+
+
+def run_resolved(expr, env):
+    """
+    Risolve l'albero ed esegue la valutazione ricorsiva su un frame a slot.
+    Al termine (anche in caso di eccezione) i valori del frame vengono riportati in env.
+
+    Args:
+        expr (Expression): La radice dell'albero.
+        env (dict): L'ambiente di esecuzione.
+    Return:
+        Il valore dell'espressione radice.
+    """
+    resolved, symbols = resolve(expr)
+    frame = make_frame(symbols, env)
+    try:
+        return resolved.evaluate(frame)
+    finally:
+        env.update(FrameView(frame, symbols))
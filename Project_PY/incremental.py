@@ -0,0 +1,187 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import heapq
+import json
+import sys
+import time
+
+from expr import Expression, Variable, Constant, MissingVariableException, InvalidArgumentError, d
+from ast_tools import children, iter_nodes, iter_postorder
+from optimizer import PURE_OPERATIONS
+from compact import value_key
+
+
+def same_value(old, new):
+    # Vero se il nuovo valore è indistinguibile dal vecchio (1, 1.0 e True sono diversi, come 0.0 e -0.0)
+    return type(old) is type(new) and value_key(old) == value_key(new)
+
+
+class IncrementalEvaluator:
+    """
+    Valuta un'espressione pura (variabili, costanti e operazioni aritmetiche) conservando
+    il valore di ogni sottoalbero. Dopo update vengono ricalcolati solo i nodi che leggono
+    le variabili cambiate e, risalendo, i loro antenati; la propagazione si ferma ai nodi
+    il cui valore non cambia. Il costo dipende quindi dalla modifica, non dalla dimensione
+    dell'albero.
+    """
+
+    def __init__(self, expr, env=None):
+        self.order = list(iter_postorder(expr))  # Ogni nodo segue i suoi figli
+        for node in self.order:
+            if type(node) not in (Variable, Constant) and type(node) not in PURE_OPERATIONS:
+                raise InvalidArgumentError(f"La valutazione incrementale richiede un'espressione pura: '{node}'")
+        self.root = expr
+        self.index = {id(node): i for i, node in enumerate(self.order)}
+        self.parents = [[] for _ in self.order]
+        self.readers = {}   # Nome di variabile -> nodi che la leggono direttamente
+        for i, node in enumerate(self.order):
+            for name in self.reads(node):
+                self.readers.setdefault(name, []).append(i)
+            # Un figlio ripetuto (ad esempio una costante condivisa dal parser) si collega una volta sola
+            for child in dict.fromkeys(map(id, children(node))):
+                self.parents[self.index[child]].append(i)
+
+        self.env = dict(env or {})
+        self.values = [None] * len(self.order)
+        self.pending = set(range(len(self.order)))  # Nodi da (ri)calcolare
+        self.recomputed = 0        # Nodi ricalcolati dall'ultima chiamata a value
+        self.total_recomputed = 0
+        self.evaluations = 0
+
+    @staticmethod
+    def reads(node):
+        # Variabili lette direttamente dal nodo
+        if type(node) is Variable:
+            return {node.name}
+        if type(node) is Constant:
+            return set()
+        return {arg for arg in node.args if isinstance(arg, str)}
+
+    def dependencies(self, node=None):
+        # Variabili da cui dipende il valore del nodo (default: la radice), calcolate su richiesta
+        names = set()
+        for child in iter_nodes(node if node is not None else self.root):
+            names |= self.reads(child)
+        return names
+
+    def update(self, bindings=(), **names):
+        """
+        Cambia il valore di alcune variabili e invalida i nodi che le leggono.
+
+        Args:
+            bindings (dict): Nome della variabile -> nuovo valore.
+            **names: Altre variabili da aggiornare, come argomenti con nome.
+        Return:
+            int: Il numero di nodi invalidati direttamente.
+        """
+        invalidated = 0
+        for name, value in list(dict(bindings).items()) + list(names.items()):
+            if name in self.env and same_value(self.env[name], value):
+                continue
+            self.env[name] = value
+            readers = self.readers.get(name, ())
+            self.pending.update(readers)
+            invalidated += len(readers)
+        return invalidated
+
+    def remove(self, name):
+        # Elimina una variabile: i nodi che la leggono solleveranno MissingVariableException
+        if name in self.env:
+            del self.env[name]
+            self.pending.update(self.readers.get(name, ()))
+
+    def lookup(self, name):
+        if name in self.env:
+            return self.env[name]
+        raise MissingVariableException(f"Valore mancante per la variabile '{name}'")
+
+    def compute(self, node):
+        # Valore del nodo a partire dai valori già aggiornati dei figli, come Operation.evaluate
+        if type(node) is Variable:
+            return self.lookup(node.name)
+        if type(node) is Constant:
+            return node.value
+        args = []
+        for arg in node.args:
+            if isinstance(arg, Expression):
+                args.append(self.values[self.index[id(arg)]])
+            elif isinstance(arg, str):
+                args.append(self.lookup(arg))
+            else:
+                args.append(arg)
+        return node.op(*args)
+
+    def value(self):
+        """
+        Ricalcola i nodi invalidati, dal basso verso l'alto, e restituisce il valore della radice.
+        Se un nodo solleva un'eccezione, i nodi non ancora ricalcolati restano invalidati.
+
+        Return:
+            Il valore dell'espressione con le variabili correnti.
+        """
+        self.evaluations += 1
+        self.recomputed = 0
+        heap = list(self.pending)
+        heapq.heapify(heap)
+        while heap:
+            i = heapq.heappop(heap)
+            if i not in self.pending:
+                continue
+            new = self.compute(self.order[i])
+            self.pending.discard(i)
+            self.recomputed += 1
+            self.total_recomputed += 1
+            old = self.values[i]
+            self.values[i] = new
+            if old is None or not same_value(old, new):
+                for parent in self.parents[i]:
+                    if parent not in self.pending:
+                        self.pending.add(parent)
+                        heapq.heappush(heap, parent)
+        return self.values[-1]
+
+    def __str__(self):
+        return (f"IncrementalEvaluator(nodi={len(self.order)}, valutazioni={self.evaluations}, "
+                f"ricalcolati={self.recomputed}, totale ricalcolati={self.total_recomputed})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rivaluta un'espressione pura per ogni riga di assegnamenti JSON")
+    parser.add_argument("program", help="File con l'espressione")
+    parser.add_argument("updates", nargs="?", help="File con un oggetto JSON di assegnamenti per riga (default: stdin)")
+    parser.add_argument("--env", default="{}", help="Ambiente iniziale in formato JSON")
+    parser.add_argument("--time", action="store_true", help="Riporta su stderr il riepilogo della valutazione")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Ogni riga produce il valore della radice e il numero di nodi ricalcolati
+    args = parse_args(argv)
+    with open(args.program) as f:
+        expr = Expression.from_program(f.read(), d)
+    evaluator = IncrementalEvaluator(expr, json.loads(args.env))
+    start = time.perf_counter()
+    stream = open(args.updates) if args.updates else sys.stdin
+    try:
+        for line in (line.strip() for line in stream):
+            if not line:
+                continue
+            evaluator.update(json.loads(line))
+            try:
+                result = {"value": evaluator.value()}
+            except Exception as exc:
+                result = {"error": {"type": type(exc).__name__, "message": str(exc)}}
+            result["recomputed"] = evaluator.recomputed
+            print(json.dumps(result, default=str), flush=True)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    if args.time:
+        print(f"{evaluator} in {time.perf_counter() - start:.3f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#Tommaso Mingrone [SM3201286]
+
+import expr as expr_module
+from expr import (
+    Expression, Operation, Valloc, Setq, Setv, Prog2, Prog3, Prog4, ProgN,
+    If, While, For, DefSub, Call, Print,
+    MissingVariableException, InvalidArithmeticOperationException,
+    ArrayIndexOutOfBoundsException, VariableNotFoundException, FunctionNotFoundException, emit,
+)
+from ast_tools import children
+
+
+# Altezza massima dei sottoalberi valutati direttamente con evaluate, cioè con la ricorsione di Python.
+# I sottoalberi più alti, e quelli che contengono una call, passano dalla pila esplicita
+DIRECT_HEIGHT = 32
+
+# Altezza assegnata ai sottoalberi con una call: il corpo della subroutine può essere arbitrariamente profondo
+UNBOUNDED = float("inf")
+
+
+# Ogni gestore è un generatore che riproduce il metodo evaluate della sua classe: invece di chiamare
+# evaluate su un figlio lo cede (yield) al ciclo di valutazione, che gli restituisce il valore con send
+
+def _flexible(arg, env):
+    # Operando che non è un'espressione: nome di variabile o valore costante
+    if isinstance(arg, str):
+        if arg in env:
+            return env[arg]
+        raise MissingVariableException(f"Valore mancante per la variabile '{arg}'")
+    return arg
+
+
+def _operation(node, env):
+    values = []
+    for arg in node.args:
+        values.append((yield arg) if isinstance(arg, Expression) else _flexible(arg, env))
+    return node.op(*values)
+
+
+def _valloc(node, env):
+    size = yield node.size_expr
+    if not isinstance(size, int) or size < 0:
+        raise InvalidArithmeticOperationException("La dimensione dell'array deve essere un intero non negativo")
+    env[str(node.var_name)] = node.allocate(size)
+    return None
+
+
+def _setq(node, env):
+    value = (yield node.expr) if isinstance(node.expr, Expression) else node.expr
+    env[node.var_name] = value
+    return value
+
+
+def _setv(node, env):
+    value = yield node.expr
+    index = (yield node.index) if isinstance(node.index, Expression) else _flexible(node.index, env)
+    if not isinstance(index, int) or index < 0:
+        raise InvalidArithmeticOperationException("L'indice deve essere un intero non negativo")
+
+    var_name = str(node.var_name)
+    array = env[var_name] if var_name in env else None
+    if not isinstance(array, expr_module.array_types):
+        raise VariableNotFoundException("La variabile specificata non esiste o non è un array")
+    try:
+        array[index] = value
+    except IndexError:
+        raise ArrayIndexOutOfBoundsException("Indice fuori dai limiti dell'array") from None
+    return value
+
+
+def _prog2(node, env):
+    yield node.expr2
+    return (yield node.expr1)
+
+
+def _prog3(node, env):
+    yield node.expr3
+    yield node.expr2
+    return (yield node.expr1)
+
+
+def _prog4(node, env):
+    yield node.expr4
+    yield node.expr3
+    yield node.expr2
+    return (yield node.expr1)
+
+
+def _progn(node, env):
+    exprs = node.exprs
+    for i in range(len(exprs) - 1, 0, -1):
+        yield exprs[i]
+    return (yield exprs[0])
+
+
+def _if(node, env):
+    condition = (yield node.cond) if isinstance(node.cond, Expression) else _flexible(node.cond, env)
+    branch = node.if_yes if condition else node.if_no
+    return (yield branch) if isinstance(branch, Expression) else branch
+
+
+def _while(node, env):
+    while (yield node.cond):
+        yield node.expr
+    return None
+
+
+def _for(node, env):
+    start = (yield node.start) if isinstance(node.start, Expression) else node.start
+    end = (yield node.end) if isinstance(node.end, Expression) else node.end
+    name = str(node.i_var)
+    for i in range(start, end):
+        env[name] = i
+        yield node.expr
+    return None
+
+
+def _call(node, env):
+    name = str(node.function_name)
+    if name not in env:
+        raise FunctionNotFoundException(f"La subroutine '{node.function_name}' non è definita")
+    return (yield env[name])
+
+
+def _print(node, env):
+    result = (yield node.expr) if isinstance(node.expr, Expression) else _flexible(node.expr, env)
+    emit(result)
+    return result
+
+
+# Gestori per classe di nodo. I nodi senza gestore (foglie, alloc, defsub, nop e le classi
+# che ridefiniscono evaluate) vengono valutati direttamente con il loro metodo evaluate
+HANDLERS = {
+    Operation: _operation,
+    Valloc: _valloc,
+    Setq: _setq,
+    Setv: _setv,
+    Prog2: _prog2,
+    Prog3: _prog3,
+    Prog4: _prog4,
+    ProgN: _progn,
+    If: _if,
+    While: _while,
+    For: _for,
+    Call: _call,
+    Print: _print,
+}
+
+# Gestore già risolto per ciascuna classe concreta
+_handler_cache = {}
+
+
+def handler_for(cls):
+    """
+    Trova il gestore di una classe di nodo risalendo la MRO fino alla prima classe che
+    definisce evaluate: una sottoclasse che eredita evaluate (le operazioni aritmetiche,
+    TypedValloc) usa il gestore della classe base, una che lo ridefinisce (VectorFor,
+    i nodi di frames) viene valutata con il proprio evaluate.
+
+    Args:
+        cls (type): La classe del nodo.
+    Return:
+        Il generatore che valuta il nodo, oppure None.
+    """
+    if cls in _handler_cache:
+        return _handler_cache[cls]
+    handler = None
+    for klass in cls.__mro__:
+        if "evaluate" in vars(klass):
+            handler = HANDLERS.get(klass)
+            break
+    _handler_cache[cls] = handler
+    return handler
+
+
+class IterativeEvaluator:
+    """
+    Valuta un albero Expression con una pila esplicita di generatori al posto della pila
+    delle chiamate di Python, così la profondità di annidamento (catene di prog, aritmetica
+    annidata, call ricorsive) è limitata solo dalla memoria. L'ordine di valutazione e le
+    eccezioni sono quelli dei metodi evaluate.
+
+    I sottoalberi bassi e senza call vengono valutati direttamente con evaluate: sui programmi
+    poco profondi la velocità resta quella del tree walker.
+    """
+
+    def __init__(self):
+        self.heights = {}     # Nodo -> altezza del sottoalbero valutato (UNBOUNDED se contiene una call)
+
+    def height(self, root):
+        # Altezza dei sottoalberi, calcolata in post-ordine senza ricorsione e memorizzata per nodo
+        heights = self.heights
+        stack = [root]
+        while stack:
+            node = stack[-1]
+            if node in heights:
+                stack.pop()
+                continue
+            # Il corpo di una defsub non viene valutato dalla defsub stessa
+            kids = [] if isinstance(node, DefSub) else children(node)
+            pending = [child for child in kids if child not in heights]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if isinstance(node, Call):
+                heights[node] = UNBOUNDED
+            else:
+                heights[node] = 1 + max((heights[child] for child in kids), default=0)
+        return heights[root]
+
+    def is_direct(self, node):
+        if not isinstance(node, Expression):
+            return True
+        height = self.heights.get(node)
+        if height is None:
+            height = self.height(node)
+        return height <= DIRECT_HEIGHT or handler_for(type(node)) is None
+
+    def evaluate(self, expr, env):
+        """
+        Valuta l'espressione nell'ambiente dato.
+
+        Args:
+            expr (Expression): La radice dell'albero.
+            env (dict): L'ambiente di esecuzione, aggiornato come dal tree walker.
+        Return:
+            Il valore dell'espressione radice.
+        """
+        if self.is_direct(expr):
+            return expr.evaluate(env)
+
+        stack = [handler_for(type(expr))(expr, env)]
+        value = None
+        while stack:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            if self.is_direct(child):
+                # Un operando che non è un'espressione solleva la stessa eccezione del tree walker
+                value = child.evaluate(env)
+            else:
+                stack.append(handler_for(type(child))(child, env))
+                value = None
+        return value
+
+
+def run_iterative(expr, env):
+    # Valutazione con la pila esplicita (vedi IterativeEvaluator)
+    return IterativeEvaluator().evaluate(expr, env)
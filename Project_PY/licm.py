@@ -0,0 +1,409 @@
+#Tommaso Mingrone [SM3201286]
+
+import copy
+
+from expr import (
+    Expression, Variable, Constant, Operation, Alloc, Valloc, Setq, Setv,
+    Prog2, Prog3, Prog4, ProgN, If, While, For, DefSub, Call, Print, Nop,
+    ValueCell, CachedValue, StoreValue, ResetCells,
+)
+from ast_tools import child_fields, children, rebuild, iter_nodes, iter_postorder
+from optimizer import PURE_OPERATIONS
+from compact import value_key
+
+
+# Operazioni che una sottoespressione comune deve contenere per essere riusata
+MIN_SHARED_OPERATIONS = 2
+
+
+class Effects:
+    # Variabili lette e scritte da un sottoalbero; unknown se contiene una call dagli effetti non noti
+
+    __slots__ = ("reads", "writes", "unknown")
+
+    def __init__(self, reads=frozenset(), writes=frozenset(), unknown=False):
+        self.reads = frozenset(reads)
+        self.writes = frozenset(writes)
+        self.unknown = unknown
+
+    def __or__(self, other):
+        return Effects(self.reads | other.reads, self.writes | other.writes, self.unknown or other.unknown)
+
+    def __eq__(self, other):
+        return (self.reads, self.writes, self.unknown) == (other.reads, other.writes, other.unknown)
+
+
+NO_EFFECTS = Effects()
+UNKNOWN_EFFECTS = Effects(unknown=True)
+
+
+class EffectAnalysis:
+    """
+    Calcola le variabili lette e scritte da ogni sottoalbero (setq, setv, alloc, valloc,
+    for, defsub) e la chiave strutturale dei sottoalberi puri. Gli effetti di una call
+    sono quelli dei corpi che le defsub dell'albero associano al nome, calcolati fino
+    al punto fisso per le subroutine ricorsive; una call a un nome senza defsub
+    nell'albero, o scritto anche da altri nodi, ha effetti sconosciuti.
+    """
+
+    def __init__(self, root):
+        self.bodies = {}      # Nome -> corpi definiti dalle defsub
+        rebound = set()       # Nomi scritti anche da nodi diversi da defsub
+        for node in iter_nodes(root):
+            if isinstance(node, DefSub):
+                self.bodies.setdefault(str(node.function_name), []).append(node.expr)
+            elif isinstance(node, (Alloc, Setq, Valloc, Setv)):
+                rebound.add(str(node.var_name))
+            elif isinstance(node, For):
+                rebound.add(str(node.i_var))
+        self.subroutines = {name: NO_EFFECTS for name in self.bodies if name not in rebound}
+
+        # Gli effetti delle subroutine crescono a ogni passata: ci si ferma quando non cambiano più
+        while True:
+            self.effects = self.compute(root)
+            changed = False
+            for name in self.subroutines:
+                total = NO_EFFECTS
+                for body in self.bodies[name]:
+                    if isinstance(body, Expression):
+                        total = total | self.effects[id(body)]
+                if total != self.subroutines[name]:
+                    self.subroutines[name] = total
+                    changed = True
+            if not changed:
+                break
+
+        self.keys = {}        # id del nodo -> chiave strutturale, per i sottoalberi puri
+        self.sizes = {}       # id del nodo -> operazioni del sottoalbero puro
+        for node in iter_postorder(root):
+            key = self.key(node)
+            if key is not None:
+                self.keys[id(node)] = key
+                self.sizes[id(node)] = isinstance(node, Operation) + sum(
+                    self.sizes[id(child)] for child in children(node))
+
+    def compute(self, root):
+        effects = {}
+        for node in iter_postorder(root):
+            total = self.own(node)
+            if not isinstance(node, DefSub):  # Il corpo di una defsub viene eseguito solo dalle call
+                for child in children(node):
+                    total = total | effects[id(child)]
+            effects[id(node)] = total
+        return effects
+
+    def own(self, node):
+        # Effetti del nodo, esclusi quelli dei figli
+        if type(node) is Variable:
+            return Effects(reads=(node.name,))
+        if isinstance(node, Operation):
+            return Effects(reads=[arg for arg in node.args if isinstance(arg, str)])
+        if isinstance(node, (Constant, Nop, Prog2, Prog3, Prog4, ProgN, While, CachedValue, ResetCells)):
+            return NO_EFFECTS
+        if isinstance(node, (If, Print)):
+            value = node.cond if isinstance(node, If) else node.expr
+            return Effects(reads=(value,)) if isinstance(value, str) else NO_EFFECTS
+        if isinstance(node, Setv):
+            reads = (node.index,) if isinstance(node.index, str) else ()
+            return Effects(reads=reads, writes=(str(node.var_name),))
+        if isinstance(node, (Alloc, Setq, Valloc)):
+            return Effects(writes=(str(node.var_name),))
+        if isinstance(node, For):
+            return Effects(writes=(str(node.i_var),))
+        if isinstance(node, DefSub):
+            return Effects(writes=(str(node.function_name),))
+        if isinstance(node, Call):
+            return self.subroutines.get(str(node.function_name), UNKNOWN_EFFECTS)
+        return UNKNOWN_EFFECTS  # Nodo di un'altra trasformazione: nessuna ipotesi
+
+    def key(self, node):
+        # Chiave strutturale di un nodo puro (i figli sono già stati visitati); None se non è puro
+        if type(node) is Variable:
+            return Variable, node.name
+        if type(node) is Constant:
+            return (Constant,) + value_key(node.value)
+        if type(node) not in PURE_OPERATIONS:
+            return None
+        parts = [type(node)]
+        for arg in node.args:
+            if isinstance(arg, Expression):
+                key = self.keys.get(id(arg))
+                if key is None:
+                    return None
+                parts.append(key)
+            elif isinstance(arg, str):
+                parts.append((Variable, arg))  # Un operando nome si legge come una Variable
+            else:
+                parts.append((Constant,) + value_key(arg))
+        return tuple(parts)
+
+    def candidate(self, node):
+        # Operazione pura che legge variabili: quelle sulle sole costanti le calcola in anticipo optimize
+        return isinstance(node, Operation) and id(node) in self.keys and bool(self.effects[id(node)].reads)
+
+
+class HoistReport:
+    # Risultato di hoist: sottoalberi resi invarianti, riusi delle sottoespressioni comuni e cicli interessati
+
+    def __init__(self):
+        self.hoisted = 0
+        self.loops = 0
+        self.shared = 0
+        self.skipped_loops = 0   # Cicli con call dagli effetti sconosciuti
+
+    def __str__(self):
+        return (f"invarianti: {self.hoisted} in {self.loops} cicli "
+                f"(cicli esclusi per call sconosciute: {self.skipped_loops}); "
+                f"sottoespressioni comuni riusate: {self.shared}")
+
+
+class LoopScope:
+    # Ciclo che racchiude il nodo visitato: variabili che scrive (None se sconosciute) e celle da invalidare
+
+    def __init__(self, writes):
+        self.writes = writes
+        self.cells = {}   # Chiave strutturale -> ValueCell
+
+
+class Hoister:
+    # Sostituisce i sottoalberi puri invarianti con CachedValue, invalidati all'ingresso del ciclo più esterno possibile
+
+    def __init__(self, analysis, report):
+        self.analysis = analysis
+        self.report = report
+        self.loops = []
+
+    def visit(self, node):
+        if self.analysis.candidate(node) and self.loops:
+            scope = self.target(node)
+            if scope is not None:
+                key = self.analysis.keys[id(node)]
+                if key not in scope.cells:
+                    scope.cells[key] = ValueCell()
+                self.report.hoisted += 1
+                return CachedValue(node, scope.cells[key])
+        if type(node) in (While, For):
+            return self.loop(node)
+        if isinstance(node, (While, For)):
+            return node  # Cicli già trasformati (ad esempio da vectorize)
+        if isinstance(node, DefSub):
+            # Il corpo può essere eseguito da una call fuori dal ciclo
+            saved, self.loops = self.loops, []
+            try:
+                return rebuild(node, self.visit)
+            finally:
+                self.loops = saved
+        return rebuild(node, self.visit)
+
+    def target(self, node):
+        # Il ciclo più esterno in cui nessuna iterazione scrive le variabili lette dal nodo
+        reads = self.analysis.effects[id(node)].reads
+        found = None
+        for scope in reversed(self.loops):
+            if scope.writes is None or reads & scope.writes:
+                break
+            found = scope
+        return found
+
+    def loop(self, node):
+        effects = self.analysis.effects[id(node)]
+        if effects.unknown:
+            self.report.skipped_loops += 1
+        new = copy.copy(node)
+        if type(node) is For:
+            # start ed end si valutano una volta, prima delle iterazioni
+            new.start = self.child(node.start)
+            new.end = self.child(node.end)
+        scope = LoopScope(None if effects.unknown else effects.writes)
+        self.loops.append(scope)
+        try:
+            new.expr = self.child(node.expr)
+            if type(node) is While:
+                new.cond = self.child(node.cond)
+        finally:
+            self.loops.pop()
+        if scope.cells:
+            self.report.loops += 1
+            return Prog2([new, ResetCells(list(scope.cells.values()))])
+        if all(getattr(new, field) is getattr(node, field) for field in child_fields(node)):
+            return node
+        return new
+
+    def child(self, value):
+        return self.visit(value) if isinstance(value, Expression) else value
+
+
+class Sharer:
+    """
+    Riusa le sottoespressioni pure ripetute. L'albero si visita due volte nell'ordine
+    di valutazione del tree walker: la prima decide quali occorrenze sono precedute,
+    su ogni percorso, da una occorrenza identica senza scritture intermedie delle
+    variabili lette; la seconda sostituisce la prima occorrenza con StoreValue e le
+    successive con CachedValue.
+    """
+
+    def __init__(self, analysis, report):
+        self.analysis = analysis
+        self.report = report
+
+    def run(self, root):
+        self.decisions = []   # Per ogni occorrenza candidata, in ordine: ("def" | "use", gruppo)
+        self.uses = {}        # Gruppo -> numero di riusi
+        self.rewrite = False
+        self.available = {}
+        self.visit(root)
+
+        self.rewrite = True
+        self.index = 0
+        self.cells = {}
+        self.available = {}
+        return self.visit(root)
+
+    def kill(self, effects):
+        # Dimentica le sottoespressioni che leggono variabili scritte da effects
+        if effects.unknown:
+            self.available.clear()
+        elif effects.writes:
+            self.available = {key: entry for key, entry in self.available.items()
+                              if not entry[1] & effects.writes}
+
+    def candidate(self, node):
+        analysis = self.analysis
+        index = len(self.decisions) if not self.rewrite else self.index
+        if not self.rewrite:
+            key = analysis.keys[id(node)]
+            entry = self.available.get(key)
+            # Una StoreValue costa un nodo: conviene solo per i sottoalberi con almeno due operazioni
+            if entry is not None and analysis.sizes[id(node)] >= MIN_SHARED_OPERATIONS:
+                self.decisions.append(("use", entry[0]))
+                self.uses[entry[0]] += 1
+                return node
+            self.decisions.append(None)
+            rebuild(node, self.visit)
+            group = len(self.uses)
+            self.uses[group] = 0
+            self.decisions[index] = ("def", group)
+            self.available[key] = (group, analysis.effects[id(node)].reads)
+            return node
+
+        self.index += 1
+        kind, group = self.decisions[index]
+        if group not in self.cells:
+            self.cells[group] = ValueCell()
+        if kind == "use":
+            self.report.shared += 1
+            return CachedValue(node, self.cells[group])
+        new = rebuild(node, self.visit)
+        if self.uses[group]:
+            return StoreValue(new, self.cells[group])
+        return new
+
+    def visit(self, node):
+        if not isinstance(node, Expression):
+            return node
+        analysis = self.analysis
+        if analysis.candidate(node):
+            return self.candidate(node)
+        if isinstance(node, (CachedValue, ResetCells, Variable, Constant, Nop)):
+            return node
+        if isinstance(node, Operation):
+            return self.sequence(node, list(range(len(node.args))), "args")
+        if isinstance(node, ProgN):
+            # Le espressioni di una sequenza si valutano dall'ultima alla prima
+            return self.sequence(node, list(reversed(range(len(node.exprs)))), "exprs")
+        if isinstance(node, (Prog2, Prog3, Prog4)):
+            return self.fields(node, reversed(child_fields(node)))
+        if isinstance(node, (Setq, Valloc, Setv, Print)):
+            new = self.fields(node, child_fields(node))
+            self.kill(analysis.own(node))
+            return new
+        if isinstance(node, Alloc):
+            self.kill(analysis.own(node))
+            return node
+        if isinstance(node, If):
+            new = self.fields(node, ["cond"])
+            saved = self.available
+            updates = {}
+            for field in ("if_yes", "if_no"):
+                self.available = dict(saved)
+                updates[field] = self.visit(getattr(node, field))
+            self.available = saved
+            self.kill(analysis.effects[id(node.if_yes)] if isinstance(node.if_yes, Expression) else NO_EFFECTS)
+            self.kill(analysis.effects[id(node.if_no)] if isinstance(node.if_no, Expression) else NO_EFFECTS)
+            return self.updated(new, updates)
+        if type(node) in (While, For):
+            new = self.fields(node, ["start", "end"] if isinstance(node, For) else [])
+            # Ogni iterazione vede solo le sottoespressioni che il ciclo non può invalidare
+            effects = analysis.effects[id(node)]
+            saved = self.available
+            self.available = dict(saved)
+            self.kill(effects)
+            new = self.fields(new, ["cond", "expr"] if isinstance(node, While) else ["expr"], original=node)
+            self.available = saved
+            self.kill(effects)
+            return new
+        if isinstance(node, DefSub):
+            saved, self.available = self.available, {}
+            new = self.fields(node, ["expr"])
+            self.available = saved
+            self.kill(analysis.own(node))
+            return new
+        # Call e nodi di altre trasformazioni: nessuna visita all'interno
+        self.kill(analysis.effects[id(node)])
+        return node
+
+    def fields(self, node, names, original=None):
+        # Visita gli attributi nell'ordine dato; original è il nodo da cui leggere i figli originali
+        source = original if original is not None else node
+        updates = {}
+        for field in names:
+            old = getattr(source, field)
+            new = self.visit(old) if isinstance(old, Expression) else old
+            if new is not getattr(node, field):
+                updates[field] = new
+        return self.updated(node, updates)
+
+    def updated(self, node, updates):
+        updates = {field: value for field, value in updates.items() if value is not getattr(node, field)}
+        if not updates or not self.rewrite:
+            return node
+        new = copy.copy(node)
+        for field, value in updates.items():
+            setattr(new, field, value)
+        return new
+
+    def sequence(self, node, order, attribute):
+        # Operation e ProgN: figli in lista, visitati nell'ordine di valutazione
+        values = list(getattr(node, attribute))
+        for i in order:
+            values[i] = self.visit(values[i])
+        if not self.rewrite or all(new is old for new, old in zip(values, getattr(node, attribute))):
+            return node
+        if isinstance(node, ProgN):
+            return ProgN(values)
+        new_children = iter([new for new, old in zip(values, node.args) if isinstance(old, Expression)])
+        return rebuild(node, lambda child: next(new_children))
+
+
+def hoist(expr, invariants=True, common=True):
+    """
+    Evita di ricalcolare i sottoalberi puri: quelli che dipendono solo da variabili
+    che un ciclo while o for non scrive vengono calcolati una volta per ogni ingresso
+    nel ciclo, e le sottoespressioni ripetute vengono riusate se nessun nodo intermedio
+    scrive le variabili che leggono. Un ciclo che contiene una call dagli effetti
+    sconosciuti resta com'è. I nodi introdotti sono eseguiti da tutti i motori: tree,
+    iterative, sliced, closure, slots e vm.
+
+    Args:
+        expr (Expression): La radice dell'albero (non viene modificata).
+        invariants (bool): Se spostare fuori dai cicli i sottoalberi invarianti.
+        common (bool): Se riusare le sottoespressioni comuni.
+    Return:
+        tuple: Il nuovo albero e un HoistReport.
+    """
+    report = HoistReport()
+    if invariants:
+        expr = Hoister(EffectAnalysis(expr), report).visit(expr)
+    if common:
+        expr = Sharer(EffectAnalysis(expr), report).run(expr)
+    return expr, report
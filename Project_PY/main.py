@@ -0,0 +1,127 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import json
+import sys
+import time
+
+from expr import d
+from engines import ENGINES, run
+from stream_parser import parse_file
+from program_cache import ProgramCache
+from optimizer import optimize
+from vectorize import vectorize
+from calls import cache_calls, parse_memoize
+from compact import hash_cons
+from licm import hoist
+from profiler import profile
+from output import SINKS, DEFAULT_BUFFER_SIZE, make_sink
+from vm import generate, disassemble
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Interprete per il linguaggio in notazione polacca inversa")
+    parser.add_argument("program", nargs="?", help="File con il programma (default: stdin)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="tree", help="Motore di esecuzione")
+    parser.add_argument("--env", default="{}", help="Ambiente iniziale in formato JSON")
+    parser.add_argument("--optimize", action="store_true", help="Ottimizza l'albero prima di eseguirlo")
+    parser.add_argument("--vectorize", action="store_true",
+                        help="Esegue con NumPy i cicli for che riempiono un array (motore tree)")
+    parser.add_argument("--hoist", action="store_true",
+                        help="Calcola una volta per ciclo i sottoalberi invarianti e riusa le sottoespressioni comuni")
+    parser.add_argument("--hash-cons", action="store_true",
+                        help="Condivide i sottoalberi puri identici (l'albero diventa un DAG) e riporta la memoria risparmiata")
+    parser.add_argument("--cache-calls", action="store_true",
+                        help="Risolve il corpo delle subroutine una sola volta per ogni call (motori tree e iterative)")
+    parser.add_argument("--memoize", action="append", metavar="NOME:INGRESSI:RISULTATO",
+                        help="Memorizza i risultati di una subroutine pura, ad esempio f:x,y:r (implica --cache-calls)")
+    parser.add_argument("--disassemble", action="store_true", help="Stampa il codice della macchina virtuale ed esce")
+    parser.add_argument("--cache-dir", help="Directory in cui conservare gli alberi già analizzati")
+    parser.add_argument("--profile", nargs="?", const="", metavar="FILE",
+                        help="Profila l'esecuzione (motore tree): report su stderr e pile per flamegraph in FILE")
+    parser.add_argument("--output", choices=SINKS, default="buffered",
+                        help="Destinazione dell'output di print (default: buffered sullo standard output)")
+    parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE,
+                        help="Caratteri accumulati prima di scrivere sullo standard output")
+    parser.add_argument("--flush-lines", type=int, default=None, help="Scrive l'output ogni N righe stampate")
+    parser.add_argument("--time", action="store_true", help="Riporta su stderr il tempo di parsing e di esecuzione")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.cache_dir:
+        # Con la cache su disco il programma viene letto per intero e analizzato solo se necessario
+        if args.program:
+            with open(args.program) as f:
+                text = f.read()
+        else:
+            text = sys.stdin.read()
+        cache = ProgramCache(directory=args.cache_dir, compact=args.hash_cons)
+        e = cache.get(text, d)
+        if args.time:
+            print(f"parsing: {cache}", file=sys.stderr)
+    else:
+        # Legge i token in modo incrementale dal file indicato o dallo standard input
+        e, stats = parse_file(args.program or "-", d)
+        if args.time:
+            print(f"parsing: {stats}", file=sys.stderr)
+
+    if args.optimize:
+        e, report = optimize(e)
+        if args.time:
+            print(f"ottimizzazione: {report}", file=sys.stderr)
+
+    if args.vectorize:
+        e, count = vectorize(e)
+        if args.time:
+            print(f"vettorizzazione: {count} cicli for", file=sys.stderr)
+
+    if args.hoist:
+        e, hoisted = hoist(e)
+        if args.time:
+            print(f"hoisting: {hoisted}", file=sys.stderr)
+
+    if args.hash_cons:
+        e, compaction = hash_cons(e)
+        if args.time:
+            print(f"hash-consing: {compaction}", file=sys.stderr)
+
+    if args.cache_calls or args.memoize:
+        e, calls = cache_calls(e, parse_memoize(args.memoize))
+
+    if args.disassemble:
+        print(disassemble(generate(e)))
+        return 0
+
+    env = json.loads(args.env)
+    profiled = None
+    if args.profile is not None:
+        # Le sonde del profiler funzionano con la valutazione ricorsiva dei nodi
+        e, profiled = profile(e)
+        args.engine = "tree"
+    start = time.perf_counter()
+    sink = make_sink(args.output, args.buffer_size, args.flush_lines)
+    res = run(e, env, args.engine, sink)
+    elapsed = time.perf_counter() - start
+    if args.output == "list":
+        sys.stdout.write(sink.getvalue())
+    print(res)
+
+    if profiled is not None:
+        print(profiled.report(), file=sys.stderr)
+        if args.profile:
+            profiled.write_collapsed(args.profile)
+
+    if args.time and sink is not None:
+        print(f"output: {sink}", file=sys.stderr)
+    if args.time and (args.cache_calls or args.memoize):
+        print(f"subroutine: {calls}", file=sys.stderr)
+    if args.time:
+        print(f"{args.engine}: {elapsed:.6f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,473 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+from expr import InvalidArgumentError
+
+try:
+    import numpy as np
+except ImportError:  # NumPy è necessario solo per calcolare le immagini
+    np = None
+
+
+# Dominio del piano complesso e raggio di fuga, come in Project_C
+X_MIN, X_MAX = -2.0, 1.0
+Y_MIN, Y_MAX = -1.0, 1.0
+REGION = (X_MIN, X_MAX, Y_MIN, Y_MAX)
+RADIUS = 2.0
+
+# Gli array dei punti attivi vengono compattati quando i punti sfuggiti superano questa frazione
+COMPACT_RATIO = 1.25
+
+# Righe per blocco assegnate ai processi: blocchi piccoli bilanciano le righe lente al centro
+TILES_PER_PROCESS = 8
+
+# Scorciatoie facoltative: ciascuna produce la stessa immagine del calcolo completo
+SHORTCUTS = ("cardioid", "periodicity", "subdivide")
+
+# Margine dei test della cardioide e del bulbo: i punti troppo vicini al bordo vengono iterati
+CARDIOID_MARGIN = 1e-12
+
+# Rettangoli con un lato di al più tante righe o colonne vengono calcolati punto per punto
+MIN_RECTANGLE = 8
+
+
+class ShortcutReport:
+    # Passi calcolati (punti per iterazione) e passi risparmiati da ciascuna scorciatoia
+
+    def __init__(self):
+        self.computed = 0
+        self.cardioid = 0      # Punti nella cardioide principale o nel bulbo di periodo 2
+        self.periodicity = 0   # Orbite che tornano esattamente su un valore già visto
+        self.subdivision = 0   # Interni dei rettangoli con il bordo uniforme
+        self.filled = 0        # Punti riempiti senza calcolarli
+
+    def add(self, other):
+        for name in ("computed", "cardioid", "periodicity", "subdivision", "filled"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @property
+    def saved(self):
+        return self.cardioid + self.periodicity + self.subdivision
+
+    def __str__(self):
+        total = self.computed + self.saved
+        ratio = self.saved / total if total else 0.0
+        return (f"passi calcolati: {self.computed:,}; risparmiati: cardioide/bulbo {self.cardioid:,}, "
+                f"periodicità {self.periodicity:,}, suddivisione {self.subdivision:,} "
+                f"({self.filled:,} punti riempiti); totale risparmiato {ratio:.1%}")
+
+
+def parse_shortcuts(names):
+    # Elenco di scorciatoie (stringa separata da virgole o sequenza), con controllo dei nomi
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(",") if name.strip()]
+    names = tuple(names or ())
+    for name in names:
+        if name not in SHORTCUTS:
+            raise InvalidArgumentError(f"Scorciatoia sconosciuta: '{name}' (disponibili: {', '.join(SHORTCUTS)})")
+    return names
+
+
+def _require_numpy():
+    if np is None:
+        raise InvalidArgumentError("Il calcolo dell'insieme di Mandelbrot richiede NumPy")
+
+
+def columns_for(nrows):
+    # Risoluzione orizzontale di main.c: (int)(1.5 * nrows)
+    return int(1.5 * nrows)
+
+
+def coordinates(nrows, ncols, start=0, stop=None, region=REGION):
+    """
+    Coordinate dei pixel delle righe [start, stop) calcolate con le stesse operazioni
+    di calculateMandelbrot, quindi con gli stessi double.
+
+    Args:
+        nrows (int): Le righe dell'immagine.
+        ncols (int): Le colonne dell'immagine.
+        start (int): La prima riga.
+        stop (int): La riga dopo l'ultima (default: nrows).
+        region (tuple): x minimo, x massimo, y minimo e y massimo (default: il dominio del C).
+    Return:
+        tuple: Le parti reali (una per colonna) e immaginarie (una per riga).
+    """
+    _require_numpy()
+    stop = nrows if stop is None else stop
+    x_min, x_max, y_min, y_max = region
+    with np.errstate(all="ignore"):  # Con una sola riga o colonna il C divide per zero (NaN)
+        x0 = x_min + (x_max - x_min) * np.arange(ncols, dtype=np.float64) / (ncols - 1)
+        y0 = y_min + (y_max - y_min) * np.arange(start, stop, dtype=np.float64) / (nrows - 1)
+    return x0, y0
+
+
+def iterate(cr, ci, zr, zi, first_step, max_iter, radius=RADIUS, periodicity=False, report=None):
+    """
+    Esegue i passi first_step..max_iter di z = z * z + c per punti che hanno già
+    compiuto first_step - 1 passi senza sfuggire. I punti sfuggiti vengono tolti dagli
+    array su cui si calcola (a gruppi, per non copiarli a ogni passo). Parte reale e
+    immaginaria si calcolano come il prodotto complesso del C, e |z| con hypot, come cabs.
+
+    Con periodicity ogni z viene confrontato con un valore di riferimento rinnovato ai
+    passi first_step, 2 * first_step, 4 * first_step, ... (come nel metodo di Brent):
+    un'orbita che torna esattamente sullo stesso double si ripeterà per sempre senza
+    sfuggire, quindi il punto ha max_iter iterazioni come nel calcolo completo. Questi
+    punti non compaiono tra quelli non sfuggiti.
+
+    Args:
+        cr, ci (ndarray): Le parti reale e immaginaria dei punti (monodimensionali).
+        zr, zi (ndarray): Il valore corrente di z per ciascun punto (non vengono modificati).
+        first_step (int): Il primo passo da eseguire (1 partendo da z = 0).
+        max_iter (int): L'ultimo passo.
+        radius (float): Il raggio di fuga.
+        periodicity (bool): Se fermare le orbite periodiche.
+        report (ShortcutReport): Dove sommare i passi risparmiati dalla periodicità (facoltativo).
+    Return:
+        tuple: Le iterazioni (int32: il passo di fuga, o max_iter), gli indici dei punti
+        non sfuggiti con i loro zr e zi finali, e i passi calcolati (punti per iterazione).
+    """
+    counts = np.full(cr.size, max_iter, dtype=np.int32)
+    active = np.arange(cr.size)
+    zr = np.array(zr, dtype=np.float64)
+    zi = np.array(zi, dtype=np.float64)
+    alive = np.ones(cr.size, dtype=bool)  # Punti ancora attivi tra quelli negli array
+    alive_count = cr.size
+    work = 0
+    if periodicity:
+        ref_r, ref_i = zr.copy(), zi.copy()
+        refresh = first_step
+    with np.errstate(all="ignore"):
+        for step in range(first_step, max_iter + 1):
+            if not alive_count:
+                break
+            work += active.size
+            # Parte immaginaria: zr * zi + zi * zr, cioè il doppio esatto dello stesso prodotto
+            product = zr * zi
+            np.multiply(zr, zr, out=zr)
+            zr -= np.square(zi, out=zi)
+            zr += cr
+            np.add(product, product, out=zi)
+            zi += ci
+            inside = np.hypot(zr, zi) <= radius
+            inside &= alive
+            escaped = alive_count - np.count_nonzero(inside)
+            if escaped:
+                counts[active[alive & ~inside]] = step
+            if periodicity:
+                repeated = (zr == ref_r) & (zi == ref_i) & inside
+                cycles = np.count_nonzero(repeated)
+                if cycles:
+                    inside &= ~repeated
+                    escaped += cycles
+                    if report is not None:
+                        report.periodicity += cycles * (max_iter - step)
+                if step == refresh:
+                    ref_r[...] = zr
+                    ref_i[...] = zi
+                    refresh *= 2
+            if not escaped:
+                continue
+            alive = inside
+            alive_count -= escaped
+            # I punti sfuggiti restano negli array finché non sono abbastanza da giustificare una copia
+            if alive_count * COMPACT_RATIO < active.size:
+                active, zr, zi, cr, ci = active[alive], zr[alive], zi[alive], cr[alive], ci[alive]
+                if periodicity:
+                    ref_r, ref_i = ref_r[alive], ref_i[alive]
+                alive = np.ones(active.size, dtype=bool)
+    return counts, active[alive], zr[alive], zi[alive], work
+
+
+def in_cardioid_or_bulb(cr, ci):
+    """
+    Punti nella cardioide principale o nel bulbo di periodo 2, che non sfuggono mai:
+    q * (q + x - 1/4) <= y^2 / 4 con q = (x - 1/4)^2 + y^2, oppure (x + 1)^2 + y^2 <= 1/16.
+    I punti sul bordo (o molto vicini) sono esclusi con un margine, perché lì l'orbita
+    calcolata in double potrebbe comportarsi diversamente da quella esatta.
+
+    Args:
+        cr, ci (ndarray): Le parti reale e immaginaria dei punti.
+    Return:
+        ndarray: La maschera (bool) dei punti interni.
+    """
+    x = cr - 0.25
+    y2 = ci * ci
+    q = x * x + y2
+    cardioid = q * (q + x) < 0.25 * y2 - CARDIOID_MARGIN
+    bulb = (cr + 1.0) * (cr + 1.0) + y2 < 0.0625 - CARDIOID_MARGIN
+    return cardioid | bulb
+
+
+def escape_counts(cr, ci, max_iter, radius=RADIUS, shortcuts=(), report=None):
+    """
+    Numero di iterazioni di z = z * z + c (da z = 0) finché |z| <= radius, al massimo
+    max_iter, per ciascun punto, come il ciclo while di calculateMandelbrot.
+
+    Args:
+        cr (ndarray): Le parti reali dei punti.
+        ci (ndarray): Le parti immaginarie dei punti (con forma compatibile con cr).
+        max_iter (int): Il numero massimo di iterazioni.
+        radius (float): Il raggio di fuga.
+        shortcuts (tuple): Le scorciatoie da usare tra "cardioid" e "periodicity".
+        report (ShortcutReport): Dove sommare i passi calcolati e risparmiati (facoltativo).
+    Return:
+        ndarray: Le iterazioni (int32), con la forma dei punti.
+    """
+    _require_numpy()
+    shape = np.broadcast(cr, ci).shape
+    cr = np.broadcast_to(cr, shape).ravel()
+    ci = np.broadcast_to(ci, shape).ravel()
+    if max_iter <= 0:
+        return np.zeros(shape, dtype=np.int32)
+    counts = np.full(cr.size, max_iter, dtype=np.int32)
+    points = slice(None)
+    if "cardioid" in shortcuts and radius >= RADIUS:
+        points = np.flatnonzero(~in_cardioid_or_bulb(cr, ci))
+        if report is not None:
+            report.cardioid += (cr.size - points.size) * max_iter
+        cr, ci = cr[points], ci[points]
+    zeros = np.zeros(cr.size)
+    result, _, _, _, work = iterate(cr, ci, zeros, zeros, 1, max_iter, radius, "periodicity" in shortcuts, report)
+    counts[points] = result
+    if report is not None:
+        report.computed += work
+    return counts.reshape(shape)
+
+
+def subdivide(x0, y0, max_iter, shortcuts=(), report=None):
+    """
+    Iterazioni della griglia x0 * y0 con la suddivisione in rettangoli di Mariani-Silver:
+    si calcola il bordo di un rettangolo e, se tutti i punti del bordo hanno lo stesso
+    numero di iterazioni n < max_iter, l'interno viene riempito con n senza calcolarlo;
+    altrimenti il rettangolo si divide in due lungo il lato più lungo. Per ogni n
+    l'insieme dei punti con almeno n iterazioni è connesso e senza buchi, quindi un
+    bordo uniforme non può racchiudere valori diversi, a meno di racchiudere tutto
+    l'insieme (i rettangoli che contengono l'origine non si riempiono).
+    Sulla griglia il bordo è noto solo nei pixel, e i canali di punti esterni più
+    sottili di un pixel che entrano nell'insieme possono attraversarlo tra due punti:
+    per questo un rettangolo con il bordo tutto a max_iter non viene riempito, ma il
+    suo interno si calcola con il riconoscimento delle orbite periodiche, che è esatto.
+    I rettangoli di ogni livello si calcolano insieme, con una sola chiamata a
+    escape_counts per i bordi e una per gli interni.
+
+    Args:
+        x0 (ndarray): Le parti reali delle colonne.
+        y0 (ndarray): Le parti immaginarie delle righe.
+        max_iter (int): Il numero massimo di iterazioni.
+        shortcuts (tuple): Le altre scorciatoie da usare per i punti calcolati.
+        report (ShortcutReport): Dove sommare i passi calcolati e risparmiati (facoltativo).
+    Return:
+        ndarray: Le iterazioni (int32) con forma (righe, colonne).
+    """
+    _require_numpy()
+    counts = np.full((y0.size, x0.size), -1, dtype=np.int32)
+    pending = [(0, y0.size, 0, x0.size)] if counts.size else []
+    while pending:
+        # Bordi dei rettangoli di questo livello non ancora calcolati (i lati condivisi una volta sola)
+        borders = [_border(counts, *rect) for rect in pending]
+        _compute(counts, x0, y0, np.unique(np.concatenate(borders)), max_iter, shortcuts, report)
+
+        split, direct, interior = [], [], []
+        for (r0, r1, c0, c1), border in zip(pending, borders):
+            if r1 - r0 <= 2 or c1 - c0 <= 2:
+                continue  # Nessun punto interno
+            values = counts.flat[border]
+            value = values[0]
+            uniform = bool((values == value).all())
+            if uniform and value == max_iter:
+                interior.append((r0 + 1, r1 - 1, c0 + 1, c1 - 1))
+            elif uniform and not _encloses_origin(x0, y0, r0, r1, c0, c1):
+                filled = (r1 - r0 - 2) * (c1 - c0 - 2)
+                counts[r0 + 1:r1 - 1, c0 + 1:c1 - 1] = value
+                if report is not None:
+                    report.subdivision += filled * int(value)
+                    report.filled += filled
+            elif r1 - r0 <= MIN_RECTANGLE or c1 - c0 <= MIN_RECTANGLE:
+                direct.append((r0 + 1, r1 - 1, c0 + 1, c1 - 1))
+            elif r1 - r0 >= c1 - c0:
+                middle = (r0 + r1) // 2
+                split += [(r0, middle + 1, c0, c1), (middle, r1, c0, c1)]
+            else:
+                middle = (c0 + c1) // 2
+                split += [(r0, r1, c0, middle + 1), (r0, r1, middle, c1)]
+
+        for rects, names in ((direct, shortcuts), (interior, shortcuts + ("periodicity",))):
+            if rects:
+                inner = [np.ravel_multi_index(np.mgrid[r0:r1, c0:c1].reshape(2, -1), counts.shape)
+                         for r0, r1, c0, c1 in rects]
+                _compute(counts, x0, y0, np.concatenate(inner), max_iter, names, report)
+        pending = split
+    return counts
+
+
+def _border(counts, r0, r1, c0, c1):
+    # Indici (nella griglia appiattita) dei punti sul bordo del rettangolo [r0, r1) x [c0, c1)
+    rows = np.r_[np.full(c1 - c0, r0), np.full(c1 - c0, r1 - 1), np.arange(r0, r1), np.arange(r0, r1)]
+    cols = np.r_[np.arange(c0, c1), np.arange(c0, c1), np.full(r1 - r0, c0), np.full(r1 - r0, c1 - 1)]
+    return np.ravel_multi_index((rows, cols), counts.shape)
+
+
+def _encloses_origin(x0, y0, r0, r1, c0, c1):
+    # Vero se l'origine può cadere dentro il rettangolo (gli estremi possono essere in ordine inverso)
+    xs, ys = sorted((x0[c0], x0[c1 - 1])), sorted((y0[r0], y0[r1 - 1]))
+    return not (xs[0] > 0.0 or xs[1] < 0.0 or ys[0] > 0.0 or ys[1] < 0.0)
+
+
+def _compute(counts, x0, y0, indices, max_iter, shortcuts, report):
+    # Calcola i punti indicati che non hanno ancora un valore
+    indices = indices[counts.flat[indices] < 0]
+    if indices.size:
+        rows, cols = np.unravel_index(indices, counts.shape)
+        counts.flat[indices] = escape_counts(x0[cols], y0[rows], max_iter, shortcuts=shortcuts, report=report)
+
+
+def compute_rows(nrows, ncols, max_iter, start=0, stop=None, region=REGION, shortcuts=(), report=None):
+    # Iterazioni delle righe [start, stop) dell'immagine, come la matrice iterations del C
+    x0, y0 = coordinates(nrows, ncols, start, stop, region)
+    if "subdivide" in shortcuts:
+        return subdivide(x0, y0, max_iter, shortcuts, report)
+    return escape_counts(x0[np.newaxis, :], y0[:, np.newaxis], max_iter, shortcuts=shortcuts, report=report)
+
+
+def gray_table(max_iter):
+    """
+    Livello di grigio di setPixel per ogni numero di iterazioni da 0 a max_iter:
+    255 per i punti interni, altrimenti (unsigned char)(255 * log(n) / log(M)).
+    I logaritmi sono quelli della libreria C (math.log), come in pgm.c.
+
+    Args:
+        max_iter (int): Il numero massimo di iterazioni.
+    Return:
+        ndarray: La tabella (uint8) indicizzata dal numero di iterazioni.
+    """
+    _require_numpy()
+    table = np.empty(max_iter + 1, dtype=np.uint8)
+    log_max = math.log(max_iter) if max_iter > 1 else 0.0
+    for n in range(max_iter):
+        if n == 0:
+            table[n] = 0  # log(0) = -inf: il C converte un valore fuori intervallo (non raggiungibile con z = 0)
+        else:
+            table[n] = int(255 * (math.log(n) / log_max))
+    table[max_iter] = 255
+    return table
+
+
+def to_gray(counts, max_iter, table=None):
+    # Immagine in scala di grigi a partire dalle iterazioni
+    table = gray_table(max_iter) if table is None else table
+    return table[counts]
+
+
+def pgm_header(width, height):
+    # Intestazione scritta da savePGM
+    return f"P5\n{width} {height}\n255\n".encode("ascii")
+
+
+def _render_tile(job):
+    # Eseguito dai processi del pool: restituisce i byte delle righe del blocco e i passi risparmiati
+    nrows, ncols, max_iter, start, stop, shortcuts = job
+    report = ShortcutReport()
+    counts = compute_rows(nrows, ncols, max_iter, start, stop, shortcuts=shortcuts, report=report)
+    return start, to_gray(counts, max_iter).tobytes(), report
+
+
+def tiles(nrows, tile_rows):
+    # Blocchi di righe [start, stop) che coprono l'immagine
+    return [(start, min(start + tile_rows, nrows)) for start in range(0, nrows, tile_rows)]
+
+
+def render(nrows, max_iter, processes=None, tile_rows=None, ncols=None, shortcuts=(), report=None):
+    """
+    Calcola l'immagine dell'insieme di Mandelbrot di main.c, dividendo le righe in
+    blocchi calcolati da un pool di processi. Le scorciatoie non cambiano l'immagine.
+
+    Args:
+        nrows (int): La risoluzione verticale.
+        max_iter (int): Il numero massimo di iterazioni.
+        processes (int): Il numero di processi (default: i core); con 0 il calcolo avviene nel processo corrente.
+        tile_rows (int): Le righe per blocco (default: in base al numero di processi e alle scorciatoie).
+        ncols (int): La risoluzione orizzontale (default: 1.5 * nrows, come in main.c).
+        shortcuts (tuple): Le scorciatoie da usare, tra quelle di SHORTCUTS.
+        report (ShortcutReport): Dove sommare i passi calcolati e risparmiati (facoltativo).
+    Return:
+        ndarray: I pixel (uint8) con forma (nrows, ncols).
+    """
+    _require_numpy()
+    shortcuts = parse_shortcuts(shortcuts)
+    if max_iter <= 0 or nrows <= 0:
+        raise InvalidArgumentError("Valori non validi per iterazioni o risoluzione")
+    ncols = columns_for(nrows) if ncols is None else ncols
+    workers = processes if processes is not None else (os.cpu_count() or 1)
+    if tile_rows is None:
+        # La suddivisione ha un costo fisso per livello di rettangoli: conviene un blocco per processo
+        tiles_per_process = 1 if "subdivide" in shortcuts else TILES_PER_PROCESS
+        tile_rows = max(1, -(-nrows // (max(workers, 1) * tiles_per_process)))
+    jobs = [(nrows, ncols, max_iter, start, stop, shortcuts) for start, stop in tiles(nrows, tile_rows)]
+
+    image = np.empty((nrows, ncols), dtype=np.uint8)
+    if workers == 0 or len(jobs) == 1:
+        _store_tiles(image, map(_render_tile, jobs), report)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            _store_tiles(image, pool.imap_unordered(_render_tile, jobs), report)
+    return image
+
+
+def _store_tiles(image, results, report=None):
+    # Copia nell'immagine le righe calcolate, nell'ordine in cui arrivano
+    for start, data, tile_report in results:
+        rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, image.shape[1])
+        image[start:start + len(rows)] = rows
+        if report is not None:
+            report.add(tile_report)
+
+
+def save_pgm(filename, image):
+    # Scrive l'immagine nel formato P5 di savePGM
+    height, width = image.shape
+    with open(filename, "wb") as f:
+        f.write(pgm_header(width, height))
+        f.write(np.ascontiguousarray(image, dtype=np.uint8).tobytes())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Genera l'immagine PGM dell'insieme di Mandelbrot come Project_C")
+    parser.add_argument("filename", help="Il file PGM da scrivere")
+    parser.add_argument("max_iter", type=int, help="Il numero massimo di iterazioni")
+    parser.add_argument("nrows", type=int, help="La risoluzione verticale (quella orizzontale è 1.5 volte)")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="Numero di processi (default: i core)")
+    parser.add_argument("--tile-rows", type=int, default=None, help="Righe per blocco di lavoro")
+    parser.add_argument("--shortcuts", default="",
+                        help=f"Scorciatoie separate da virgole, tra {', '.join(SHORTCUTS)} (l'immagine non cambia)")
+    parser.add_argument("--time", action="store_true", help="Riporta su stderr il tempo di calcolo e i passi risparmiati")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.max_iter <= 0 or args.nrows <= 0:
+        print("Errore: Valori non validi per iterazioni o risoluzione.", file=sys.stderr)
+        return 1
+    try:
+        shortcuts = parse_shortcuts(args.shortcuts)
+    except InvalidArgumentError as exc:
+        print(f"Errore: {exc}", file=sys.stderr)
+        return 1
+    report = ShortcutReport()
+    start = time.perf_counter()
+    image = render(args.nrows, args.max_iter, args.processes, args.tile_rows, shortcuts=shortcuts, report=report)
+    save_pgm(args.filename, image)
+    if args.time:
+        print(f"mandelbrot: {time.perf_counter() - start:.3f} s; {report}", file=sys.stderr)
+    print(f"L' immagine '{args.filename}' è stata creata con successo.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
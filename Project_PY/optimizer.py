@@ -0,0 +1,178 @@
+#Tommaso Mingrone [SM3201286]
+
+from expr import (
+    Expression, Constant, Prog2, Prog3, Prog4, ProgN, If, While, For, Nop,
+    Addition, Subtraction, Division, Multiplication, Power, Modulus,
+    Reciprocal, AbsoluteValue, Major, Minor, MajorEq, MinorEq, Equal, NotEqual,
+)
+from ast_tools import rebuild, count_nodes
+
+
+# Operazioni senza effetti collaterali che possono essere calcolate durante l'ottimizzazione
+PURE_OPERATIONS = {
+    Addition, Subtraction, Division, Multiplication, Power, Modulus,
+    Reciprocal, AbsoluteValue, Major, Minor, MajorEq, MinorEq, Equal, NotEqual,
+}
+
+# Limite (in bit) oltre il quale una potenza non viene calcolata in anticipo
+MAX_FOLDED_POWER_BITS = 4096
+
+# Classi delle sequenze e costruttori per le sequenze di 2, 3 e 4 espressioni
+PROG_CLASSES = (Prog2, Prog3, Prog4, ProgN)
+PROG_BY_LENGTH = {2: Prog2, 3: Prog3, 4: Prog4}
+
+
+class OptimizationReport:
+    # Riepilogo delle riscritture applicate dall'ottimizzatore
+
+    def __init__(self):
+        self.nodes_before = 0
+        self.nodes_after = 0
+        self.folded = 0        # Sottoalberi costanti sostituiti dal loro valore
+        self.branches = 0      # If, While e For con esito noto sostituiti dal ramo eseguito
+        self.flattened = 0     # Prog annidati fusi nella sequenza che li contiene
+        self.dropped = 0       # Nop e costanti rimossi dalle sequenze
+
+    @property
+    def removed(self):
+        return self.nodes_before - self.nodes_after
+
+    def __str__(self):
+        return (f"nodi: {self.nodes_before} -> {self.nodes_after} (rimossi {self.removed}); "
+                f"folding: {self.folded}, rami: {self.branches}, "
+                f"prog appiattiti: {self.flattened}, nop rimossi: {self.dropped}")
+
+
+def constant_value(arg):
+    # Restituisce (True, valore) se l'argomento ha un valore noto senza consultare l'ambiente
+    if type(arg) is Constant:
+        return True, arg.value
+    if not isinstance(arg, (Expression, str)):
+        return True, arg
+    return False, None
+
+
+def sequence(node):
+    # Espressioni di un nodo Prog*, nell'ordine degli argomenti (la prima fornisce il risultato)
+    if isinstance(node, ProgN):
+        return list(node.exprs)
+    if isinstance(node, Prog4):
+        return [node.expr1, node.expr2, node.expr3, node.expr4]
+    if isinstance(node, Prog3):
+        return [node.expr1, node.expr2, node.expr3]
+    return [node.expr1, node.expr2]
+
+
+class Optimizer:
+    # Riscrive l'albero dal basso verso l'alto lasciando invariato l'ordine di valutazione
+
+    def __init__(self):
+        self.report = OptimizationReport()
+
+    def visit(self, node):
+        node = rebuild(node, self.visit)
+        if type(node) in PURE_OPERATIONS:
+            return self.fold(node)
+        if type(node) is If:
+            return self.branch(node)
+        if type(node) is While:
+            return self.loop(node)
+        if type(node) is For:
+            return self.range_loop(node)
+        if type(node) in PROG_CLASSES:
+            return self.flatten(node)
+        return node
+
+    # Sostituisce un'operazione pura con argomenti costanti con il suo risultato
+    def fold(self, node):
+        values = []
+        for arg in node.args:
+            known, value = constant_value(arg)
+            if not known:
+                return node
+            values.append(value)
+        if isinstance(node, Power) and not self.small_power(*values):
+            return node
+        try:
+            result = node.op(*values)
+        except Exception:
+            # L'errore (ad esempio una divisione per zero) deve restare a tempo di esecuzione
+            return node
+        self.report.folded += 1
+        return Constant(result)
+
+    @staticmethod
+    def small_power(x, y):
+        # Stima la dimensione di y ** x per evitare di calcolare potenze enormi
+        if isinstance(x, int) and isinstance(y, int) and x > 0:
+            return x * max(abs(y).bit_length(), 1) <= MAX_FOLDED_POWER_BITS
+        return True
+
+    # Un If con condizione costante diventa il ramo che verrebbe eseguito
+    def branch(self, node):
+        known, cond = constant_value(node.cond)
+        if not known:
+            return node
+        self.report.branches += 1
+        taken = node.if_yes if cond else node.if_no
+        return taken if isinstance(taken, Expression) else Constant(taken)
+
+    # Un While con condizione costante falsa non esegue mai il corpo
+    def loop(self, node):
+        known, cond = constant_value(node.cond)
+        if known and not cond:
+            self.report.branches += 1
+            return Nop()
+        return node
+
+    # Un For con estremi costanti e intervallo vuoto non esegue mai il corpo
+    def range_loop(self, node):
+        known_start, start = constant_value(node.start)
+        known_end, end = constant_value(node.end)
+        if (known_start and known_end and isinstance(start, int) and isinstance(end, int)
+                and start >= end):
+            self.report.branches += 1
+            return Nop()
+        return node
+
+    # Fonde i Prog annidati e rimuove le espressioni senza effetti che non forniscono il risultato
+    def flatten(self, node):
+        exprs = []
+        for expr in sequence(node):
+            if type(expr) in PROG_CLASSES:
+                # Un prog annidato viene sostituito dalla sua sequenza: l'ordine da destra a sinistra resta lo stesso
+                self.report.flattened += 1
+                exprs.extend(sequence(expr))
+            else:
+                exprs.append(expr)
+        flattened = len(exprs) != len(sequence(node))
+
+        # Nop e costanti in posizione diversa dalla prima non hanno effetti e il loro valore viene scartato
+        kept = exprs[:1] + [expr for expr in exprs[1:] if type(expr) not in (Nop, Constant)]
+        self.report.dropped += len(exprs) - len(kept)
+
+        if not flattened and len(kept) == len(exprs):
+            return node
+        if len(kept) == 1 and isinstance(kept[0], Expression):
+            return kept[0]
+        if len(kept) in PROG_BY_LENGTH:
+            return PROG_BY_LENGTH[len(kept)](kept)
+        return ProgN(kept)
+
+
+def optimize(expr):
+    """
+    Ottimizza un albero costruito da Expression.from_program: calcola in anticipo le
+    operazioni pure con argomenti costanti, sostituisce gli If con condizione costante
+    con il ramo eseguito e appiattisce i Prog annidati rimuovendo i Nop.
+
+    Args:
+        expr (Expression): La radice dell'albero (non viene modificata).
+    Return:
+        tuple: Il nuovo albero e un OptimizationReport con il numero di nodi rimossi.
+    """
+    optimizer = Optimizer()
+    optimizer.report.nodes_before = count_nodes(expr)
+    result = optimizer.visit(expr)
+    optimizer.report.nodes_after = count_nodes(result)
+    return result, optimizer.report
@@ -0,0 +1,169 @@
+#Tommaso Mingrone [SM3201286]
+
+import contextlib
+import sys
+
+from expr import output_sink, InvalidArgumentError
+
+
+# Dimensione predefinita (in caratteri) del buffer dei sink bufferizzati
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+
+class WriteMethodNotImplemented(Exception):
+    # Eccezione per il metodo write non implementato nelle sottoclassi di Sink
+    pass
+
+
+def line(value):
+    # Testo scritto da print(value): str del valore seguito da un a capo
+    return str(value) + "\n"
+
+
+class Sink:
+    # Classe base per le destinazioni dell'output di Print
+
+    # Metodo astratto per scrivere un valore stampato
+    def write(self, value):
+        raise WriteMethodNotImplemented("Il metodo write deve essere implementato dalle sottoclassi di Sink")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BufferedSink(Sink):
+    """
+    Accumula le righe stampate e le scrive sullo stream con un'unica write quando il
+    buffer supera buffer_size caratteri, ogni flush_lines righe (se indicato) e alla
+    chiusura. Il testo prodotto è identico a quello delle chiamate a print.
+    """
+
+    def __init__(self, stream=None, buffer_size=DEFAULT_BUFFER_SIZE, flush_lines=None, flush_stream=True):
+        if buffer_size < 0 or (flush_lines is not None and flush_lines < 1):
+            raise InvalidArgumentError("Politica di flush non valida")
+        self.stream = stream if stream is not None else sys.stdout
+        self.buffer_size = buffer_size
+        self.flush_lines = flush_lines
+        self.flush_stream = flush_stream  # Se chiamare anche stream.flush() dopo ogni scrittura
+        self.parts = []
+        self.size = 0
+        self.lines = 0      # Righe ricevute
+        self.writes = 0     # Scritture effettuate sullo stream
+
+    def write(self, value):
+        text = line(value)
+        self.parts.append(text)
+        self.size += len(text)
+        self.lines += 1
+        if self.size > self.buffer_size or (self.flush_lines is not None and len(self.parts) >= self.flush_lines):
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.write_out("".join(self.parts))
+            self.writes += 1
+            self.parts.clear()
+            self.size = 0
+        if self.flush_stream and hasattr(self.stream, "flush"):
+            self.stream.flush()
+
+    # Scrive il testo accumulato sullo stream
+    def write_out(self, text):
+        self.stream.write(text)
+
+    def __str__(self):
+        return f"{type(self).__name__}(righe={self.lines}, scritture={self.writes})"
+
+
+class BinarySink(BufferedSink):
+    # Sink bufferizzato per stream binari (file aperti in "wb", sys.stdout.buffer, socket.makefile("wb"))
+
+    def __init__(self, stream=None, encoding=None, errors="strict", **options):
+        if stream is None:
+            stream = sys.stdout.buffer
+            encoding = encoding or sys.stdout.encoding
+        super().__init__(stream, **options)
+        self.encoding = encoding or "utf-8"
+        self.errors = errors
+
+    def write_out(self, text):
+        self.stream.write(text.encode(self.encoding, self.errors))
+
+
+class ListSink(Sink):
+    # Cattura in memoria le righe stampate (senza a capo), nell'ordine di esecuzione
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, value):
+        # Il valore viene convertito subito: un array stampato può essere modificato in seguito
+        self.lines.append(str(value))
+
+    # Testo che print avrebbe scritto
+    def getvalue(self):
+        return "".join(text + "\n" for text in self.lines)
+
+    def __str__(self):
+        return f"ListSink(righe={len(self.lines)})"
+
+
+class NullSink(Sink):
+    # Scarta l'output (per i benchmark), contando solo le righe
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, value):
+        self.lines += 1
+
+    def __str__(self):
+        return f"NullSink(righe={self.lines})"
+
+
+@contextlib.contextmanager
+def use_sink(sink, flush=True):
+    """
+    Imposta il sink su cui scrive Print durante la valutazione, in tutti i motori.
+
+    Args:
+        sink (Sink): Il sink da usare (None: print sullo standard output corrente).
+        flush (bool): Se svuotare il sink all'uscita dal blocco.
+    Return:
+        Il context manager che ripristina il sink precedente.
+    """
+    token = output_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        output_sink.reset(token)
+        if flush and sink is not None:
+            sink.flush()
+
+
+def make_sink(kind, buffer_size=DEFAULT_BUFFER_SIZE, flush_lines=None):
+    # Crea un sink dal nome usato sulla riga di comando
+    if kind == "stdout":
+        return None
+    if kind == "buffered":
+        return BufferedSink(buffer_size=buffer_size, flush_lines=flush_lines)
+    if kind == "binary":
+        return BinarySink(buffer_size=buffer_size, flush_lines=flush_lines)
+    if kind == "list":
+        return ListSink()
+    if kind == "null":
+        return NullSink()
+    raise InvalidArgumentError(f"Sink di output sconosciuto: '{kind}'")
+
+
+# Nomi dei sink accettati da make_sink
+SINKS = ("stdout", "buffered", "binary", "list", "null")
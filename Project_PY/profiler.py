@@ -0,0 +1,202 @@
+#Tommaso Mingrone [SM3201286]
+
+import time
+
+from expr import Expression, Variable, Constant
+from ast_tools import rebuild
+
+
+# Lunghezza massima delle etichette dei nodi nei report e nelle pile per i flamegraph
+LABEL_WIDTH = 60
+
+
+class NodeStats:
+    # Contatori di un nodo dell'albero: chiamate, tempo inclusivo ed esclusivo (in nanosecondi)
+
+    def __init__(self, node):
+        self.node = node          # Il nodo originale, usato per l'etichetta
+        self.hits = 0
+        self.inclusive = 0
+        self.exclusive = 0
+        self.active = 0           # Valutazioni in corso (maggiore di 1 con la ricorsione)
+        self._label = None
+
+    @property
+    def class_name(self):
+        return type(self.node).__name__
+
+    # Etichetta del nodo: la forma __str__, calcolata solo quando serve e troncata
+    @property
+    def label(self):
+        if self._label is None:
+            text = " ".join(str(self.node).split())
+            if len(text) > LABEL_WIDTH:
+                text = text[:LABEL_WIDTH - 3] + "..."
+            self._label = text
+        return self._label
+
+
+class CallPath:
+    # Nodo dell'albero delle chiamate: il tempo esclusivo speso con questa pila di nodi attivi
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.time = 0
+        self.children = {}        # NodeStats -> CallPath
+
+
+class ProfileProbe(Expression):
+    # Sostituisce un nodo nell'albero profilato: ne misura le valutazioni e delega al nodo
+
+    def __init__(self, node, stats, profile):
+        self.node = node
+        self.stats = stats
+        self.profile = profile
+
+    def evaluate(self, env):
+        profile = self.profile
+        stats = self.stats
+        stats.hits += 1
+        stats.active += 1
+
+        parent = profile.stack[-1]
+        path = parent[0].children.get(stats)
+        if path is None:
+            path = parent[0].children[stats] = CallPath(stats)
+        frame = [path, 0]     # Percorso nell'albero delle chiamate e tempo speso nei figli
+        profile.stack.append(frame)
+        start = time.perf_counter_ns()
+        try:
+            return self.node.evaluate(env)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            profile.stack.pop()
+            parent[1] += elapsed
+            exclusive = elapsed - frame[1]
+            stats.exclusive += exclusive
+            path.time += exclusive
+            stats.active -= 1
+            if not stats.active:
+                # Con la ricorsione il tempo inclusivo si conta solo per la valutazione più esterna
+                stats.inclusive += elapsed
+
+    def __str__(self):
+        return str(self.node)
+
+
+class Profile:
+    """
+    Risultati della profilazione di un albero: statistiche per nodo, riepilogo per
+    classe di nodo, percorso più costoso e pile in formato "collapsed" per i flamegraph.
+    """
+
+    def __init__(self):
+        self.nodes = []                 # NodeStats di tutti i nodi profilati
+        self.calls = CallPath(None)     # Radice dell'albero delle chiamate
+        self.stack = [[self.calls, 0]]
+
+    @property
+    def total(self):
+        return self.stack[0][1]
+
+    def wrap(self, node, probes=None):
+        # Crea la copia profilata dell'albero: ogni nodo (tranne le foglie Variable e Constant) passa da una sonda
+        probes = {} if probes is None else probes
+        if id(node) in probes:
+            return probes[id(node)]
+        copy = rebuild(node, lambda child: child if type(child) in (Variable, Constant) else self.wrap(child, probes))
+        stats = NodeStats(node)
+        self.nodes.append(stats)
+        probe = probes[id(node)] = ProfileProbe(copy, stats, self)
+        return probe
+
+    def class_breakdown(self):
+        # Chiamate e tempo esclusivo per classe di nodo, dalla più costosa
+        classes = {}
+        for stats in self.nodes:
+            entry = classes.setdefault(stats.class_name, [0, 0])
+            entry[0] += stats.hits
+            entry[1] += stats.exclusive
+        return sorted(((name, hits, exclusive) for name, (hits, exclusive) in classes.items()),
+                      key=lambda item: -item[2])
+
+    def hot_path(self):
+        # Dalla radice, il ramo dell'albero delle chiamate con il tempo maggiore a ogni livello
+        # (attraversa anche le call, entrando nel corpo della subroutine)
+        totals = {}
+
+        def total(path):
+            if path not in totals:
+                totals[path] = path.time + sum(total(child) for child in path.children.values())
+            return totals[path]
+
+        result = []
+        path = max(self.calls.children.values(), key=total, default=None)
+        while path is not None:
+            result.append((path.stats, total(path)))
+            path = max(path.children.values(), key=total, default=None)
+        return result
+
+    def collapsed(self):
+        """
+        Restituisce le pile nel formato "collapsed" letto da flamegraph.pl e speedscope:
+        una riga per pila, con le etichette separate da ';' e il tempo esclusivo in microsecondi.
+        """
+        lines = []
+        pending = [(child, ()) for child in self.calls.children.values()]
+        while pending:
+            path, prefix = pending.pop()
+            frames = prefix + (path.stats.label.replace(";", ","),)
+            if path.time >= 1000:
+                lines.append(f"{';'.join(frames)} {path.time // 1000}")
+            pending.extend((child, frames) for child in path.children.values())
+        return "\n".join(sorted(lines)) + "\n"
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+
+    def report(self, top=20):
+        # Report testuale: nodi più costosi, ripartizione per classe e percorso più costoso
+        total = self.total or 1
+        lines = [f"Tempo totale: {self.total / 1e6:.3f} ms", "",
+                 f"{'chiamate':>10} {'incl. ms':>10} {'escl. ms':>10} {'escl. %':>8}  {'classe':<14} nodo"]
+        for stats in sorted(self.nodes, key=lambda s: -s.inclusive)[:top]:
+            if not stats.hits:
+                continue
+            lines.append(f"{stats.hits:>10} {stats.inclusive / 1e6:>10.3f} {stats.exclusive / 1e6:>10.3f} "
+                         f"{100 * stats.exclusive / total:>7.1f}%  {stats.class_name:<14} {stats.label}")
+
+        lines += ["", f"{'classe':<14} {'chiamate':>10} {'escl. ms':>10} {'escl. %':>8}"]
+        for name, hits, exclusive in self.class_breakdown():
+            lines.append(f"{name:<14} {hits:>10} {exclusive / 1e6:>10.3f} {100 * exclusive / total:>7.1f}%")
+
+        lines += ["", "Percorso più costoso:"]
+        for depth, (stats, elapsed) in enumerate(self.hot_path()):
+            lines.append(f"{'  ' * depth}{elapsed / 1e6:.3f} ms  {stats.class_name}: {stats.label}")
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+def profile(expr):
+    """
+    Prepara la profilazione di un albero. L'albero originale non viene modificato:
+    la copia restituita contiene sonde che misurano ogni valutazione, quindi senza
+    profilazione la velocità di esecuzione resta invariata.
+
+    Args:
+        expr (Expression): La radice dell'albero.
+    Return:
+        tuple: L'albero profilato (da valutare al posto dell'originale) e il Profile
+        che raccoglie i risultati.
+    """
+    result = Profile()
+    return result.wrap(expr), result
+
+
+def run_profiled(expr, env):
+    # Esegue un albero con la profilazione; restituisce il valore e il Profile
+    profiled, result = profile(expr)
+    return profiled.evaluate(env), result
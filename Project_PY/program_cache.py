@@ -0,0 +1,145 @@
+#Tommaso Mingrone [SM3201286]
+
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+from expr import Expression, InvalidArgumentError
+from compact import hash_cons
+
+
+# Versione del formato degli alberi serializzati, parte della chiave: va incrementata quando
+# cambia la struttura dei nodi (ad esempio con __slots__), così i file vecchi non vengono cercati
+FORMAT_VERSION = 2
+
+
+def dispatch_fingerprint(dispatch):
+    # Impronta del dizionario delle operazioni: simbolo e classe (modulo e nome qualificato)
+    items = sorted(f"{token}={cls.__module__}.{cls.__qualname__}" for token, cls in dispatch.items())
+    return "\n".join(items)
+
+
+class ProgramCache:
+    """
+    Cache dei programmi già analizzati, indicizzata dall'hash del testo sorgente
+    e del dizionario delle operazioni. In memoria mantiene al più maxsize alberi
+    con politica LRU; se è indicata una directory, gli alberi vengono anche
+    serializzati su disco e ricaricati al posto di un nuovo parsing. Con compact
+    gli alberi vengono conservati come DAG, con i sottoalberi puri condivisi (vedi compact.py).
+    """
+
+    def __init__(self, maxsize=256, directory=None, compact=False):
+        if maxsize < 1:
+            raise InvalidArgumentError("La dimensione della cache deve essere almeno 1")
+        self.maxsize = maxsize
+        self.directory = directory
+        self.compact = compact
+        self.entries = OrderedDict()  # Chiave -> albero, dal meno al più recentemente usato
+        self.hits = 0                 # Programmi trovati in memoria
+        self.disk_hits = 0            # Programmi caricati dal disco
+        self.misses = 0               # Programmi analizzati da zero
+        self.evictions = 0            # Alberi rimossi dalla memoria per far posto a nuovi
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    # Calcola la chiave di un programma
+    def key(self, text, dispatch):
+        digest = hashlib.sha256(f"v{FORMAT_VERSION}\0".encode())
+        digest.update(dispatch_fingerprint(dispatch).encode())
+        digest.update(b"\0")
+        digest.update(text.encode())
+        return digest.hexdigest()
+
+    def get(self, text, dispatch):
+        """
+        Restituisce l'albero del programma, analizzandolo solo se non è già in cache.
+
+        Args:
+            text (str): Il programma in notazione polacca inversa.
+            dispatch (dict): Il dizionario che mappa i simboli alle classi di operazioni.
+        Return:
+            Expression: La radice dell'albero, condivisa tra le chiamate con lo stesso programma.
+        """
+        key = self.key(text, dispatch)
+        expr = self.entries.get(key)
+        if expr is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return expr
+
+        expr = self.load(key)
+        if expr is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            expr = Expression.from_program(text, dispatch)
+            if self.compact:
+                expr, _ = hash_cons(expr)
+            self.store(key, expr)
+        self.insert(key, expr)
+        return expr
+
+    # Inserisce un albero in memoria, rimuovendo il meno recente se la cache è piena
+    def insert(self, key, expr):
+        self.entries[key] = expr
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    # Carica dal disco l'albero serializzato, se presente; un file illeggibile viene rimosso
+    def load(self, key):
+        if self.directory is None:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            expr = pickle.loads(data)
+            if isinstance(expr, Expression):
+                return expr
+        except Exception:
+            # Qualunque errore (file troncato, classi cambiate, nodi con un'altra struttura) vale come miss
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    # Serializza l'albero su disco con una scrittura atomica
+    def store(self, key, expr):
+        if self.directory is None:
+            return
+        try:
+            data = pickle.dumps(expr, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # Alberi troppo profondi per pickle restano solo in memoria
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # Svuota la cache in memoria (i file su disco restano)
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return (f"ProgramCache(size={len(self.entries)}/{self.maxsize}, hits={self.hits}, "
+                f"disk_hits={self.disk_hits}, misses={self.misses}, evictions={self.evictions})")
@@ -0,0 +1,173 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import io
+import json
+import multiprocessing
+import pickle
+import sys
+import time
+
+from expr import d
+from engines import ENGINES, run
+from program_cache import ProgramCache
+from output import BufferedSink
+
+
+# Cache degli alberi già analizzati, una per processo worker
+_cache = None
+
+
+class ProgramResult:
+    # Esito dell'esecuzione di un programma: valore, output di print ed eventuale eccezione
+
+    def __init__(self, index, value=None, output="", error=None, seconds=0.0):
+        self.index = index       # Posizione del programma nel flusso di ingresso
+        self.value = value
+        self.output = output     # Testo stampato da print durante l'esecuzione
+        self.error = error       # None oppure (nome dell'eccezione, messaggio)
+        self.seconds = seconds   # Tempo di parsing ed esecuzione nel worker
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        result = {"index": self.index, "value": self.value, "output": self.output, "seconds": self.seconds}
+        if self.error is not None:
+            result["error"] = {"type": self.error[0], "message": self.error[1]}
+        return result
+
+    def __str__(self):
+        if self.error is not None:
+            return f"#{self.index}: {self.error[0]}: {self.error[1]}"
+        return f"#{self.index}: {self.value}"
+
+
+def _init_worker(cache_size):
+    global _cache
+    _cache = ProgramCache(maxsize=cache_size)
+
+
+def _transferable(value):
+    # Il valore torna al processo principale con pickle: ciò che non è serializzabile viene convertito in stringa
+    if value is None or type(value) in (int, float, bool, str):
+        return value
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return str(value)
+
+
+def run_program(job, stdout=None):
+    """
+    Analizza ed esegue un programma catturando l'output di print e le eccezioni.
+    È la funzione eseguita dai processi worker.
+
+    Args:
+        job (tuple): (indice, testo del programma, ambiente iniziale, motore).
+        stdout: Un file su cui inoltrare l'output di print mentre il programma è in esecuzione
+            (opzionale; senza, l'output viene raccolto in ProgramResult.output).
+    Return:
+        ProgramResult: L'esito dell'esecuzione.
+    """
+    global _cache
+    if _cache is None:
+        _cache = ProgramCache()
+    index, text, env, engine = job
+    output = io.StringIO() if stdout is None else stdout
+    # Con uno stream l'output viene inoltrato riga per riga, altrimenti scritto in blocco
+    sink = BufferedSink(output, flush_lines=1 if stdout is not None else None)
+    start = time.perf_counter()
+    try:
+        e = _cache.get(text, d)
+        value = run(e, dict(env or {}), engine, sink)
+        result = ProgramResult(index, _transferable(value))
+    except Exception as exc:
+        result = ProgramResult(index, error=(type(exc).__name__, str(exc)))
+    if stdout is None:
+        result.output = output.getvalue()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def run_programs(programs, processes=None, chunksize=1, ordered=True, engine="tree", cache_size=256):
+    """
+    Esegue molti programmi indipendenti su un pool di processi, così da usare tutti
+    i core nonostante il GIL. I risultati vengono restituiti man mano che sono pronti.
+
+    Args:
+        programs: Iterabile di testi o di coppie (testo, ambiente iniziale).
+        processes (int): Il numero di processi (default: i core disponibili);
+            con 0 i programmi vengono eseguiti nel processo corrente.
+        chunksize (int): Quanti programmi inviare insieme a ciascun worker.
+        ordered (bool): Se False i risultati arrivano nell'ordine di completamento.
+        engine (str): Il motore di esecuzione usato dai worker.
+        cache_size (int): La dimensione della cache degli alberi di ciascun worker.
+    Return:
+        generator: I ProgramResult, con l'indice del programma di provenienza.
+    """
+    jobs = (
+        (index, *((program, None) if isinstance(program, str) else program), engine)
+        for index, program in enumerate(programs)
+    )
+
+    if processes == 0:
+        _init_worker(cache_size)
+        yield from map(run_program, jobs)
+        return
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(cache_size,)) as pool:
+        deliver = pool.imap if ordered else pool.imap_unordered
+        yield from deliver(run_program, jobs, chunksize)
+
+
+def read_programs(stream):
+    # Legge un programma per riga: testo semplice oppure JSON {"program": ..., "env": {...}}
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            job = json.loads(line)
+            yield job["program"], job.get("env", {})
+        else:
+            yield line
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Esegue molti programmi in parallelo su un pool di processi")
+    parser.add_argument("programs", nargs="?", help="File con un programma per riga, testo o JSON (default: stdin)")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="Numero di processi (default: i core)")
+    parser.add_argument("--chunksize", type=int, default=1, help="Programmi inviati insieme a ciascun worker")
+    parser.add_argument("--unordered", action="store_true", help="Restituisce i risultati appena sono pronti")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="tree", help="Motore di esecuzione")
+    parser.add_argument("--time", action="store_true", help="Riporta su stderr il tempo totale e i programmi al secondo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stream = open(args.programs) if args.programs else sys.stdin
+    start = time.perf_counter()
+    count = errors = 0
+    try:
+        for result in run_programs(read_programs(stream), args.processes, args.chunksize,
+                                   not args.unordered, args.engine):
+            print(json.dumps(result.to_dict(), default=str), flush=True)
+            count += 1
+            errors += not result.ok
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    if args.time:
+        elapsed = time.perf_counter() - start
+        print(f"{count} programmi ({errors} con errori) in {elapsed:.3f} s "
+              f"({count / elapsed if elapsed else 0:,.1f} programmi/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
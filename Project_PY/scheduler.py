@@ -0,0 +1,422 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import collections
+import contextlib
+import heapq
+import itertools
+import json
+import sys
+import time
+
+from expr import Expression, While, For, Call, DefSub, InvalidArgumentError, d
+from ast_tools import children, iter_nodes
+from iterative import handler_for, _while, _for
+from output import Sink, ListSink, use_sink
+
+
+# Passi eseguiti da un programma prima di cedere il controllo allo scheduler
+DEFAULT_QUANTUM = 1000
+
+# Costo dei sottoalberi che contengono un ciclo o una call ricorsiva: non sono valutati in un'unica volta
+UNBOUNDED = -1
+
+# Stati di un programma
+READY, DONE, FAILED, EXHAUSTED = "ready", "done", "failed", "exhausted"
+
+
+class FuelExhaustedException(Exception):
+    # Eccezione per i programmi che hanno consumato tutti i passi a loro disposizione
+    pass
+
+
+class Charge:
+    # Passi già eseguiti da un ciclo veloce, ceduti al ciclo di valutazione perché li conteggi
+    __slots__ = ("steps",)
+
+    def __init__(self, steps):
+        self.steps = steps
+
+
+def _sliced_while(node, env, iteration_cost, batch):
+    # While con condizione e corpo di costo limitato: le iterazioni sono eseguite direttamente
+    # a gruppi di batch, e i passi vengono conteggiati alla fine di ogni gruppo
+    cond = node.cond.evaluate
+    body = node.expr.evaluate
+    group = range(batch)
+    while True:
+        for count in group:
+            if not cond(env):
+                yield Charge(count * iteration_cost + 1)
+                return None
+            body(env)
+        yield Charge(batch * iteration_cost)
+
+
+def _sliced_for(node, env, iteration_cost, batch):
+    # For con corpo di costo limitato, con gli estremi valutati come nel tree walker
+    start = (yield node.start) if isinstance(node.start, Expression) else node.start
+    end = (yield node.end) if isinstance(node.end, Expression) else node.end
+    name = str(node.i_var)
+    body = node.expr.evaluate
+    first = start
+    for first in range(start, end, batch):
+        if first != start:
+            yield Charge(batch * iteration_cost)
+        for i in range(first, min(first + batch, end)):
+            env[name] = i
+            body(env)
+    yield Charge(max(0, min(end, first + batch) - first) * iteration_cost + 1)
+    return None
+
+
+# Gestori dei cicli da sostituire con la versione veloce quando il loro corpo ha costo limitato
+SLICED_LOOPS = {_while: _sliced_while, _for: _sliced_for}
+
+
+class Task:
+    """
+    Programma valutato a fette: la pila dei generatori (vedi iterative) viene conservata
+    tra una fetta e l'altra, così il programma riprende dal punto in cui si era fermato.
+    I sottoalberi senza cicli (e con call solo a subroutine senza cicli) vengono valutati
+    direttamente con evaluate e contano come un passo per nodo; i cicli con corpo di
+    questo tipo eseguono più iterazioni prima di controllare il budget.
+    """
+
+    def __init__(self, expr, env=None, priority=1, fuel=None, name=None, stdout=None, quantum=DEFAULT_QUANTUM):
+        if priority <= 0:
+            raise InvalidArgumentError("La priorità deve essere positiva")
+        self.expr = expr
+        self.env = {} if env is None else env
+        self.priority = priority
+        self.fuel = fuel          # Passi massimi (None: illimitati)
+        self.name = name
+        self.stdout = stdout      # Sink o file per l'output di print (None: sys.stdout)
+        self.quantum = quantum
+        self.state = READY
+        self.result = None
+        self.error = None
+        self.steps = 0            # Passi eseguiti
+        self.slices = 0           # Fette ricevute dallo scheduler
+        self.cpu_seconds = 0.0    # Tempo di CPU del thread speso nelle fette
+        self.costs = {}           # Nodo -> numero di nodi del sottoalbero, oppure UNBOUNDED
+        self.plans = {}           # Nodo -> come valutarlo (vedi plan)
+        self.bodies = None        # Nome -> corpi delle defsub con quel nome (vedi subroutines)
+        self.stack = None
+        self.value = None
+
+    def subroutines(self):
+        # Corpi delle defsub dell'albero, per nome. Una call ha costo limitato solo se il nome
+        # non è già nell'ambiente iniziale e ogni corpo che la defsub può associargli lo ha
+        bodies = {}
+        for node in iter_nodes(self.expr):
+            if isinstance(node, DefSub):
+                bodies.setdefault(str(node.function_name), []).append(node.expr)
+        return {name: found for name, found in bodies.items()
+                if name not in self.env and all(isinstance(body, Expression) for body in found)}
+
+    def dependencies(self, node):
+        # Sottoalberi da cui dipende il costo di un nodo; None se il costo non è limitato
+        if isinstance(node, (While, For)):
+            return None
+        if isinstance(node, Call):
+            return self.bodies.get(str(node.function_name))
+        # Il corpo di una defsub non viene valutato dalla defsub stessa
+        return [] if isinstance(node, DefSub) else children(node)
+
+    def cost(self, root):
+        # Costo dei sottoalberi, calcolato in post-ordine senza ricorsione e memorizzato per nodo.
+        # Un nodo che dipende da sé stesso (subroutine ricorsive) non ha costo limitato
+        if not isinstance(root, Expression):
+            return 1
+        if self.bodies is None:
+            self.bodies = self.subroutines()
+        costs = self.costs
+        active = set()
+        stack = [root]
+        while stack:
+            node = stack[-1]
+            if node in costs:
+                stack.pop()
+                continue
+            kids = self.dependencies(node)
+            if kids is not None and node not in active:
+                active.add(node)
+                pending = [child for child in kids if child not in costs and child not in active]
+                if pending:
+                    stack.extend(pending)
+                    continue
+            stack.pop()
+            active.discard(node)
+            if kids is None or any(costs.get(child, UNBOUNDED) == UNBOUNDED for child in kids):
+                costs[node] = UNBOUNDED
+            else:
+                costs[node] = 1 + sum(costs[child] for child in kids)
+        return costs[root]
+
+    def plan(self, node):
+        # Come valutare un nodo, calcolato una volta per nodo: i passi che costa e None se viene
+        # valutato direttamente con evaluate, altrimenti un passo, il gestore che crea il suo
+        # generatore e gli argomenti del gestore dopo il nodo
+        cost = self.cost(node)
+        handler = handler_for(type(node))
+        if cost != UNBOUNDED or handler is None:
+            plan = (max(cost, 1), None, None)
+        else:
+            plan = (1, handler, (self.env,))
+            sliced = SLICED_LOOPS.get(handler)
+            if sliced is not None:
+                parts = [node.cond, node.expr] if handler is _while else [node.expr]
+                costs = [self.cost(part) for part in parts]
+                if UNBOUNDED not in costs:
+                    iteration_cost = sum(costs)
+                    plan = (1, sliced, (self.env, iteration_cost, max(1, self.quantum // iteration_cost)))
+        if isinstance(node, Expression):
+            self.plans[node] = plan
+        return plan
+
+    def run(self, budget):
+        """
+        Esegue il programma per al più budget passi (circa: un sottoalbero valutato
+        direttamente o un gruppo di iterazioni di un ciclo veloce non viene interrotto).
+
+        Args:
+            budget (int): I passi concessi a questa fetta.
+        Return:
+            bool: True se il programma è terminato (con un risultato o con un errore).
+        """
+        if self.state != READY:
+            return True
+        self.slices += 1
+        if self.fuel is not None:
+            budget = min(budget, self.fuel - self.steps)
+        cpu_start = time.thread_time()
+        if isinstance(self.stdout, Sink):
+            output = use_sink(self.stdout, flush=False)
+        elif self.stdout is not None:
+            output = contextlib.redirect_stdout(self.stdout)
+        else:
+            output = contextlib.nullcontext()
+        try:
+            with output:
+                finished = self.advance(budget)
+        except Exception as exc:
+            self.state, self.error, self.stack = FAILED, exc, None
+            finished = True
+        self.cpu_seconds += time.thread_time() - cpu_start
+
+        if not finished and self.fuel is not None and self.steps >= self.fuel:
+            self.state, self.stack = EXHAUSTED, None
+            self.error = FuelExhaustedException(f"Passi esauriti dopo {self.steps} passi")
+            finished = True
+        if finished and isinstance(self.stdout, Sink):
+            self.stdout.flush()
+        return finished
+
+    def advance(self, budget):
+        env = self.env
+        plans = self.plans
+        steps = self.steps
+        limit = steps + budget
+
+        if self.stack is None:
+            # Prima fetta: la radice è valutata direttamente se il suo costo è limitato
+            cost, handler, args = self.plan(self.expr)
+            if handler is None:
+                self.result = self.expr.evaluate(env)
+                self.steps += cost
+                self.state = DONE
+                return True
+            self.stack = [handler(self.expr, *args)]
+            self.value = None
+            steps += 1
+
+        stack = self.stack
+        value = self.value
+        try:
+            while stack:
+                try:
+                    child = stack[-1].send(value)
+                except StopIteration as stop:
+                    stack.pop()
+                    value = stop.value
+                    continue
+                if type(child) is Charge:
+                    steps += child.steps
+                    value = None
+                else:
+                    cost, handler, args = plans[child] if child in plans else self.plan(child)
+                    if handler is None:
+                        # Un operando che non è un'espressione solleva la stessa eccezione del tree walker
+                        value = child.evaluate(env)
+                    else:
+                        stack.append(handler(child, *args))
+                        value = None
+                    steps += cost
+                if steps >= limit:
+                    self.value = value
+                    return False
+        finally:
+            self.steps = steps
+        self.result = value
+        self.state = DONE
+        self.stack = None
+        return True
+
+    @property
+    def finished(self):
+        return self.state != READY
+
+    def __str__(self):
+        label = self.name if self.name is not None else hex(id(self))
+        return (f"Task({label}, {self.state}, passi={self.steps}, fette={self.slices}, "
+                f"cpu={self.cpu_seconds:.6f} s)")
+
+
+class Scheduler:
+    """
+    Esegue molti programmi nello stesso processo alternandoli a fette di quantum passi.
+    Con la politica "round_robin" i programmi ricevono una fetta a turno; con "priority"
+    ricevono passi in proporzione alla loro priorità (stride scheduling: viene scelto il
+    programma con il minor numero di passi eseguiti diviso per la priorità).
+    """
+
+    POLICIES = ("round_robin", "priority")
+
+    def __init__(self, quantum=DEFAULT_QUANTUM, policy="round_robin"):
+        if quantum < 1:
+            raise InvalidArgumentError("Il quanto deve essere di almeno un passo")
+        if policy not in self.POLICIES:
+            raise InvalidArgumentError(f"Politica di scheduling sconosciuta: '{policy}'")
+        self.quantum = quantum
+        self.policy = policy
+        self.ready = collections.deque()   # Coda per il round robin
+        self.heap = []                     # (passi / priorità, ordine di arrivo, programma) per "priority"
+        self.counter = itertools.count()
+        self.tasks = []
+        self.switches = 0
+
+    def spawn(self, expr, env=None, priority=1, fuel=None, name=None, stdout=None):
+        """
+        Aggiunge un programma allo scheduler.
+
+        Args:
+            expr (Expression): La radice dell'albero.
+            env (dict): L'ambiente di esecuzione (default: un nuovo dizionario).
+            priority (float): Il peso del programma con la politica "priority".
+            fuel (int): Il numero massimo di passi (default: illimitato).
+            name (str): Un'etichetta per i report.
+            stdout: Il Sink o il file su cui scrivere l'output di print (default: sys.stdout).
+        Return:
+            Task: Il programma, da cui leggere stato, risultato e contabilità.
+        """
+        task = Task(expr, env, priority, fuel, name, stdout, self.quantum)
+        self.tasks.append(task)
+        self.enqueue(task)
+        return task
+
+    def enqueue(self, task):
+        if self.policy == "priority":
+            heapq.heappush(self.heap, (task.steps / task.priority, next(self.counter), task))
+        else:
+            self.ready.append(task)
+
+    def next_task(self):
+        if self.policy == "priority":
+            return heapq.heappop(self.heap)[2] if self.heap else None
+        return self.ready.popleft() if self.ready else None
+
+    def __len__(self):
+        return len(self.ready) + len(self.heap)
+
+    def run(self, max_slices=None):
+        """
+        Esegue i programmi fino al loro completamento, oppure per al più max_slices fette.
+
+        Args:
+            max_slices (int): Il numero massimo di fette da eseguire (default: illimitato).
+        Return:
+            generator: I Task man mano che terminano.
+        """
+        slices = 0
+        while max_slices is None or slices < max_slices:
+            task = self.next_task()
+            if task is None:
+                return
+            slices += 1
+            self.switches += 1
+            if task.run(self.quantum):
+                yield task
+            else:
+                self.enqueue(task)
+
+    def __str__(self):
+        finished = sum(task.finished for task in self.tasks)
+        cpu = sum(task.cpu_seconds for task in self.tasks)
+        return (f"Scheduler({self.policy}, quantum={self.quantum}, programmi={len(self.tasks)}, "
+                f"terminati={finished}, fette={self.switches}, cpu={cpu:.3f} s)")
+
+
+def run_sliced(expr, env, quantum=DEFAULT_QUANTUM):
+    # Esecuzione a fette di un solo programma (motore "sliced"), con le stesse eccezioni del tree walker
+    task = Task(expr, env, quantum=quantum)
+    while not task.run(quantum):
+        pass
+    if task.error is not None:
+        raise task.error
+    return task.result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Esegue molti programmi a fette nello stesso processo")
+    parser.add_argument("programs", nargs="?", help="File con un programma per riga, testo o JSON (default: stdin)")
+    parser.add_argument("--quantum", type=int, default=DEFAULT_QUANTUM, help="Passi per fetta")
+    parser.add_argument("--policy", choices=Scheduler.POLICIES, default="round_robin", help="Politica di scheduling")
+    parser.add_argument("--fuel", type=int, default=None, help="Passi massimi per programma")
+    parser.add_argument("--time", action="store_true", help="Riporta su stderr il riepilogo dello scheduler")
+    return parser.parse_args(argv)
+
+
+def task_result(task):
+    # Esito di un programma terminato nel formato JSON di runner, con la contabilità dello scheduler
+    from runner import _transferable  # Import locale: runner dipende da engines, che usa questo modulo
+    result = {"index": task.name, "state": task.state, "value": _transferable(task.result),
+              "output": task.stdout.getvalue(), "steps": task.steps, "slices": task.slices,
+              "cpu_seconds": task.cpu_seconds}
+    if task.error is not None:
+        result["error"] = {"type": type(task.error).__name__, "message": str(task.error)}
+    return result
+
+
+def main(argv=None):
+    # I programmi JSON possono indicare anche "priority" e "fuel"
+    args = parse_args(argv)
+    scheduler = Scheduler(args.quantum, args.policy)
+    stream = open(args.programs) if args.programs else sys.stdin
+    try:
+        for index, line in enumerate(line.strip() for line in stream if line.strip()):
+            job = json.loads(line) if line.startswith("{") else {"program": line}
+            try:
+                expr = Expression.from_program(job["program"], d)
+            except Exception as exc:
+                # Un programma non valido viene riportato subito, senza fermare gli altri
+                error = {"type": type(exc).__name__, "message": str(exc)}
+                print(json.dumps({"index": index, "state": FAILED, "error": error}), flush=True)
+                continue
+            scheduler.spawn(expr, dict(job.get("env", {})), job.get("priority", 1),
+                            job.get("fuel", args.fuel), index, ListSink())
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    start = time.perf_counter()
+    for task in scheduler.run():
+        print(json.dumps(task_result(task), default=str), flush=True)
+
+    if args.time:
+        print(f"{scheduler} in {time.perf_counter() - start:.3f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import multiprocessing
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from expr import InvalidArgumentError
+from engines import ENGINES
+from runner import run_program, _init_worker
+
+
+# Ogni messaggio è un oggetto JSON in UTF-8 preceduto dalla sua lunghezza (4 byte, big-endian)
+HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+
+# Blocchi di output di una richiesta inviati dal worker e non ancora scritti sul socket:
+# oltre questo numero il worker si ferma finché il client non legge
+OUTPUT_WINDOW = 64
+
+
+async def read_frame(reader):
+    # Legge un messaggio; restituisce None se la connessione è stata chiusa
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise InvalidArgumentError(f"Messaggio troppo lungo: {length} byte (massimo {MAX_FRAME})")
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError as exc:
+        raise InvalidArgumentError(f"Messaggio troncato: {len(exc.partial)} byte su {length}") from None
+    return json.loads(payload)
+
+
+def encode_frame(message):
+    data = json.dumps(message, default=str).encode()
+    return HEADER.pack(len(data)) + data
+
+
+class QueueWriter:
+    """
+    File di output dei worker: inoltra al server ogni riga stampata, etichettata con la
+    chiave della richiesta. Ogni blocco consuma un credito, restituito dal server dopo
+    averlo scritto sul socket: se il client non legge, il worker si ferma qui.
+    """
+
+    def __init__(self, queue, key, credits):
+        self.queue = queue
+        self.key = key
+        self.credits = credits
+        self.buffer = ""
+
+    def send(self, text):
+        self.credits.acquire()
+        self.queue.put((self.key, text))
+
+    def write(self, text):
+        self.buffer += text
+        if "\n" in self.buffer:
+            lines, _, self.buffer = self.buffer.rpartition("\n")
+            self.send(lines + "\n")
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.send(self.buffer)
+            self.buffer = ""
+
+
+def execute(job, key, queue, credits):
+    # Eseguita nei processi del pool: l'output arriva al server durante l'esecuzione, seguito da (key, None)
+    stdout = QueueWriter(queue, key, credits)
+    try:
+        return run_program(job, stdout)
+    finally:
+        stdout.flush()
+        queue.put((key, None))
+
+
+class LatencyStats:
+    # Latenze delle ultime richieste completate, con i percentili calcolati su richiesta
+
+    def __init__(self, window=10000):
+        self.samples = collections.deque(maxlen=window)
+        self.completed = 0
+        self.rejected = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.completed += 1
+
+    def percentile(self, p):
+        # Percentile con il metodo nearest-rank sulle latenze della finestra
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, -(-len(ordered) * p // 100))
+        return ordered[int(rank) - 1]
+
+    def summary(self):
+        return {
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": max(self.samples, default=0.0),
+        }
+
+    def __str__(self):
+        s = self.summary()
+        return (f"{s['completed']} completate, {s['rejected']} rifiutate; latenza p50 {s['p50'] * 1000:.1f} ms, "
+                f"p90 {s['p90'] * 1000:.1f} ms, p99 {s['p99'] * 1000:.1f} ms, max {s['max'] * 1000:.1f} ms")
+
+
+class EvaluationServer:
+    """
+    Server asyncio che riceve programmi su un socket locale (TCP o Unix) e li esegue
+    su un pool limitato di processi.
+
+    Protocollo: messaggi JSON preceduti dalla lunghezza. Una richiesta
+    {"id": ..., "program": ..., "env": {...}, "engine": ...} riceve zero o più
+    messaggi {"id", "type": "output", "text"} mentre il programma stampa e infine
+    {"id", "type": "result", "value", "error", "seconds", "latency"}. Con più di
+    max_queue richieste in attesa la risposta è subito {"type": "busy"}.
+    La richiesta {"type": "stats"} restituisce i percentili di latenza.
+    """
+
+    def __init__(self, workers=None, max_queue=256, max_inflight=32, engine="tree", cache_size=256):
+        if engine not in ENGINES:
+            raise InvalidArgumentError(f"Motore di esecuzione sconosciuto: '{engine}'")
+        self.workers = workers
+        self.max_queue = max_queue          # Richieste accettate e non ancora completate, su tutte le connessioni
+        self.max_inflight = max_inflight    # Richieste in corso per connessione prima di smettere di leggere
+        self.engine = engine
+        self.cache_size = cache_size
+        self.stats = LatencyStats()
+        self.pending = 0
+        self.keys = itertools.count()
+        self.routes = {}                    # Chiave della richiesta -> (coda di output della connessione, id, crediti, evento di fine output)
+        self.connections = set()            # Task che gestiscono le connessioni aperte
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        loop = asyncio.get_running_loop()
+        self.manager = multiprocessing.Manager()
+        self.queue = self.manager.Queue()
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.cache_size,))
+        self.router = loop.create_task(self.route_output())
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        for task in list(self.connections):
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        self.queue.put((None, None))
+        await self.router
+        # Prima il manager: i worker fermi in attesa di crediti di connessioni chiuse ricevono un errore e terminano
+        self.manager.shutdown()
+        self.executor.shutdown()
+
+    # Smista l'output dei worker alle connessioni che hanno inviato le richieste
+    async def route_output(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, text = await loop.run_in_executor(None, self.queue.get)
+            if key is None:
+                return
+            route = self.routes.get(key)
+            if route is None:
+                continue
+            # Senza attese: ogni connessione scrive il proprio output in write_output, così un client
+            # lento non blocca gli altri. La coda resta limitata da OUTPUT_WINDOW blocchi per richiesta
+            output, request_id, credits, finished = route
+            output.put_nowait((request_id, text, credits, finished))
+
+    async def write_output(self, writer, lock, output):
+        # Scrive l'output delle richieste di una connessione e ne restituisce i crediti dopo drain
+        loop = asyncio.get_running_loop()
+        while True:
+            request_id, text, credits, finished = await output.get()
+            if text is None:
+                finished.set()  # Tutto l'output della richiesta precede il risultato
+                continue
+            await self.send(writer, lock, {"id": request_id, "type": "output", "text": text})
+            # Anche se il client si è disconnesso, il credito va restituito perché il worker possa terminare
+            await loop.run_in_executor(None, credits.release)
+
+    @staticmethod
+    async def send(writer, lock, message):
+        if writer.is_closing():
+            return
+        async with lock:
+            writer.write(encode_frame(message))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def handle(self, reader, writer):
+        lock = asyncio.Lock()
+        inflight = asyncio.Semaphore(self.max_inflight)
+        output = asyncio.Queue()
+        output_task = asyncio.create_task(self.write_output(writer, lock, output))
+        tasks = set()
+        self.connections.add(asyncio.current_task())
+        try:
+            while True:
+                # Con max_inflight richieste in corso la connessione non viene più letta: il client rallenta
+                await inflight.acquire()
+                try:
+                    request = await read_frame(reader)
+                except (InvalidArgumentError, ValueError, ConnectionError) as exc:
+                    inflight.release()
+                    await self.send(writer, lock, {"type": "error", "error": {"type": type(exc).__name__,
+                                                                           "message": str(exc)}})
+                    break
+                if request is None:
+                    inflight.release()
+                    break
+                if not isinstance(request, dict):
+                    inflight.release()
+                    await self.send(writer, lock, {"type": "error", "error": {
+                        "type": "InvalidArgumentError",
+                        "message": f"Una richiesta deve essere un oggetto JSON, non {type(request).__name__}"}})
+                    break
+                task = asyncio.create_task(self.process(request, writer, lock, output, time.perf_counter()))
+                task.add_done_callback(lambda _: inflight.release())
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            # Chiusura del server: le richieste ancora in corso su questa connessione vengono abbandonate
+            for task in tasks:
+                task.cancel()
+        finally:
+            output_task.cancel()
+            self.connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def process(self, request, writer, lock, output, received):
+        request_id = request.get("id")
+        if request.get("type") == "stats":
+            await self.send(writer, lock, {"id": request_id, "type": "stats", **self.stats.summary(),
+                                           "pending": self.pending})
+            return
+        if self.pending >= self.max_queue:
+            self.stats.rejected += 1
+            await self.send(writer, lock, {"id": request_id, "type": "busy", "pending": self.pending})
+            return
+
+        self.pending += 1
+        key = next(self.keys)
+        finished = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            credits = await loop.run_in_executor(None, self.manager.Semaphore, OUTPUT_WINDOW)
+            self.routes[key] = (output, request_id, credits, finished)
+            engine = request.get("engine", self.engine)
+            job = (request_id, request.get("program", ""), request.get("env") or {}, engine)
+            result = await loop.run_in_executor(self.executor, execute, job, key, self.queue, credits)
+            # Il risultato viene inviato solo dopo l'ultimo output della stessa richiesta
+            await finished.wait()
+            message = {"id": request_id, "type": "result", "value": result.value, "error": None,
+                       "seconds": result.seconds}
+            if result.error is not None:
+                message["error"] = {"type": result.error[0], "message": result.error[1]}
+        except Exception as exc:
+            message = {"id": request_id, "type": "result", "value": None,
+                       "error": {"type": type(exc).__name__, "message": str(exc)}}
+        finally:
+            self.routes.pop(key, None)
+            self.pending -= 1
+        latency = time.perf_counter() - received
+        self.stats.add(latency)
+        message["latency"] = latency
+        await self.send(writer, lock, message)
+
+
+class EvaluationClient:
+    # Client per EvaluationServer: più richieste possono essere in corso sulla stessa connessione
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.waiting = {}    # Id della richiesta -> (future del risultato, callback per l'output)
+        self.listener = asyncio.get_running_loop().create_task(self.listen())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=None, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def listen(self):
+        while True:
+            message = await read_frame(self.reader)
+            if message is None:
+                break
+            future, on_output = self.waiting.get(message.get("id"), (None, None))
+            if future is None:
+                continue
+            if message["type"] == "output":
+                if on_output is not None:
+                    on_output(message["text"])
+            else:
+                del self.waiting[message["id"]]
+                future.set_result(message)
+        for future, _ in self.waiting.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Connessione chiusa dal server"))
+
+    async def request(self, message, on_output=None):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = (future, on_output)
+        self.writer.write(encode_frame({**message, "id": request_id}))
+        await self.writer.drain()
+        return await future
+
+    async def evaluate(self, program, env=None, engine=None, on_output=None):
+        """
+        Invia un programma e attende il messaggio finale ("result" o "busy").
+
+        Args:
+            program (str): Il testo del programma.
+            env (dict): L'ambiente iniziale.
+            engine (str): Il motore di esecuzione (default: quello del server).
+            on_output (callable): Chiamata con ogni blocco di output di print, appena arriva.
+        Return:
+            dict: Il messaggio finale del server.
+        """
+        message = {"program": program, "env": env or {}}
+        if engine is not None:
+            message["engine"] = engine
+        return await self.request(message, on_output)
+
+    async def stats(self):
+        return await self.request({"type": "stats"})
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.listener
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Server di valutazione su socket locale")
+    parser.add_argument("--host", default="127.0.0.1", help="Indirizzo TCP (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Porta TCP")
+    parser.add_argument("--unix", help="Percorso di un socket Unix (al posto di TCP)")
+    parser.add_argument("--workers", type=int, default=None, help="Processi del pool (default: i core)")
+    parser.add_argument("--max-queue", type=int, default=256, help="Richieste in attesa oltre le quali si risponde busy")
+    parser.add_argument("--max-inflight", type=int, default=32, help="Richieste in corso per connessione")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="tree", help="Motore di esecuzione predefinito")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    server = EvaluationServer(args.workers, args.max_queue, args.max_inflight, args.engine)
+    await server.start(args.host, args.port, args.unix)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"In ascolto su {where}", file=sys.stderr)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        print(server.stats, file=sys.stderr)
+        await server.close()
+
+
+def main(argv=None):
+    try:
+        asyncio.run(serve(parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
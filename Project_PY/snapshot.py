@@ -0,0 +1,210 @@
+#Tommaso Mingrone [SM3201286]
+
+import copy
+import sys
+
+from expr import Expression, InvalidArgumentError, register_array_type
+from engines import run
+
+
+# Elementi per pagina degli array condivisi tra le copie di un ambiente
+DEFAULT_PAGE_SIZE = 4096
+
+# Valori che le copie di un ambiente possono condividere senza copiarli (i nodi non vengono modificati)
+IMMUTABLE = (Expression, int, float, complex, str, bool, type(None))
+
+
+class PagedArray:
+    """
+    Array diviso in pagine (liste Python) che più ambienti possono condividere.
+    Una pagina viene copiata solo alla prima scrittura da parte di un array che non
+    la possiede (copy-on-write); le pagine non modificate restano in comune.
+    Si legge, si scrive e si stampa come la lista da cui è stato creato.
+    """
+
+    __slots__ = ("pages", "owned", "length", "page_size", "copied")
+
+    def __init__(self, pages, length, page_size, owned=False):
+        self.pages = pages
+        self.owned = [owned] * len(pages)  # Pagine che solo questo array può modificare sul posto
+        self.length = length
+        self.page_size = page_size
+        self.copied = 0                    # Pagine copiate per effetto delle scritture
+
+    @classmethod
+    def from_list(cls, values, page_size=DEFAULT_PAGE_SIZE, owned=True):
+        # Con owned=False anche la prima scrittura copia la pagina (le pagine appartengono a uno snapshot)
+        if page_size < 1:
+            raise InvalidArgumentError("La dimensione delle pagine deve essere almeno 1")
+        pages = [values[start:start + page_size] for start in range(0, len(values), page_size)]
+        return cls(pages, len(values), page_size, owned)
+
+    def fork(self):
+        # Nuovo array con le stesse pagine: da qui in poi nessuno dei due le modifica sul posto
+        self.owned = [False] * len(self.pages)
+        return PagedArray(list(self.pages), self.length, self.page_size)
+
+    def __len__(self):
+        return self.length
+
+    def position(self, index):
+        # Pagina e posizione nella pagina, con gli stessi controlli di una lista
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("list index out of range")
+        return divmod(index, self.page_size)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.tolist()[index]
+        page, offset = self.position(index)
+        return self.pages[page][offset]
+
+    def __setitem__(self, index, value):
+        page, offset = self.position(index)
+        if not self.owned[page]:
+            self.pages[page] = self.pages[page][:]
+            self.owned[page] = True
+            self.copied += 1
+        self.pages[page][offset] = value
+
+    def tolist(self):
+        values = []
+        for page in self.pages:
+            values.extend(page)
+        return values
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+    def __eq__(self, other):
+        if isinstance(other, (PagedArray, list)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    # Stampa come una lista Python, in modo che print produca lo stesso output di valloc
+    def __str__(self):
+        return str(self.tolist())
+
+    def __repr__(self):
+        return f"PagedArray({self.tolist()!r})"
+
+
+register_array_type(PagedArray)
+
+
+class SharingReport:
+    # Memoria di un ambiente derivato da uno snapshot: in comune con lo snapshot e propria
+
+    def __init__(self):
+        self.shared_variables = 0
+        self.private_variables = 0
+        self.shared_pages = 0
+        self.private_pages = 0
+        self.shared_bytes = 0
+        self.private_bytes = 0
+
+    def add(self, value, shared):
+        size = sys.getsizeof(value)
+        if shared:
+            self.shared_bytes += size
+        else:
+            self.private_bytes += size
+
+    def __str__(self):
+        total = self.shared_bytes + self.private_bytes
+        ratio = self.shared_bytes / total if total else 0.0
+        return (f"variabili condivise: {self.shared_variables}, proprie: {self.private_variables}; "
+                f"pagine condivise: {self.shared_pages}, copiate: {self.private_pages}; "
+                f"byte condivisi: {self.shared_bytes:,}, propri: {self.private_bytes:,} ({ratio:.1%} condiviso)")
+
+
+class Snapshot:
+    """
+    Stato congelato di un ambiente da cui derivare molti ambienti indipendenti.
+    Gli array (liste) diventano PagedArray le cui pagine sono condivise da tutte le
+    copie; gli altri valori sono immutabili (numeri, corpi delle subroutine) e vengono
+    condivisi così come sono. Ogni copia paga solo le pagine e le variabili che scrive.
+    """
+
+    def __init__(self, env, page_size=DEFAULT_PAGE_SIZE):
+        self.page_size = page_size
+        self.values = {}
+        for name, value in env.items():
+            if type(value) is list:
+                value = PagedArray.from_list(value, page_size, owned=False)
+            elif isinstance(value, PagedArray):
+                value = value.fork()
+            elif not isinstance(value, IMMUTABLE):
+                value = copy.deepcopy(value)  # Altri valori mutabili (ad esempio TypedArray): una copia privata
+            self.values[name] = value
+
+    def fork(self):
+        """
+        Crea un nuovo ambiente che parte dallo stato dello snapshot.
+
+        Return:
+            dict: L'ambiente, da passare a run o a Expression.evaluate.
+        """
+        env = {}
+        for name, value in self.values.items():
+            if isinstance(value, PagedArray):
+                value = value.fork()
+            elif not isinstance(value, IMMUTABLE):
+                value = copy.deepcopy(value)
+            env[name] = value
+        return env
+
+    def sharing(self, env):
+        """
+        Misura quanta memoria un ambiente creato da fork ha ancora in comune con lo snapshot.
+
+        Args:
+            env (dict): L'ambiente da esaminare.
+        Return:
+            SharingReport: Variabili, pagine e byte condivisi e propri.
+        """
+        report = SharingReport()
+        for name, value in env.items():
+            base = self.values.get(name)
+            if isinstance(value, PagedArray) and isinstance(base, PagedArray):
+                shared = [page is old for page, old in zip(value.pages, base.pages)]
+                for page, is_shared in zip(value.pages, shared):
+                    report.add(page, is_shared)
+                report.shared_pages += sum(shared)
+                report.private_pages += len(shared) - sum(shared)
+                report.add(value.pages, False)  # L'elenco delle pagine è sempre proprio
+                is_shared = all(shared)
+            else:
+                is_shared = name in self.values and value is base
+                report.add(value, is_shared)
+            if is_shared:
+                report.shared_variables += 1
+            else:
+                report.private_variables += 1
+        return report
+
+
+def run_variants(setup, variants, engine="tree", env=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Esegue una sola volta il programma di preparazione e poi ciascuna variante in un
+    ambiente derivato dallo stato risultante, senza copiarne gli array.
+
+    Args:
+        setup (Expression): Il programma di preparazione.
+        variants (iterable): I programmi da eseguire, ciascuno nel proprio ambiente.
+        engine (str): Il motore di esecuzione.
+        env (dict): L'ambiente iniziale della preparazione.
+        page_size (int): Gli elementi per pagina degli array condivisi.
+    Return:
+        generator: Per ogni variante, il risultato, l'ambiente finale e il SharingReport.
+    """
+    base = dict(env or {})
+    run(setup, base, engine)
+    snapshot = Snapshot(base, page_size)
+    for variant in variants:
+        forked = snapshot.fork()
+        result = run(variant, forked, engine)
+        yield result, forked, snapshot.sharing(forked)
@@ -0,0 +1,87 @@
+#Tommaso Mingrone [SM3201286]
+
+import gc
+import sys
+import time
+
+from expr import Expression
+
+
+class TokenReader:
+    # Legge i token da uno stream di testo a blocchi, senza caricare l'intero programma in memoria
+
+    def __init__(self, stream, chunk_size=1 << 16):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.count = 0  # Numero di token letti finora
+
+    def __iter__(self):
+        read = self.stream.read
+        rest = ""  # Token eventualmente spezzato a cavallo di due blocchi
+        while True:
+            chunk = read(self.chunk_size)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            tokens = chunk.split()
+            # Se il blocco non termina con uno spazio l'ultimo token potrebbe continuare nel blocco successivo
+            if tokens and not chunk[-1].isspace():
+                rest = tokens.pop()
+            else:
+                rest = ""
+            self.count += len(tokens)
+            yield from tokens
+        if rest:
+            self.count += 1
+            yield rest
+
+
+class ParseStats:
+    # Statistiche di un parsing: token letti, tempo impiegato e throughput
+
+    def __init__(self, tokens=0, seconds=0.0):
+        self.tokens = tokens
+        self.seconds = seconds
+
+    @property
+    def tokens_per_second(self):
+        return self.tokens / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.tokens} token in {self.seconds:.3f} s ({self.tokens_per_second:,.0f} token/s)"
+
+
+def parse_stream(stream, dispatch, chunk_size=1 << 16):
+    """
+    Costruisce l'albero dell'espressione leggendo i token in modo incrementale da uno stream.
+    Oltre all'albero stesso la memoria usata è limitata a un blocco di testo e allo
+    stack dei sottoalberi ancora in attesa di un operatore.
+
+    Args:
+        stream: Un file di testo aperto (o sys.stdin).
+        dispatch (dict): Il dizionario che mappa i simboli alle classi di operazioni.
+        chunk_size (int): Il numero di caratteri letti a ogni accesso allo stream.
+    Return:
+        tuple: L'albero dell'espressione e un oggetto ParseStats.
+    """
+    reader = TokenReader(stream, chunk_size)
+    # L'albero è aciclico: durante la costruzione il garbage collector ciclico
+    # scandirebbe ripetutamente milioni di nodi appena creati senza liberarne nessuno
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        expr = Expression.from_tokens(reader, dispatch)
+        seconds = time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+    return expr, ParseStats(reader.count, seconds)
+
+
+def parse_file(path, dispatch, chunk_size=1 << 16):
+    # Come parse_stream, ma apre il file indicato ("-" indica lo standard input)
+    if path == "-":
+        return parse_stream(sys.stdin, dispatch, chunk_size)
+    with open(path) as f:
+        return parse_stream(f, dispatch, chunk_size)
@@ -0,0 +1,272 @@
+#Tommaso Mingrone [SM3201286]
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from expr import InvalidArgumentError
+from mandelbrot import (
+    REGION, np, _require_numpy, coordinates, iterate, gray_table, columns_for, tiles, save_pgm,
+)
+
+
+# Memoria predefinita per gli stati dei blocchi conservati (in byte)
+DEFAULT_BUDGET = 256 * 1024 * 1024
+
+# Righe per blocco predefinite
+DEFAULT_TILE_ROWS = 64
+
+
+class TileState:
+    """
+    Stato di un blocco di righe dopo max_iter iterazioni: il numero di iterazioni di
+    ogni punto e, per i punti non ancora sfuggiti, l'ultimo valore di z. Da questo
+    stato si può proseguire fino a un max_iter più alto senza ripartire da z = 0.
+    """
+
+    __slots__ = ("counts", "max_iter", "survivors", "zr", "zi")
+
+    def __init__(self, counts, max_iter, survivors, zr, zi):
+        self.counts = counts        # Iterazioni (int32) con la forma del blocco
+        self.max_iter = max_iter
+        self.survivors = survivors  # Indici (nel blocco appiattito) dei punti non sfuggiti
+        self.zr = zr
+        self.zi = zi
+
+    @property
+    def nbytes(self):
+        return self.counts.nbytes + self.survivors.nbytes + self.zr.nbytes + self.zi.nbytes
+
+    def counts_at(self, max_iter):
+        # Iterazioni con un limite non superiore a quello calcolato: i punti oltre il limite si fermano lì
+        if max_iter >= self.max_iter:
+            return self.counts
+        return np.minimum(self.counts, max_iter)
+
+
+def advance(key, state, max_iter):
+    """
+    Porta un blocco a max_iter iterazioni: da z = 0 se non c'è uno stato, altrimenti
+    proseguendo solo i punti non sfuggiti dal loro ultimo z.
+
+    Args:
+        key (tuple): Regione, righe e colonne dell'immagine, prima e ultima riga del blocco.
+        state (TileState): Lo stato calcolato in precedenza (o None).
+        max_iter (int): Il nuovo numero massimo di iterazioni.
+    Return:
+        tuple: Il nuovo TileState e i passi calcolati (punti per iterazione).
+    """
+    region, nrows, ncols, start, stop = key
+    x0, y0 = coordinates(nrows, ncols, start, stop, region)
+    shape = (stop - start, ncols)
+    cr = np.broadcast_to(x0[np.newaxis, :], shape).ravel()
+    ci = np.broadcast_to(y0[:, np.newaxis], shape).ravel()
+    if state is None:
+        zeros = np.zeros(cr.size)
+        counts, survivors, zr, zi, work = iterate(cr, ci, zeros, zeros, 1, max_iter)
+        return TileState(counts.reshape(shape), max_iter, survivors, zr, zi), work
+
+    resumed, survivors, zr, zi, work = iterate(
+        cr[state.survivors], ci[state.survivors], state.zr, state.zi, state.max_iter + 1, max_iter)
+    counts = state.counts.copy().ravel()
+    counts[state.survivors] = resumed
+    return TileState(counts.reshape(shape), max_iter, state.survivors[survivors], zr, zi), work
+
+
+def _advance_job(job):
+    # Eseguito dai processi del pool
+    return advance(*job)
+
+
+class TileCache:
+    """
+    Stati dei blocchi indicizzati da (regione, risoluzione, righe), con rimozione LRU
+    quando la memoria occupata supera budget byte. Con spill_dir gli stati rimossi
+    vengono scritti su disco e letti alla richiesta successiva; un file resta valido
+    finché non viene inserito un nuovo stato per lo stesso blocco.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, spill_dir=None):
+        if budget < 0:
+            raise InvalidArgumentError("Il budget di memoria non può essere negativo")
+        self.budget = budget
+        self.spill_dir = spill_dir
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.on_disk = set()  # Chiavi con un file aggiornato in spill_dir
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spilled = 0
+        self.loaded = 0
+
+    def path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, digest + ".npz")
+
+    def get(self, key):
+        state = self.entries.get(key)
+        if state is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return state
+        if self.spill_dir is not None and os.path.exists(self.path(key)):
+            with np.load(self.path(key)) as data:
+                state = TileState(data["counts"], int(data["max_iter"]), data["survivors"], data["zr"], data["zi"])
+            self.loaded += 1
+            self.hits += 1
+            # Non viene reinserito in memoria: eviterebbe di rimuovere (e riscrivere) blocchi
+            # che la stessa immagine sta per chiedere, e il file resta valido
+            self.on_disk.add(key)
+            return state
+        self.misses += 1
+        return None
+
+    def put(self, key, state):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old.nbytes
+        self.entries[key] = state
+        self.size += state.nbytes
+        if key in self.on_disk:  # Il file contiene ora uno stato superato
+            self.on_disk.discard(key)
+            self._remove(key)
+        # L'ultimo stato inserito resta in memoria anche se da solo supera il budget
+        while self.size > self.budget and len(self.entries) > 1:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.nbytes
+            self.evictions += 1
+            if self.spill_dir is not None:
+                np.savez(self.path(evicted_key), counts=evicted.counts, max_iter=evicted.max_iter,
+                         survivors=evicted.survivors, zr=evicted.zr, zi=evicted.zi)
+                self.on_disk.add(evicted_key)
+                self.spilled += 1
+
+    def _remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        # Svuota la cache, compresi i file scritti in spill_dir
+        for key in self.on_disk:
+            self._remove(key)
+        self.on_disk.clear()
+        self.entries.clear()
+        self.size = 0
+
+    def __str__(self):
+        return (f"TileCache(blocchi={len(self.entries)}, byte={self.size:,}/{self.budget:,}, "
+                f"hits={self.hits}, misses={self.misses}, evictions={self.evictions}, "
+                f"su disco={self.spilled}, ricaricati={self.loaded})")
+
+
+class TileRenderer:
+    """
+    Servizio di rendering a blocchi di righe: ogni blocco già calcolato con un max_iter
+    almeno pari a quello richiesto non costa nulla, uno calcolato con un max_iter più
+    basso riprende solo i punti non sfuggiti. L'approfondimento progressivo costa
+    quindi solo le iterazioni aggiuntive.
+    """
+
+    def __init__(self, cache=None, tile_rows=DEFAULT_TILE_ROWS, processes=0):
+        _require_numpy()
+        if tile_rows < 1:
+            raise InvalidArgumentError("Un blocco deve contenere almeno una riga")
+        self.cache = cache if cache is not None else TileCache()
+        self.tile_rows = tile_rows
+        self.processes = processes   # 0: i blocchi si calcolano nel processo corrente
+        self.work = 0                # Passi calcolati dall'ultima chiamata (punti per iterazione)
+        self.computed = 0            # Blocchi calcolati da zero dall'ultima chiamata
+        self.resumed = 0             # Blocchi ripresi da uno stato precedente dall'ultima chiamata
+
+    def iterations(self, nrows, max_iter, ncols=None, region=REGION):
+        """
+        Calcola la matrice delle iterazioni di un'immagine, usando e aggiornando la cache.
+
+        Args:
+            nrows (int): La risoluzione verticale.
+            max_iter (int): Il numero massimo di iterazioni.
+            ncols (int): La risoluzione orizzontale (default: 1.5 * nrows, come in main.c).
+            region (tuple): x minimo, x massimo, y minimo e y massimo.
+        Return:
+            ndarray: Le iterazioni (int32) con forma (nrows, ncols).
+        """
+        if max_iter <= 0 or nrows <= 0:
+            raise InvalidArgumentError("Valori non validi per iterazioni o risoluzione")
+        ncols = columns_for(nrows) if ncols is None else ncols
+        region = tuple(float(bound) for bound in region)
+        self.work = self.computed = self.resumed = 0
+
+        result = np.empty((nrows, ncols), dtype=np.int32)
+        jobs = []
+        for start, stop in tiles(nrows, self.tile_rows):
+            key = (region, nrows, ncols, start, stop)
+            state = self.cache.get(key)
+            if state is not None and state.max_iter >= max_iter:
+                result[start:stop] = state.counts_at(max_iter)
+                continue
+            if state is None:
+                self.computed += 1
+            else:
+                self.resumed += 1
+            jobs.append((key, state, max_iter))
+
+        if self.processes and len(jobs) > 1:
+            with multiprocessing.Pool(self.processes) as pool:
+                states = pool.map(_advance_job, jobs)
+        else:
+            states = map(_advance_job, jobs)
+        for (key, _, _), (state, work) in zip(jobs, states):
+            self.work += work
+            self.cache.put(key, state)
+            result[key[3]:key[4]] = state.counts
+        return result
+
+    def render(self, nrows, max_iter, ncols=None, region=REGION):
+        # Immagine in scala di grigi, come render di mandelbrot.py
+        return gray_table(max_iter)[self.iterations(nrows, max_iter, ncols, region)]
+
+    def __str__(self):
+        return (f"TileRenderer(calcolati={self.computed}, ripresi={self.resumed}, "
+                f"passi={self.work:,}; {self.cache})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Approfondimento progressivo dell'immagine di Mandelbrot con una cache di blocchi")
+    parser.add_argument("filename", help="Il file PGM da scrivere (con l'ultimo numero di iterazioni)")
+    parser.add_argument("max_iter", help="I numeri massimi di iterazioni, separati da virgole (ad esempio 100,1000,5000)")
+    parser.add_argument("nrows", type=int, help="La risoluzione verticale (quella orizzontale è 1.5 volte)")
+    parser.add_argument("-j", "--processes", type=int, default=0, help="Numero di processi (default: 0, nessun pool)")
+    parser.add_argument("--tile-rows", type=int, default=DEFAULT_TILE_ROWS, help="Righe per blocco")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="Byte di stato conservati in memoria")
+    parser.add_argument("--spill-dir", default=None, help="Cartella in cui scrivere gli stati rimossi dalla memoria")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Ogni livello riporta su stderr i passi calcolati e il tempo impiegato
+    args = parse_args(argv)
+    levels = [int(level) for level in args.max_iter.split(",") if level]
+    if not levels or min(levels) <= 0 or args.nrows <= 0:
+        print("Errore: Valori non validi per iterazioni o risoluzione.", file=sys.stderr)
+        return 1
+    renderer = TileRenderer(TileCache(args.budget, args.spill_dir), args.tile_rows, args.processes)
+    for max_iter in levels:
+        start = time.perf_counter()
+        image = renderer.render(args.nrows, max_iter)
+        print(f"max_iter={max_iter}: {time.perf_counter() - start:.3f} s, {renderer}", file=sys.stderr)
+    save_pgm(args.filename, image)
+    print(f"L' immagine '{args.filename}' è stata creata con successo.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+#Tommaso Mingrone [SM3201286]
+
+from array import array
+
+from expr import (
+    Valloc, register_array_type,
+    InvalidArgumentError, InvalidArithmeticOperationException, VariableNotFoundException,
+)
+
+try:
+    import numpy as np
+except ImportError:  # NumPy è opzionale: senza di esso è disponibile solo il backend "array"
+    np = None
+
+
+# Codici di tipo supportati: interi a 64 bit e float a 64 bit
+INT, FLOAT = "q", "d"
+NUMPY_DTYPES = {INT: "int64", FLOAT: "float64"}
+
+# Valori float rappresentabili esattamente da un float a 64 bit (per il passaggio da interi a float)
+MAX_EXACT_FLOAT_INT = 2 ** 53
+
+
+class TypedArray:
+    """
+    Array compatto usato da valloc al posto di una lista Python di interi.
+    I dati risiedono in un buffer tipizzato (array.array, ndarray di NumPy o
+    memoryview di un buffer dell'host), quindi occupano 8 byte per elemento.
+
+    Con infer=True il tipo viene dedotto dai valori scritti: l'array parte intero,
+    diventa float al primo valore float e una lista Python al primo valore non
+    numerico (o intero troppo grande), così da conservare i valori esatti.
+    """
+
+    __slots__ = ("data", "typecode", "infer")
+
+    def __init__(self, data, typecode, infer=False):
+        self.data = data
+        self.typecode = typecode  # INT, FLOAT oppure None quando i dati sono una lista
+        self.infer = infer
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        value = self.data[index]
+        return value.item() if hasattr(value, "item") else value
+
+    def __setitem__(self, index, value):
+        kind = type(value)
+        if self.typecode == INT and (kind is int or kind is bool):
+            try:
+                self.data[index] = value
+                return
+            except OverflowError:
+                pass
+        elif self.typecode == FLOAT and (kind is float or kind is int or kind is bool):
+            try:
+                self.data[index] = value
+                return
+            except OverflowError:
+                pass
+        elif self.typecode is None:
+            self.data[index] = value
+            return
+
+        if not self.infer:
+            raise InvalidArithmeticOperationException(
+                f"Il valore {value!r} non è compatibile con un array di tipo '{self.typecode}'")
+        if index >= len(self.data):
+            raise IndexError(index)
+        self.widen(value)
+        self[index] = value
+
+    # Passa a una rappresentazione in grado di contenere il valore (float a 64 bit o lista Python)
+    def widen(self, value):
+        values = self.tolist()
+        if (self.typecode == INT and type(value) is float
+                and all(-MAX_EXACT_FLOAT_INT <= v <= MAX_EXACT_FLOAT_INT for v in values)):
+            if np is not None and isinstance(self.data, np.ndarray):
+                self.data = self.data.astype(NUMPY_DTYPES[FLOAT])
+            else:
+                self.data = array(FLOAT, values)
+            self.typecode = FLOAT
+        else:
+            self.data = values
+            self.typecode = None
+
+    def tolist(self):
+        if isinstance(self.data, list):
+            return list(self.data)
+        return self.data.tolist()
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    # Stampa come una lista Python, in modo che print produca lo stesso output di valloc
+    def __str__(self):
+        return str(self.tolist())
+
+    def __repr__(self):
+        return f"TypedArray({self.typecode!r}, {self.tolist()!r})"
+
+
+register_array_type(TypedArray)
+
+
+def allocate(size, typecode=INT, backend="array", infer=False):
+    """
+    Crea un TypedArray di size elementi inizializzati a zero.
+
+    Args:
+        size (int): Il numero di elementi.
+        typecode (str): "q" (interi a 64 bit) o "d" (float a 64 bit).
+        backend (str): "array" (modulo array) oppure "numpy".
+        infer (bool): Se True il tipo può cambiare in base ai valori scritti.
+    Return:
+        TypedArray: L'array allocato.
+    """
+    if typecode not in NUMPY_DTYPES:
+        raise InvalidArgumentError(f"Tipo di array non supportato: '{typecode}'")
+    if backend == "numpy":
+        if np is None:
+            raise InvalidArgumentError("Il backend 'numpy' richiede NumPy")
+        data = np.zeros(size, dtype=NUMPY_DTYPES[typecode])
+    elif backend == "array":
+        data = array(typecode, bytes(8 * size))
+    else:
+        raise InvalidArgumentError(f"Backend di array sconosciuto: '{backend}'")
+    return TypedArray(data, typecode, infer)
+
+
+class TypedValloc(Valloc):
+    # Valloc che alloca un TypedArray; tipo e backend sono fissati dalla sottoclasse
+
+    typecode = INT
+    backend = "array"
+    infer = False
+
+    def allocate(self, size):
+        return allocate(size, self.typecode, self.backend, self.infer)
+
+
+# Sottoclassi di TypedValloc già create, una per combinazione di tipo e backend
+_valloc_classes = {}
+
+
+def typed_valloc_class(typecode=INT, backend="array", infer=False):
+    # Restituisce la classe di valloc con tipo e backend indicati, da inserire nel dizionario dispatch
+    key = (typecode, backend, infer)
+    if key not in _valloc_classes:
+        name = "TypedValloc_" + ("infer" if infer else typecode) + "_" + backend
+        _valloc_classes[key] = type(name, (TypedValloc,), {
+            "typecode": typecode, "backend": backend, "infer": infer,
+        })
+    return _valloc_classes[key]
+
+
+def typed_dispatch(dispatch, backend="array", default=None):
+    """
+    Estende un dizionario delle operazioni con le allocazioni tipizzate:
+    "ivalloc" (interi a 64 bit), "fvalloc" (float a 64 bit) e "tvalloc" (tipo dedotto).
+
+    Args:
+        dispatch (dict): Il dizionario di partenza (non viene modificato).
+        backend (str): "array" oppure "numpy".
+        default (str): Se "q", "d" o "infer", anche "valloc" usa l'allocazione tipizzata.
+    Return:
+        dict: Il nuovo dizionario delle operazioni.
+    """
+    result = dict(dispatch)
+    result["ivalloc"] = typed_valloc_class(INT, backend)
+    result["fvalloc"] = typed_valloc_class(FLOAT, backend)
+    result["tvalloc"] = typed_valloc_class(INT, backend, infer=True)
+    if default == "infer":
+        result["valloc"] = result["tvalloc"]
+    elif default is not None:
+        result["valloc"] = typed_valloc_class(default, backend)
+    return result
+
+
+def bind_array(env, name, buffer, typecode=None):
+    """
+    Rende disponibile al programma un array dell'host senza copiarlo.
+    Le scritture con setv modificano direttamente il buffer dell'host.
+
+    Args:
+        env (dict): L'ambiente di esecuzione.
+        name (str): Il nome della variabile array.
+        buffer: Un ndarray di NumPy, un array.array o un oggetto che supporta il buffer protocol.
+        typecode (str): "q" o "d"; obbligatorio solo per i buffer senza formato (ad esempio bytearray).
+    Return:
+        TypedArray: L'array registrato nell'ambiente.
+    """
+    if np is not None and isinstance(buffer, np.ndarray):
+        if buffer.ndim != 1 or not buffer.flags.c_contiguous:
+            raise InvalidArgumentError("Sono supportati solo array NumPy monodimensionali e contigui")
+        kinds = {np.dtype("int64"): INT, np.dtype("float64"): FLOAT}
+        if buffer.dtype not in kinds:
+            raise InvalidArgumentError(f"Tipo NumPy non supportato: {buffer.dtype}")
+        typed = TypedArray(buffer, kinds[buffer.dtype])
+    else:
+        view = memoryview(buffer)
+        fmt = typecode or view.format
+        if fmt not in NUMPY_DTYPES:
+            raise InvalidArgumentError(f"Formato del buffer non supportato: '{fmt}'")
+        if view.format != fmt:
+            view = view.cast("B").cast(fmt)
+        typed = TypedArray(view, fmt)
+    env[name] = typed
+    return typed
+
+
+def array_buffer(env, name):
+    """
+    Restituisce una memoryview sui dati di un array dell'ambiente, senza copiarli.
+    Con NumPy installato, numpy.asarray sul risultato produce un ndarray condiviso.
+
+    Args:
+        env (dict): L'ambiente di esecuzione.
+        name (str): Il nome della variabile array.
+    Return:
+        memoryview: La vista sul buffer tipizzato dell'array.
+    """
+    value = env.get(name)
+    if not isinstance(value, TypedArray) or value.typecode is None:
+        raise VariableNotFoundException(f"La variabile '{name}' non è un array tipizzato")
+    return memoryview(value.data)
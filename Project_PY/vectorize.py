@@ -0,0 +1,380 @@
+#Tommaso Mingrone [SM3201286]
+
+import math
+
+import expr as expr_module
+from expr import (
+    Expression, Variable, Constant, For, Setv,
+    Addition, Subtraction, Division, Multiplication, Power, Modulus,
+    Reciprocal, AbsoluteValue, Major, Minor, MajorEq, MinorEq, Equal, NotEqual,
+)
+from ast_tools import rebuild
+from typed_arrays import TypedArray, INT, NUMPY_DTYPES
+
+try:
+    import numpy as np
+except ImportError:  # Senza NumPy i cicli vengono sempre eseguiti dal tree walker
+    np = None
+
+# Potenza elemento per elemento con math.pow, identica a float ** float in Python
+_float_power = np.frompyfunc(math.pow, 2, 1) if np is not None else None
+
+
+# Gli interi calcolati in forma vettoriale restano sotto 2**53 in valore assoluto: così
+# non ci sono overflow a 64 bit e la conversione a float coincide con quella di Python
+MAX_EXACT_INT = 2 ** 53
+
+# Sotto questo numero di iterazioni il costo di NumPy supera il guadagno
+MIN_VECTOR_ITERATIONS = 32
+
+
+class Fallback(Exception):
+    # Il ciclo non può essere eseguito in forma vettoriale senza cambiare il risultato: si usa la valutazione normale
+    pass
+
+
+def _bound(a):
+    # Massimo valore assoluto di un array intero, come intero Python
+    return int(np.abs(a).max()) if a.size else 0
+
+
+def _number(a):
+    # I booleani partecipano all'aritmetica come interi (True + True == 2 in Python)
+    return a.astype(np.int64) if a.dtype == np.bool_ else a
+
+
+def _is_int(a):
+    return a.dtype.kind == "i"
+
+
+def _check_bound(limit):
+    if limit >= MAX_EXACT_INT:
+        raise Fallback()
+
+
+def _nonzero(x):
+    # Una divisione per zero deve sollevare l'eccezione nell'iterazione giusta: se ne occupa il tree walker
+    if not np.all(x != 0):
+        raise Fallback()
+
+
+def _add(x, y):
+    x, y = _number(x), _number(y)
+    if _is_int(x) and _is_int(y):
+        _check_bound(_bound(x) + _bound(y))
+    return y + x
+
+
+def _subtract(x, y):
+    x, y = _number(x), _number(y)
+    if _is_int(x) and _is_int(y):
+        _check_bound(_bound(x) + _bound(y))
+    return y - x
+
+
+def _multiply(x, y):
+    x, y = _number(x), _number(y)
+    if _is_int(x) and _is_int(y):
+        _check_bound(_bound(x) * _bound(y))
+    return y * x
+
+
+def _divide(x, y):
+    x, y = _number(x), _number(y)
+    _nonzero(x)
+    return np.true_divide(y, x)
+
+
+def _modulus(x, y):
+    x, y = _number(x), _number(y)
+    _nonzero(x)
+    if not (_is_int(x) and _is_int(y)) and not (np.all(np.isfinite(x)) and np.all(np.isfinite(y))):
+        raise Fallback()
+    return np.remainder(y, x)
+
+
+def _power(x, y):
+    x, y = _number(x), _number(y)
+    if _is_int(x) and _is_int(y) and np.all(x >= 0):
+        base, exponent = _bound(y), _bound(x)
+        if base > 1 and exponent * (base.bit_length() - 1) >= 53:
+            raise Fallback()
+        _check_bound(base ** exponent if base > 1 else base)
+        return np.power(y, x)
+    if _is_int(x) and _is_int(y) and np.any(x >= 0):
+        # Con esponenti interi di segno misto Python produce sia interi sia float
+        raise Fallback()
+    # Esponenti negativi o float: Python calcola la potenza in virgola mobile con pow della libreria C,
+    # che può differire di un ulp da np.power; gli errori (overflow, base negativa) tornano al tree walker
+    try:
+        result = _float_power(y.astype(np.float64), x.astype(np.float64))
+    except (ArithmeticError, ValueError):
+        raise Fallback() from None
+    return np.asarray(result, dtype=np.float64)
+
+
+def _reciprocal(y):
+    y = _number(y)
+    _nonzero(y)
+    return np.true_divide(1, y)
+
+
+def _absolute(y):
+    return np.abs(_number(y))
+
+
+# Operazioni pure con la funzione vettoriale equivalente (stesso ordine di argomenti dei metodi op)
+VECTOR_OPERATIONS = {
+    Addition: _add,
+    Subtraction: _subtract,
+    Multiplication: _multiply,
+    Division: _divide,
+    Modulus: _modulus,
+    Power: _power,
+    Reciprocal: _reciprocal,
+    AbsoluteValue: _absolute,
+    Major: lambda x, y: np.greater(y, x),
+    Minor: lambda x, y: np.less(y, x),
+    MajorEq: lambda x, y: np.greater_equal(y, x),
+    MinorEq: lambda x, y: np.less_equal(y, x),
+    Equal: lambda x, y: np.equal(y, x),
+    NotEqual: lambda x, y: np.not_equal(y, x),
+}
+
+
+def pure_names(arg, names):
+    """
+    Verifica che un operando sia aritmetica pura (costanti, variabili e operazioni
+    di VECTOR_OPERATIONS) e raccoglie i nomi delle variabili lette.
+
+    Args:
+        arg: L'operando (espressione, nome di variabile o costante).
+        names (set): L'insieme in cui aggiungere i nomi letti.
+    Return:
+        bool: True se l'operando può essere calcolato in forma vettoriale.
+    """
+    if type(arg) is Constant:
+        return True
+    if type(arg) is Variable:
+        names.add(arg.name)
+        return True
+    if type(arg) in VECTOR_OPERATIONS:
+        return all(pure_names(child, names) for child in arg.args)
+    if isinstance(arg, Expression):
+        return False
+    if isinstance(arg, str):
+        names.add(arg)
+        return True
+    return type(arg) in (int, float)
+
+
+class LoopNest:
+    # Cicli For perfettamente annidati il cui corpo più interno è un solo setv
+
+    def __init__(self, loops, target):
+        self.loops = loops                                   # Dal più esterno al più interno
+        self.variables = [str(loop.i_var) for loop in loops]
+        self.target = target                                 # Il nodo Setv
+        self.array_name = str(target.var_name)
+
+
+def analyse(node):
+    """
+    Riconosce un ciclo For che può essere eseguito come un'unica espressione NumPy:
+    il corpo (eventualmente attraverso altri For annidati) è un setv di aritmetica pura
+    sulle variabili di ciclo e su valori invarianti, e non legge l'array che scrive,
+    quindi nessuna iterazione dipende dalle precedenti.
+
+    Args:
+        node (For): Il ciclo da analizzare.
+    Return:
+        LoopNest: La descrizione del ciclo, oppure None se il ciclo non è vettorizzabile.
+    """
+    loops = [node]
+    body = node.expr
+    while type(body) is For:
+        loops.append(body)
+        body = body.expr
+    if type(body) is not Setv or not isinstance(body.expr, Expression):
+        return None
+
+    nest = LoopNest(loops, body)
+    variables = set(nest.variables)
+    if len(variables) != len(loops) or nest.array_name in variables:
+        return None
+
+    # Gli estremi dei cicli devono essere invarianti: non possono dipendere dalle variabili di ciclo.
+    # Un nome di variabile come estremo non viene valutato dal For (range fallisce), quindi è escluso
+    for loop in loops:
+        for bound in (loop.start, loop.end):
+            names = set()
+            if isinstance(bound, str) or not pure_names(bound, names) or names & variables:
+                return None
+
+    names = set()
+    if not pure_names(body.expr, names) or not pure_names(body.index, names):
+        return None
+    if nest.array_name in names:
+        return None
+    return nest
+
+
+class VectorEvaluator:
+    # Calcola le espressioni pure su array NumPy: le variabili di ciclo sono intervalli, le altre scalari
+
+    def __init__(self, env, loop_values):
+        self.env = env
+        self.loop_values = loop_values   # Nome della variabile di ciclo -> array di valori
+
+    def variable(self, name):
+        if name in self.loop_values:
+            return self.loop_values[name]
+        if name not in self.env:
+            raise Fallback()
+        return self.constant(self.env[name])
+
+    @staticmethod
+    def constant(value):
+        kind = type(value)
+        if kind is bool:
+            return np.array(value)
+        if kind is int:
+            if abs(value) >= MAX_EXACT_INT:
+                raise Fallback()
+            return np.array(value, dtype=np.int64)
+        if kind is float:
+            return np.array(value, dtype=np.float64)
+        raise Fallback()
+
+    def evaluate(self, arg):
+        if type(arg) is Constant:
+            return self.constant(arg.value)
+        if type(arg) is Variable:
+            return self.variable(arg.name)
+        if isinstance(arg, str):
+            return self.variable(arg)
+        if isinstance(arg, Expression):
+            values = [self.evaluate(child) for child in arg.args]
+            return VECTOR_OPERATIONS[type(arg)](*values)
+        return self.constant(arg)
+
+
+def _range_bound(evaluator, arg):
+    # Estremo di un ciclo: deve essere un intero, come richiesto da range
+    value = evaluator.evaluate(arg)
+    if value.ndim != 0 or value.dtype.kind not in "bi":
+        raise Fallback()
+    return int(value)
+
+
+def _store(array, index, values):
+    # Scrive i valori calcolati nell'array, scegliendo la via più veloce per il tipo di array
+    if isinstance(array, list):
+        if len(index) and index[-1] - index[0] == len(index) - 1 and np.all(np.diff(index) == 1):
+            array[int(index[0]):int(index[-1]) + 1] = values.tolist()
+            return
+    elif (isinstance(array, TypedArray) and array.typecode is not None
+            and (array.typecode != INT or values.dtype.kind in "biu")):
+        data = array.data
+        if not isinstance(data, np.ndarray):
+            data = np.frombuffer(data, dtype=NUMPY_DTYPES[array.typecode])
+        data[index] = values
+        return
+
+    # Caso generale: scrittura elemento per elemento con le regole dell'array stesso
+    try:
+        for i, value in zip(index.tolist(), values.tolist()):
+            array[i] = value
+    except Exception:
+        # Le stesse scritture verranno ripetute (nello stesso ordine) dal tree walker, che solleverà l'errore
+        raise Fallback() from None
+
+
+class VectorFor(For):
+    # For eseguito come un'unica espressione NumPy quando possibile, altrimenti con la valutazione normale
+
+    def __init__(self, args, nest):
+        super().__init__(args)
+        self.nest = nest
+
+    def evaluate(self, env):
+        if np is not None:
+            try:
+                with np.errstate(all="ignore"):
+                    self.evaluate_vector(env)
+                return None
+            except Fallback:
+                pass
+        return super().evaluate(env)
+
+    def evaluate_vector(self, env):
+        nest = self.nest
+        scalars = VectorEvaluator(env, {})
+
+        # Ogni variabile di ciclo diventa un intervallo lungo un asse diverso: il broadcasting
+        # produce tutte le combinazioni nell'ordine delle iterazioni annidate
+        ranges = [(_range_bound(scalars, loop.start), _range_bound(scalars, loop.end)) for loop in nest.loops]
+        shape = tuple(end - start for start, end in ranges)
+        if min(shape) <= 0 or np.prod(shape, dtype=object) < MIN_VECTOR_ITERATIONS:
+            raise Fallback()
+        loop_values = {}
+        for axis, (name, (start, end)) in enumerate(zip(nest.variables, ranges)):
+            if max(abs(start), abs(end)) >= MAX_EXACT_INT:
+                raise Fallback()
+            axis_shape = [1] * len(shape)
+            axis_shape[axis] = -1
+            loop_values[name] = np.arange(start, end, dtype=np.int64).reshape(axis_shape)
+
+        evaluator = VectorEvaluator(env, loop_values)
+        values = np.broadcast_to(evaluator.evaluate(nest.target.expr), shape).ravel()
+        index = _number(np.broadcast_to(evaluator.evaluate(nest.target.index), shape).ravel())
+
+        # Indici non interi, negativi o fuori dai limiti: l'errore lo solleva il tree walker
+        if index.dtype.kind != "i" or index.min() < 0:
+            raise Fallback()
+        array = env[nest.array_name] if nest.array_name in env else None
+        if not isinstance(array, expr_module.array_types) or index.max() >= len(array):
+            raise Fallback()
+        # Con indici ripetuti l'ultima scrittura deve vincere: si lascia il ciclo al tree walker
+        if not np.all(np.diff(index) > 0) and len(np.unique(index)) != len(index):
+            raise Fallback()
+
+        _store(array, index, values)
+
+        # Le variabili di ciclo restano all'ultimo valore assunto, come dopo il ciclo normale
+        for name, (start, end) in zip(nest.variables, ranges):
+            env[name] = end - 1
+
+    def __str__(self):
+        return f"vfor({self.expr}, from {self.start} to {self.end}, var {self.i_var})"
+
+
+class Vectorizer:
+    # Sostituisce i For vettorizzabili con VectorFor, dall'esterno verso l'interno
+
+    def __init__(self):
+        self.count = 0
+
+    def visit(self, node):
+        if type(node) is For:
+            nest = analyse(node)
+            if nest is not None:
+                self.count += 1
+                return VectorFor([node.expr, node.end, node.start, node.i_var], nest)
+        return rebuild(node, self.visit)
+
+
+def vectorize(expr):
+    """
+    Sostituisce i cicli For che riempiono un array con aritmetica pura sulla variabile
+    di ciclo con VectorFor, che li esegue come un'unica espressione NumPy su
+    range(start, end). I controlli a tempo di esecuzione (overflow, divisioni per zero,
+    indici non validi) riportano il ciclo alla valutazione normale.
+
+    Args:
+        expr (Expression): La radice dell'albero (non viene modificata).
+    Return:
+        tuple: Il nuovo albero e il numero di cicli vettorizzati.
+    """
+    vectorizer = Vectorizer()
+    return vectorizer.visit(expr), vectorizer.count
@@ -0,0 +1,528 @@
+#Tommaso Mingrone [SM3201286]
+
+import expr as expr_module
+from expr import (
+    Expression, Variable, Constant, Operation, Alloc, Valloc, Setq, Setv,
+    Prog2, Prog3, Prog4, ProgN, If, While, For, DefSub, Call, Print, Nop,
+    CachedValue, StoreValue, ResetCells, REUSABLE, MissingVariableException, InvalidArithmeticOperationException,
+    ArrayIndexOutOfBoundsException, VariableNotFoundException,
+    FunctionNotFoundException, InvalidExpressionException,
+)
+from compiler import BINARY_FUNCTIONS, UNARY_FUNCTIONS
+
+
+# Codici operativi della macchina virtuale
+LOAD = 0          # arg: slot          -> push(slots[slot])
+CONST = 1         # arg: valore        -> push(valore)
+BINARY = 2        # arg: funzione      -> y = pop(); x = pop(); push(f(y, x))
+STORE = 3         # arg: slot          -> slots[slot] = top (senza pop)
+POP = 4           # arg: None          -> pop()
+JUMP_IF_FALSE = 5 # arg: indirizzo     -> se pop() è falso salta
+JUMP = 6          # arg: indirizzo     -> salta
+FOR_ITER = 7      # arg: (slot, fine)  -> slots[slot] = next(top) oppure pop() e salta a fine
+UNARY = 8         # arg: funzione      -> push(f(pop()))
+CALL = 9          # arg: slot          -> salta al corpo della subroutine in slots[slot]
+RETURN = 10       # arg: None          -> torna all'indirizzo salvato da CALL
+PRINT = 11        # arg: None          -> print(top) (senza pop)
+SETV = 12         # arg: slot          -> index = pop(); value = top; slots[slot][index] = value
+FOR_PREP = 13     # arg: None          -> end = pop(); start = pop(); push(iter(range(start, end)))
+ALLOC = 14        # arg: slot          -> slots[slot] = 0; push(None)
+VALLOC = 15       # arg: (slot, f)     -> size = pop(); slots[slot] = f(size); push(None)
+DEFSUB = 16       # arg: (slot, corpo) -> slots[slot] = corpo; push(None)
+OPCALL = 17       # arg: (op, n)       -> chiama op sugli ultimi n valori dello stack
+EVAL = 18         # arg: oggetto       -> push(oggetto.evaluate(None)), come il tree walker sui non-Expression
+HALT = 19         # arg: None          -> termina e restituisce top
+LOAD_BINARY = 20  # arg: (slot, f)     -> come LOAD seguito da BINARY
+CONST_BINARY = 21 # arg: (valore, f)   -> come CONST seguito da BINARY
+CACHED = 22       # arg: (cella, fine) -> se la cella appartiene a env: push(valore) e salta a fine
+CACHE_STORE = 23  # arg: (cella, store) -> conserva top nella cella (senza pop)
+RESET_CELLS = 24  # arg: celle        -> invalida le celle; push(None)
+
+OPNAMES = [
+    "LOAD", "CONST", "BINARY", "STORE", "POP", "JUMP_IF_FALSE", "JUMP", "FOR_ITER",
+    "UNARY", "CALL", "RETURN", "PRINT", "SETV", "FOR_PREP", "ALLOC", "VALLOC",
+    "DEFSUB", "OPCALL", "EVAL", "HALT", "LOAD_BINARY", "CONST_BINARY",
+    "CACHED", "CACHE_STORE", "RESET_CELLS",
+]
+
+# Sentinella per gli slot non ancora assegnati
+UNBOUND = object()
+
+
+class Program:
+    # Programma compilato: array piatto di istruzioni (opcode, argomento) e tabella degli slot
+
+    def __init__(self):
+        self.code = []      # Istruzioni (opcode, argomento)
+        self.names = []     # Slot -> nome della variabile nell'ambiente
+        self.slots = {}     # Nome della variabile -> slot
+        self.entries = {}   # Corpo di una subroutine (nodo) -> indirizzo di ingresso
+
+    # Restituisce lo slot associato a un nome, creandolo se necessario
+    def slot(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+        return self.slots[name]
+
+    # Aggiunge un'istruzione e ne restituisce l'indirizzo
+    def emit(self, op, arg=None):
+        self.code.append((op, arg))
+        return len(self.code) - 1
+
+    # Aggiorna l'argomento di un'istruzione di salto già emessa
+    def patch(self, address, arg):
+        self.code[address] = (self.code[address][0], arg)
+
+    # Genera il codice di una subroutine in coda al programma e ne restituisce l'indirizzo
+    def add_subroutine(self, body):
+        if body not in self.entries:
+            CodeGenerator(self).subroutine(body)
+        return self.entries[body]
+
+    # Rappresentazione leggibile del programma
+    def __str__(self):
+        return disassemble(self)
+
+
+class CodeGenerator:
+    # Abbassa un albero Expression in istruzioni della macchina virtuale
+
+    def __init__(self, program):
+        self.program = program
+        self.pending = []  # Corpi di subroutine ancora da generare
+
+    def main(self, expr):
+        # Codice principale seguito da HALT, poi i corpi delle subroutine definite con defsub
+        self.gen(expr)
+        self.program.emit(HALT)
+        self.flush()
+
+    def subroutine(self, body):
+        self.pending.append(body)
+        self.flush()
+
+    def flush(self):
+        program = self.program
+        while self.pending:
+            body = self.pending.pop()
+            if body in program.entries:
+                continue
+            program.entries[body] = len(program.code)
+            self.gen(body)
+            program.emit(RETURN)
+
+    def gen(self, node):
+        for klass in type(node).__mro__:
+            generator = GENERATORS.get(klass)
+            if generator is not None:
+                generator(self, node)
+                return
+        raise InvalidExpressionException(f"Nodo non supportato dalla macchina virtuale: {node}")
+
+    # Operando flessibile: espressione, nome di variabile o costante
+    def operand(self, arg):
+        if type(arg) is Constant:
+            arg = arg.value
+        elif type(arg) is Variable:
+            arg = arg.name
+        if isinstance(arg, Expression):
+            self.gen(arg)
+        elif isinstance(arg, str):
+            self.program.emit(LOAD, self.program.slot(arg))
+        else:
+            self.program.emit(CONST, arg)
+
+    # Operando valutato con evaluate senza controlli, come nel tree walker
+    def strict(self, arg):
+        if isinstance(arg, Expression):
+            self.gen(arg)
+        else:
+            self.program.emit(EVAL, arg)
+
+    # Operando valutato se è un'espressione, altrimenti usato come valore
+    def value(self, arg):
+        if isinstance(arg, Expression):
+            self.gen(arg)
+        else:
+            self.program.emit(CONST, arg)
+
+
+def gen_variable(gen, node):
+    gen.program.emit(LOAD, gen.program.slot(node.name))
+
+
+def gen_constant(gen, node):
+    gen.program.emit(CONST, node.value)
+
+
+def gen_operation(gen, node):
+    fn = BINARY_FUNCTIONS.get(type(node))
+    if fn is not None:
+        # Superistruzioni per il caso frequente in cui il secondo operando è una foglia
+        x, y = node.args
+        if type(y) is Constant:
+            y = y.value
+        elif type(y) is Variable:
+            y = y.name
+        gen.operand(x)
+        if isinstance(y, str):
+            gen.program.emit(LOAD_BINARY, (gen.program.slot(y), fn))
+        elif not isinstance(y, Expression):
+            gen.program.emit(CONST_BINARY, (y, fn))
+        else:
+            gen.gen(y)
+            gen.program.emit(BINARY, fn)
+        return
+    for arg in node.args:
+        gen.operand(arg)
+    fn = UNARY_FUNCTIONS.get(type(node))
+    if fn is not None:
+        gen.program.emit(UNARY, fn)
+        return
+    gen.program.emit(OPCALL, (node.op, len(node.args)))
+
+
+def gen_alloc(gen, node):
+    gen.program.emit(ALLOC, gen.program.slot(node.var_name))
+
+
+def gen_valloc(gen, node):
+    gen.strict(node.size_expr)
+    gen.program.emit(VALLOC, (gen.program.slot(str(node.var_name)), node.allocate))
+
+
+def gen_setq(gen, node):
+    gen.value(node.expr)
+    gen.program.emit(STORE, gen.program.slot(node.var_name))
+
+
+def gen_setv(gen, node):
+    gen.strict(node.expr)
+    gen.operand(node.index)
+    gen.program.emit(SETV, gen.program.slot(str(node.var_name)))
+
+
+def gen_sequence(gen, exprs):
+    # Valuta le espressioni da destra a sinistra e lascia sullo stack il valore della prima
+    for expr in reversed(exprs[1:]):
+        gen.strict(expr)
+        gen.program.emit(POP)
+    gen.strict(exprs[0])
+
+
+def gen_prog2(gen, node):
+    gen_sequence(gen, [node.expr1, node.expr2])
+
+
+def gen_prog3(gen, node):
+    gen_sequence(gen, [node.expr1, node.expr2, node.expr3])
+
+
+def gen_prog4(gen, node):
+    gen_sequence(gen, [node.expr1, node.expr2, node.expr3, node.expr4])
+
+
+def gen_progn(gen, node):
+    gen_sequence(gen, node.exprs)
+
+
+def gen_if(gen, node):
+    program = gen.program
+    gen.operand(node.cond)
+    jump_no = program.emit(JUMP_IF_FALSE)
+    gen.value(node.if_yes)
+    jump_end = program.emit(JUMP)
+    program.patch(jump_no, len(program.code))
+    gen.value(node.if_no)
+    program.patch(jump_end, len(program.code))
+
+
+def gen_while(gen, node):
+    program = gen.program
+    start = len(program.code)
+    gen.strict(node.cond)
+    jump_end = program.emit(JUMP_IF_FALSE)
+    gen.strict(node.expr)
+    program.emit(POP)
+    program.emit(JUMP, start)
+    program.patch(jump_end, len(program.code))
+    program.emit(CONST, None)
+
+
+def gen_for(gen, node):
+    program = gen.program
+    gen.value(node.start)
+    gen.value(node.end)
+    program.emit(FOR_PREP)
+    slot = program.slot(str(node.i_var))
+    loop = program.emit(FOR_ITER)
+    gen.strict(node.expr)
+    program.emit(POP)
+    program.emit(JUMP, loop)
+    program.patch(loop, (slot, len(program.code)))
+    program.emit(CONST, None)
+
+
+def gen_defsub(gen, node):
+    body = node.expr
+    if isinstance(body, Expression):
+        gen.pending.append(body)
+    gen.program.emit(DEFSUB, (gen.program.slot(str(node.function_name)), body))
+
+
+def gen_call(gen, node):
+    gen.program.emit(CALL, gen.program.slot(str(node.function_name)))
+
+
+def gen_print(gen, node):
+    gen.operand(node.expr)
+    gen.program.emit(PRINT)
+
+
+def gen_nop(gen, node):
+    gen.program.emit(CONST, None)
+
+
+def gen_cached(gen, node):
+    # Valore riusato di licm: il sottoalbero si salta se la cella è valida per l'ambiente corrente
+    program = gen.program
+    if isinstance(node, StoreValue):
+        gen.strict(node.expr)
+        program.emit(CACHE_STORE, (node.cell, True))
+        return
+    check = program.emit(CACHED)
+    gen.strict(node.expr)
+    program.emit(CACHE_STORE, (node.cell, False))
+    program.patch(check, (node.cell, len(program.code)))
+
+
+def gen_reset(gen, node):
+    gen.program.emit(RESET_CELLS, node.cells)
+
+
+# Dizionario dei generatori di codice per ciascuna classe di nodo
+GENERATORS = {
+    Variable: gen_variable,
+    Constant: gen_constant,
+    Operation: gen_operation,
+    Alloc: gen_alloc,
+    Valloc: gen_valloc,
+    Setq: gen_setq,
+    Setv: gen_setv,
+    Prog2: gen_prog2,
+    Prog3: gen_prog3,
+    Prog4: gen_prog4,
+    ProgN: gen_progn,
+    If: gen_if,
+    While: gen_while,
+    For: gen_for,
+    DefSub: gen_defsub,
+    Call: gen_call,
+    Print: gen_print,
+    Nop: gen_nop,
+    CachedValue: gen_cached,
+    ResetCells: gen_reset,
+}
+
+
+def generate(expr):
+    """
+    Abbassa un albero costruito da Expression.from_program in un array piatto di istruzioni.
+    While, For, If e Prog2-Prog4 diventano salti e fall-through; i corpi delle
+    subroutine vengono generati in coda al codice principale.
+
+    Args:
+        expr (Expression): La radice dell'albero.
+    Return:
+        Program: Il programma pronto per essere eseguito con execute.
+    """
+    program = Program()
+    CodeGenerator(program).main(expr)
+    return program
+
+
+def execute(program, env):
+    """
+    Esegue un programma della macchina virtuale con un unico ciclo di dispatch.
+    Le variabili vivono in un array di slot caricato da env e riscritto in env
+    alla fine dell'esecuzione (anche in caso di eccezione), come fa il tree walker.
+
+    Args:
+        program (Program): Il programma generato da generate.
+        env (dict): L'ambiente di esecuzione.
+    Return:
+        Il valore dell'espressione radice.
+    """
+    code = program.code
+    names = program.names
+    slots = [env[name] if name in env else UNBOUND for name in names]
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    frames = []
+    pc = 0
+
+    try:
+        while True:
+            op, arg = code[pc]
+            pc += 1
+
+            if op == LOAD:
+                value = slots[arg]
+                if value is UNBOUND:
+                    raise MissingVariableException(f"Valore mancante per la variabile '{names[arg]}'")
+                push(value)
+            elif op == CONST:
+                push(arg)
+            elif op == BINARY:
+                y = pop()
+                stack[-1] = arg(y, stack[-1])
+            elif op == LOAD_BINARY:
+                y = slots[arg[0]]
+                if y is UNBOUND:
+                    raise MissingVariableException(f"Valore mancante per la variabile '{names[arg[0]]}'")
+                stack[-1] = arg[1](y, stack[-1])
+            elif op == CONST_BINARY:
+                stack[-1] = arg[1](arg[0], stack[-1])
+            elif op == STORE:
+                slots[arg] = stack[-1]
+            elif op == POP:
+                pop()
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == FOR_ITER:
+                for i in stack[-1]:
+                    slots[arg[0]] = i
+                    break
+                else:
+                    pop()
+                    pc = arg[1]
+            elif op == UNARY:
+                stack[-1] = arg(stack[-1])
+            elif op == CALL:
+                body = slots[arg]
+                if body is UNBOUND:
+                    raise FunctionNotFoundException(f"La subroutine '{names[arg]}' non è definita")
+                try:
+                    entry = program.entries[body]
+                except (KeyError, TypeError):
+                    if not isinstance(body, Expression):
+                        body.evaluate(env)
+                    # Subroutine arrivata dall'ambiente: la genera ora e allarga gli slot
+                    entry = program.add_subroutine(body)
+                    slots.extend(env[name] if name in env else UNBOUND for name in names[len(slots):])
+                frames.append(pc)
+                pc = entry
+            elif op == RETURN:
+                pc = frames.pop()
+            elif op == PRINT:
+                expr_module.emit(stack[-1])
+            elif op == SETV:
+                index = pop()
+                if not isinstance(index, int) or index < 0:
+                    raise InvalidArithmeticOperationException("L'indice deve essere un intero non negativo")
+                array = slots[arg]
+                if not isinstance(array, expr_module.array_types):
+                    raise VariableNotFoundException("La variabile specificata non esiste o non è un array")
+                try:
+                    array[index] = stack[-1]
+                except IndexError:
+                    raise ArrayIndexOutOfBoundsException("Indice fuori dai limiti dell'array") from None
+            elif op == FOR_PREP:
+                end = pop()
+                stack[-1] = iter(range(stack[-1], end))
+            elif op == ALLOC:
+                slots[arg] = 0
+                push(None)
+            elif op == VALLOC:
+                size = stack[-1]
+                if not isinstance(size, int) or size < 0:
+                    raise InvalidArithmeticOperationException("La dimensione dell'array deve essere un intero non negativo")
+                slots[arg[0]] = arg[1](size)
+                stack[-1] = None
+            elif op == DEFSUB:
+                slots[arg[0]] = arg[1]
+                push(None)
+            elif op == OPCALL:
+                fn, n = arg
+                args = stack[-n:]
+                del stack[-n:]
+                push(fn(*args))
+            elif op == EVAL:
+                push(arg.evaluate(None))
+            elif op == HALT:
+                return pop()
+            elif op == CACHED:
+                if arg[0].env is env:
+                    push(arg[0].value)
+                    pc = arg[1]
+            elif op == CACHE_STORE:
+                cell = arg[0]
+                if type(stack[-1]) in REUSABLE:
+                    cell.value = stack[-1]
+                    cell.env = env
+                elif arg[1]:
+                    cell.env = None
+            elif op == RESET_CELLS:
+                for cell in arg:
+                    cell.env = None
+                push(None)
+    finally:
+        for slot, value in enumerate(slots):
+            if value is not UNBOUND:
+                env[names[slot]] = value
+
+
+def run_vm(expr, env):
+    # Genera il codice per l'albero e lo esegue nella macchina virtuale
+    return execute(generate(expr), env)
+
+
+def disassemble(program):
+    """
+    Produce una rappresentazione testuale dell'array di istruzioni.
+
+    Args:
+        program (Program): Il programma da disassemblare.
+    Return:
+        str: Una riga per istruzione con indirizzo, nome dell'opcode e argomento.
+    """
+    labels = {address: f"<sub {body}>" for body, address in program.entries.items()}
+    lines = []
+    for address, (op, arg) in enumerate(program.code):
+        if address in labels:
+            lines.append(labels[address])
+        if op in (LOAD, STORE, ALLOC, SETV, CALL):
+            text = f"{arg} ({program.names[arg]})"
+        elif op == FOR_ITER:
+            text = f"{arg[0]} ({program.names[arg[0]]}), -> {arg[1]}"
+        elif op == LOAD_BINARY:
+            text = f"{arg[0]} ({program.names[arg[0]]}), {arg[1].__name__}"
+        elif op == CONST_BINARY:
+            text = f"{arg[0]!r}, {arg[1].__name__}"
+        elif op in (JUMP, JUMP_IF_FALSE):
+            text = f"-> {arg}"
+        elif op == VALLOC:
+            text = f"{arg[0]} ({program.names[arg[0]]})"
+        elif op == DEFSUB:
+            text = f"{arg[0]} ({program.names[arg[0]]}), {arg[1]}"
+        elif op in (BINARY, UNARY):
+            text = getattr(arg, "__name__", str(arg))
+        elif op == OPCALL:
+            text = f"{getattr(arg[0], '__qualname__', arg[0])}/{arg[1]}"
+        elif op == CACHED:
+            text = f"-> {arg[1]}"
+        elif op == CACHE_STORE:
+            text = "store" if arg[1] else ""
+        elif op == RESET_CELLS:
+            text = f"{len(arg)} celle"
+        elif op not in (CONST, EVAL) and arg is None:
+            text = ""
+        else:
+            text = repr(arg)
+        lines.append(f"{address:6d}  {OPNAMES[op]:<14}{text}".rstrip())
+    return "\n".join(lines)